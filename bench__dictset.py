@@ -0,0 +1,721 @@
+# Copyright (c) 2011, Roger Lew [see LICENSE.txt]
+# This software is funded in part by NIH Grant P20 RR016454.
+
+"""
+This script benchmarks the dictset module.
+
+Every DictSet operation is timed over a grid of key counts, set
+sizes, overlap ratios and element types. Each operation is also
+timed against a plain dict of sets baseline so regressions can be
+told apart from the cost of Python itself.
+
+    python bench__dictset.py                   # quick grid, table
+    python bench__dictset.py --full            # full grid
+    python bench__dictset.py --json out.json   # machine readable
+    python bench__dictset.py --compare old.json --json new.json
+    python bench__dictset.py --complexity      # scaling exponents
+    python bench__dictset.py --memory          # million-key memory
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+import random
+import platform
+
+from itertools import islice, product
+
+from dictset import DictSet, CompactDictSet, InterningDictSet
+
+if sys.version_info[0] == 2:
+    _xrange = xrange
+elif sys.version_info[0] == 3:
+    _xrange = range
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+# parameter grids
+QUICK_GRID = dict(n_keys=[100, 1000],
+                  set_size=[1, 10],
+                  overlap=[0.0, 0.5, 1.0],
+                  element_type=['int', 'str'])
+
+FULL_GRID = dict(n_keys=[100, 1000, 10000],
+                 set_size=[1, 10, 100],
+                 overlap=[0.0, 0.5, 1.0],
+                 element_type=['int', 'str', 'tuple'])
+
+# the maximum number of combinations consumed from unique_combinations
+_MAX_COMBINATIONS = 10000
+
+
+def _element(i, element_type):
+    """returns the i-th element of the requested type"""
+    if element_type == 'int':
+        return i
+    elif element_type == 'str':
+        return 'e%d' % i
+    elif element_type == 'tuple':
+        return (i, 'e%d' % i)
+    raise ValueError("unknown element type '%s'" % element_type)
+
+
+def make_operands(n_keys, set_size, overlap, element_type, seed=0):
+    """
+    Returns a pair of dicts of sets (A, B).
+
+    The first round(n_keys*overlap) keys of B are shared with A and
+    for those keys round(set_size*overlap) elements of every set are
+    shared with the matching set of A. The rest of B is disjoint from A.
+    """
+    rng = random.Random(seed)
+    n_shared_keys = int(round(n_keys * overlap))
+    n_shared_elements = int(round(set_size * overlap))
+
+    A, B = {}, {}
+    universe = 10 * set_size
+    for i in _xrange(n_keys):
+        elements = rng.sample(_xrange(universe), set_size)
+        A['k%d' % i] = set(_element(e, element_type) for e in elements)
+
+        if i < n_shared_keys:
+            key = 'k%d' % i
+            extra = [e + universe for e in
+                     rng.sample(_xrange(universe),
+                                set_size - n_shared_elements)]
+            elements = elements[:n_shared_elements] + extra
+        else:
+            key = 'k%d' % (i + n_keys)
+        B[key] = set(_element(e, element_type) for e in elements)
+
+    return A, B
+
+
+def _copy_dos(d):
+    """copies a dict of sets"""
+    return dict((k, set(v)) for (k, v) in d.items())
+
+
+# plain dict of sets implementations of the DictSet operations
+_empty = frozenset()
+
+def _baseline_binary(method):
+    """builds a baseline that applies a set method key by key"""
+    def op(a, b):
+        result = {}
+        for k in set(a) | set(b):
+            s = getattr(set(a.get(k, _empty)), method)(b.get(k, _empty))
+            if s:
+                result[k] = s
+        return result
+    return op
+
+def _baseline_inplace(method):
+    """builds a baseline that applies a set update method key by key"""
+    def op(a, b):
+        for k in set(a) | set(b):
+            s = a.setdefault(k, set())
+            getattr(s, method)(b.get(k, _empty))
+            if not s:
+                del a[k]
+        return a
+    return op
+
+def _baseline_update(a, b):
+    for k, v in b.items():
+        a.setdefault(k, set()).update(v)
+
+def _baseline_eq(a, b):
+    return (dict((k, v) for (k, v) in a.items() if v) ==
+            dict((k, v) for (k, v) in b.items() if v))
+
+def _baseline_issubset(a, b):
+    for k, v in a.items():
+        if v and not v <= b.get(k, _empty):
+            return False
+    return True
+
+def _baseline_issuperset(a, b):
+    return _baseline_issubset(b, a)
+
+def _baseline_isdisjoint(a, b):
+    for k, v in a.items():
+        if not v.isdisjoint(b.get(k, _empty)):
+            return False
+    return True
+
+def _baseline_invert(a, b):
+    result = {}
+    for (k, v) in a.items():
+        for e in v:
+            result.setdefault(e, set()).add(k)
+    return result
+
+def _baseline_compose(a, b):
+    result = {}
+    for (k, v) in a.items():
+        s = set()
+        for e in v:
+            s |= b.get(e, _empty)
+        if s:
+            result[k] = s
+    return result
+
+def _baseline_transitive_closure(a, b):
+    # a breadth first search from every node
+    nodes = set(a)
+    for v in a.values():
+        nodes.update(v)
+    result = {}
+    for k in nodes:
+        seen = set()
+        frontier = a.get(k, _empty)
+        while frontier:
+            seen |= frontier
+            nxt = set()
+            for x in frontier:
+                nxt |= a.get(x, _empty)
+            frontier = nxt - seen
+        if seen:
+            result[k] = seen
+    return result
+
+def _baseline_contains(a, keys):
+    for k in keys:
+        len(a.get(k, _empty)) > 0
+
+def _baseline_get(a, keys):
+    for k in keys:
+        a.get(k)
+
+def _baseline_get_many(a, keys):
+    return [a.get(k) for k in keys]
+
+def _baseline_has_keys(a, keys):
+    return [len(a.get(k, _empty)) > 0 for k in keys]
+
+def _baseline_fromkeys(a, keys):
+    return dict((k, set()) for k in keys)
+
+def _baseline_unique_combinations(a, keys):
+    return list(islice(product(*[sorted(a[k]) for k in keys]),
+                       _MAX_COMBINATIONS))
+
+
+# DictSet implementations
+def _ds_contains(a, keys):
+    for k in keys:
+        k in a
+
+def _ds_get(a, keys):
+    for k in keys:
+        a.get(k)
+
+def _ds_fromkeys(a, keys):
+    return DictSet.fromkeys(keys)
+
+def _ds_unique_combinations(a, keys):
+    return list(islice(a.unique_combinations(keys), _MAX_COMBINATIONS))
+
+def _ior(a, b):
+    a |= b
+def _iand(a, b):
+    a &= b
+def _isub(a, b):
+    a -= b
+def _ixor(a, b):
+    a ^= b
+
+
+# (name, DictSet implementation, baseline implementation, mutates, probe)
+#
+# mutates -- the operation changes its first operand, so it is handed
+#            a fresh copy for every call
+# probe   -- the second operand is a list of keys instead of B
+OPERATIONS = [
+    ('union', lambda a, b: a | b,
+        _baseline_binary('union'), False, False),
+    ('intersection', lambda a, b: a & b,
+        _baseline_binary('intersection'), False, False),
+    ('difference', lambda a, b: a - b,
+        _baseline_binary('difference'), False, False),
+    ('symmetric_difference', lambda a, b: a ^ b,
+        _baseline_binary('symmetric_difference'), False, False),
+    ('__ior__', _ior,
+        _baseline_inplace('update'), True, False),
+    ('__iand__', _iand,
+        _baseline_inplace('intersection_update'), True, False),
+    ('__isub__', _isub,
+        _baseline_inplace('difference_update'), True, False),
+    ('__ixor__', _ixor,
+        _baseline_inplace('symmetric_difference_update'), True, False),
+    ('update', lambda a, b: a.update(b),
+        _baseline_update, True, False),
+    ('intersection_update', lambda a, b: a.intersection_update(b),
+        _baseline_inplace('intersection_update'), True, False),
+    ('difference_update', lambda a, b: a.difference_update(b),
+        _baseline_inplace('difference_update'), True, False),
+    ('symmetric_difference_update',
+        lambda a, b: a.symmetric_difference_update(b),
+        _baseline_inplace('symmetric_difference_update'), True, False),
+    ('__eq__', lambda a, b: a == b, _baseline_eq, False, False),
+    ('__ne__', lambda a, b: a != b,
+        lambda a, b: not _baseline_eq(a, b), False, False),
+    ('issubset', lambda a, b: a.issubset(b),
+        _baseline_issubset, False, False),
+    ('issuperset', lambda a, b: a.issuperset(b),
+        _baseline_issuperset, False, False),
+    ('isdisjoint', lambda a, b: a.isdisjoint(b),
+        _baseline_isdisjoint, False, False),
+    ('__lt__', lambda a, b: a < b,
+        lambda a, b: _baseline_issubset(a, b) and not _baseline_eq(a, b),
+        False, False),
+    ('__gt__', lambda a, b: a > b,
+        lambda a, b: _baseline_issuperset(a, b) and not _baseline_eq(a, b),
+        False, False),
+    ('invert', lambda a, b: a.invert(), _baseline_invert, False, False),
+    ('compose', lambda a, b: a.compose(b), _baseline_compose, False, False),
+    ('transitive_closure', lambda a, b: a.transitive_closure(),
+        _baseline_transitive_closure, False, False),
+    ('__contains__', _ds_contains, _baseline_contains, False, True),
+    ('get', _ds_get, _baseline_get, False, True),
+    ('get_many', lambda a, keys: a.get_many(keys),
+        _baseline_get_many, False, True),
+    ('has_keys', lambda a, keys: a.has_keys(keys),
+        _baseline_has_keys, False, True),
+    ('fromkeys', _ds_fromkeys, _baseline_fromkeys, False, True),
+    ('unique_combinations', _ds_unique_combinations,
+        _baseline_unique_combinations, False, True),
+    ]
+
+
+def time_operation(func, make_args, number, repeat):
+    """
+    Returns the best time per call in seconds.
+
+    make_args() is called outside of the timed region to build the
+    argument tuple for every call, so mutating operations can be
+    handed fresh operands.
+    """
+    best = None
+    for r in _xrange(repeat):
+        args = [make_args() for i in _xrange(number)]
+        t0 = _clock()
+        for a in args:
+            func(*a)
+        t = (_clock() - t0) / number
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def _probe_keys(name, A, B):
+    """the second operand of the operations that take keys"""
+    if name == 'unique_combinations':
+        return sorted(A)[:3]
+    return list(A)[::2] + list(B)[::2]
+
+
+def run(grid, number=3, repeat=3, operations=None, out=None):
+    """
+    Runs the benchmark over grid and returns a list of result dicts.
+
+    operations can be a list of operation names to limit the run.
+    When out is supplied a line is written to it for every result.
+    """
+    results = []
+    names = sorted(grid)
+    for values in product(*[grid[n] for n in names]):
+        params = dict(zip(names, values))
+        A, B = make_operands(**params)
+
+        for (name, ds_op, base_op, mutates, probe) in OPERATIONS:
+            if operations is not None and name not in operations:
+                continue
+
+            second = _probe_keys(name, A, B) if probe else None
+            ds_A, ds_B = DictSet(A), DictSet(B)
+
+            if mutates:
+                ds_args = lambda: (DictSet(ds_A), ds_B)
+                base_args = lambda: (_copy_dos(A), B)
+            elif probe:
+                ds_args = lambda: (ds_A, second)
+                base_args = lambda: (A, second)
+            else:
+                ds_args = lambda: (ds_A, ds_B)
+                base_args = lambda: (A, B)
+
+            for impl, func, make_args in (('dictset', ds_op, ds_args),
+                                          ('baseline', base_op, base_args)):
+                t = time_operation(func, make_args, number, repeat)
+                result = dict(params, operation=name, impl=impl,
+                              seconds=t, number=number, repeat=repeat)
+                results.append(result)
+
+                if out is not None:
+                    out.write('%-28s %-8s %-40s %12.3f us\n' %
+                              (name, impl, _format_params(params), t * 1e6))
+    return results
+
+
+def _format_params(params):
+    return ' '.join('%s=%s' % (k, params[k]) for k in sorted(params))
+
+
+def _result_key(result):
+    return tuple((k, result[k]) for k in sorted(result)
+                 if k not in ('seconds', 'number', 'repeat'))
+
+
+def compare(old, new, out=sys.stdout):
+    """Writes the new/old time ratio of every result found in both runs"""
+    old_times = dict((_result_key(r), r['seconds']) for r in old['results'])
+    for r in new['results']:
+        key = _result_key(r)
+        if key in old_times and old_times[key] > 0:
+            out.write('%-28s %-8s %-40s %8.2fx\n' %
+                      (r['operation'], r['impl'],
+                       _format_params(dict(k for k in key
+                                           if k[0] not in
+                                           ('operation', 'impl'))),
+                       r['seconds'] / old_times[key]))
+
+
+# Empirical complexity
+#
+# (name, func, make_args, expected exponent)
+#
+# The exponent is the expected growth of the cost of the timed calls
+# with the number of keys: 0 for operations that touch a single key
+# (timed as a fixed batch of probes) and 1 for whole DictSet operations.
+_PROBES = 256
+
+_complexity_cache = {}
+
+def _complexity_operands(n):
+    if n not in _complexity_cache:
+        A, B = make_operands(n_keys=n, set_size=4, overlap=0.5,
+                             element_type='int')
+        _complexity_cache[n] = DictSet(A), DictSet(B)
+    return _complexity_cache[n]
+
+def _binary_args(n):
+    A, B = _complexity_operands(n)
+    return lambda: (A, B)
+
+def _equal_args(n):
+    # equal operands, so the comparisons walk every set
+    A, B = _complexity_operands(n)
+    return lambda: (A, DictSet(A))
+
+def _disjoint_args(n):
+    # the same keys with other elements, so isdisjoint walks every set
+    A, B = _complexity_operands(n)
+    C = DictSet([(k, [-1 - e for e in v]) for (k, v) in A.items()])
+    return lambda: (A, C)
+
+def _inplace_args(n):
+    A, B = _complexity_operands(n)
+    return lambda: (DictSet(A), B)
+
+def _probe_args(n):
+    A, B = _complexity_operands(n)
+    keys = (list(A)[:_PROBES // 2] + list(B)[:_PROBES // 2])
+    return lambda: (DictSet(A), keys)
+
+def _sparse_args(n):
+    A, B = _complexity_operands(n)
+    E = DictSet(dict((k, B[k]) for k in list(B)[:3]))
+    return lambda: (DictSet(A), E)
+
+def _self_args(n):
+    A, B = _complexity_operands(n)
+    return lambda: (A,)
+
+def _keys_args(n):
+    A, B = _complexity_operands(n)
+    keys = list(A)
+    return lambda: (keys,)
+
+def _probe(method):
+    def op(a, keys):
+        f = getattr(a, method)
+        for k in keys:
+            f(k)
+    return op
+
+def _probe_add(a, keys):
+    for k in keys:
+        a.add(k, 0)
+
+def _probe_discard(a, keys):
+    for k in keys:
+        a.discard(k, 0)
+
+def _probe_contains(a, keys):
+    for k in keys:
+        k in a
+
+COMPLEXITY = [
+    ('union', lambda a, b: a | b, _binary_args, 1),
+    ('intersection', lambda a, b: a & b, _binary_args, 1),
+    ('difference', lambda a, b: a - b, _binary_args, 1),
+    ('symmetric_difference', lambda a, b: a ^ b, _binary_args, 1),
+    ('update', lambda a, b: a.update(b), _inplace_args, 1),
+    ('intersection_update',
+        lambda a, b: a.intersection_update(b), _inplace_args, 1),
+    ('difference_update',
+        lambda a, b: a.difference_update(b), _inplace_args, 1),
+    ('symmetric_difference_update',
+        lambda a, b: a.symmetric_difference_update(b), _inplace_args, 1),
+    ('difference_update_sparse',
+        lambda a, b: a.difference_update(b), _sparse_args, 0),
+    ('symmetric_difference_update_sparse',
+        lambda a, b: a.symmetric_difference_update(b), _sparse_args, 0),
+    ('intersection_update_keys',
+        lambda a, b: a.intersection_update(b, keys=list(b)), _sparse_args, 0),
+    ('__eq__', lambda a, b: a == b, _equal_args, 1),
+    ('__ne__', lambda a, b: a != b, _equal_args, 1),
+    ('issubset', lambda a, b: a.issubset(b), _equal_args, 1),
+    ('issuperset', lambda a, b: a.issuperset(b), _equal_args, 1),
+    ('isdisjoint', lambda a, b: a.isdisjoint(b), _disjoint_args, 1),
+    ('invert', lambda a: a.invert(), _self_args, 1),
+    ('compose', lambda a, b: a.compose(b), _binary_args, 1),
+    ('transitive_closure', lambda a: a.transitive_closure(), _self_args, 1),
+    ('__init__', lambda a: DictSet(a), _self_args, 1),
+    ('copy', lambda a: a.copy(), _self_args, 1),
+    ('__iter__', lambda a: list(a), _self_args, 1),
+    ('__repr__', lambda a: repr(a), _self_args, 1),
+    ('fromkeys', lambda keys: DictSet.fromkeys(keys), _keys_args, 1),
+    ('__contains__', _probe_contains, _probe_args, 0),
+    ('get', _probe('get'), _probe_args, 0),
+    ('get_many', lambda a, keys: a.get_many(keys), _probe_args, 0),
+    ('has_keys', lambda a, keys: a.has_keys(keys), _probe_args, 0),
+    ('setdefault', _probe('setdefault'), _probe_args, 0),
+    ('add', _probe_add, _probe_args, 0),
+    ('discard', _probe_discard, _probe_args, 0),
+    ]
+
+# geometrically growing key counts used by check_complexity
+COMPLEXITY_SIZES = [500, 1000, 2000, 4000, 8000]
+
+# allocation peaks are floored at this many bytes so constant time
+# operations are not judged on the noise of a few small objects
+_ALLOCATION_FLOOR = 64 * 1024
+
+
+def fit_exponent(sizes, costs):
+    """
+    Returns the least squares slope of log(costs) against log(sizes),
+    i.e. the p in cost ~ size**p
+    """
+    from math import log
+    xs = [log(x) for x in sizes]
+    ys = [log(y) for y in costs]
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    sxx = sum((x - mx) ** 2 for x in xs)
+    sxy = sum((x - mx) * (y - my) for (x, y) in zip(xs, ys))
+    return sxy / sxx
+
+
+def peak_allocation(func, args):
+    """
+    Returns the peak number of bytes allocated while calling func(*args),
+    or None when tracemalloc is not available.
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_scaling(func, make_args, sizes=None, repeat=3):
+    """
+    Times func at every size and fits the scaling exponents.
+
+    make_args(n) is called once per size and returns a factory of
+    argument tuples for an instance with n keys.
+
+    Returns a dict with the sizes, the best time per call, the peak
+    allocation per call and the fitted 'time_exponent' and
+    'alloc_exponent' (None without tracemalloc).
+    """
+    if sizes is None:
+        sizes = COMPLEXITY_SIZES
+
+    seconds, allocations = [], []
+    for n in sizes:
+        factory = make_args(n)
+        seconds.append(time_operation(func, factory, 1, repeat))
+        allocations.append(peak_allocation(func, factory()))
+
+    result = dict(sizes=sizes, seconds=seconds, allocations=allocations,
+                  time_exponent=fit_exponent(sizes, seconds),
+                  alloc_exponent=None)
+    if None not in allocations:
+        result['alloc_exponent'] = fit_exponent(
+            sizes, [max(b, _ALLOCATION_FLOOR) for b in allocations])
+    return result
+
+
+def check_complexity(operations=None, sizes=None, tolerance=0.5,
+                     out=None, timing=True):
+    """
+    Measures the scaling of the COMPLEXITY operations and returns a
+    list of (name, expected, result) tuples for the ones whose time or
+    allocation exponent exceeds the expected exponent by more than
+    tolerance. An empty list means everything scales as intended.
+
+    With timing=False only the allocation exponents are judged, as
+    wall clock timings are too noisy on loaded machines to gate on.
+    """
+    failures = []
+    for (name, func, make_args, expected) in COMPLEXITY:
+        if operations is not None and name not in operations:
+            continue
+
+        result = measure_scaling(func, make_args, sizes)
+        exponents = [result['time_exponent']] if timing else []
+        if result['alloc_exponent'] is not None:
+            exponents.append(result['alloc_exponent'])
+
+        if out is not None:
+            out.write('%-28s expected %d  time %5.2f  alloc %s\n' %
+                      (name, expected, result['time_exponent'],
+                       'n/a' if result['alloc_exponent'] is None
+                       else '%5.2f' % result['alloc_exponent']))
+
+        if exponents and max(exponents) > expected + tolerance:
+            failures.append((name, expected, result))
+    return failures
+
+
+# Memory
+#
+# (name, class) of the DictSets compared by memory_benchmark
+MEMORY_CLASSES = [('dictset', DictSet), ('compact', CompactDictSet),
+                  ('interning', InterningDictSet)]
+
+def make_skewed_pairs(n_keys, small_fraction=0.8, seed=0):
+    """
+    Returns a list of (key, elements) pairs where small_fraction of
+    the keys hold 1 or 2 elements and the rest hold 3 to 20.
+    """
+    rng = random.Random(seed)
+    pairs = []
+    for i in _xrange(n_keys):
+        if rng.random() < small_fraction:
+            size = rng.randint(1, 2)
+        else:
+            size = rng.randint(3, 20)
+        pairs.append((i, [rng.randint(0, 999) for j in _xrange(size)]))
+    return pairs
+
+
+def memory_benchmark(n_keys=1000000, small_fraction=0.8, out=None):
+    """
+    Builds every MEMORY_CLASSES DictSet from the same skewed pairs and
+    returns a list of result dicts with the memory_usage figures of the
+    table and sets (the keys and elements are the same for all of them)
+    and the build time.
+    """
+    pairs = make_skewed_pairs(n_keys, small_fraction)
+    results = []
+    for (name, cls) in MEMORY_CLASSES:
+        t0 = _clock()
+        ds = cls(pairs)
+        seconds = _clock() - t0
+
+        usage = ds.memory_usage(deep=False)
+        result = dict(impl=name, n_keys=n_keys,
+                      small_fraction=small_fraction, seconds=seconds,
+                      bytes=usage['total'],
+                      bytes_per_key=usage['total'] / float(n_keys))
+        results.append(result)
+
+        if out is not None:
+            out.write('%-12s n_keys=%d %14d bytes %8.1f bytes/key '
+                      '%8.2f s build\n' %
+                      (name, n_keys, result['bytes'],
+                       result['bytes_per_key'], seconds))
+        del ds
+    return results
+
+
+def metadata(grid, number, repeat):
+    return dict(python=platform.python_version(),
+                implementation=platform.python_implementation(),
+                platform=platform.platform(),
+                timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                grid=grid, number=number, repeat=repeat)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmarks DictSet.')
+    parser.add_argument('--full', action='store_true',
+                        help='run the full parameter grid')
+    parser.add_argument('--number', type=int, default=3,
+                        help='calls per timing (default 3)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timings per result, the best is kept')
+    parser.add_argument('--operation', action='append',
+                        help='only run this operation (repeatable)')
+    parser.add_argument('--json', metavar='PATH',
+                        help='write the results to PATH as JSON')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='compare against the JSON results in PATH')
+    parser.add_argument('--complexity', action='store_true',
+                        help='fit the scaling exponents instead')
+    parser.add_argument('--memory', action='store_true',
+                        help='compare the memory of the DictSet classes')
+    parser.add_argument('--keys', type=int, default=1000000,
+                        help='number of keys of the --memory instances')
+    args = parser.parse_args(argv)
+
+    if args.memory:
+        results = memory_benchmark(args.keys, out=sys.stdout)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(dict(meta=metadata({}, 1, 1), results=results),
+                          f, indent=1, sort_keys=True)
+        return 0
+
+    if args.complexity:
+        failures = check_complexity(args.operation, out=sys.stdout)
+        for (name, expected, result) in failures:
+            print('%s scales worse than n**%d' % (name, expected))
+        return len(failures)
+
+    grid = FULL_GRID if args.full else QUICK_GRID
+    results = run(grid, args.number, args.repeat,
+                  args.operation, out=sys.stdout)
+    report = dict(meta=metadata(grid, args.number, args.repeat),
+                  results=results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print('\nnew/old time ratios')
+        compare(old, report)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,13 +4,34 @@
 
 # Python 2 to 3 workarounds
 import sys
+import random
 if sys.version_info[0] == 2:
     _xrange = xrange
 elif sys.version_info[0] == 3:
     from functools import reduce
     _xrange = range
 
+import time
+import hashlib
+import heapq
+import math
+import numbers
+import threading
+from bisect import bisect_left, bisect_right, insort
 from copy import copy, deepcopy    
+from functools import wraps
+from itertools import islice
+
+try:
+    from collections.abc import Mapping, Set
+except ImportError: # Python 2
+    from collections import Mapping, Set
+from contextlib import contextmanager
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
 
 # for unique_combinations method
 def _rep_generator(A, times, each):
@@ -31,9 +52,1025 @@ def _rep_generator(A, times, each):
     """
     return (a for t in _xrange(times) for a in A for e in _xrange(each))
 
+# for memory_usage method
+def _deep_sizeof(obj, seen):
+    """
+    Returns the bytes of obj plus the bytes of the members of tuples
+    and frozensets (elements can be nested). Objects whose id is in
+    seen are not counted again.
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, frozenset)):
+        for item in obj:
+            size += _deep_sizeof(item, seen)
+    return size
+
+# The values of a DictSet are normally sets, but a key can also hold
+# its elements in an immutable form: a tuple for small sets (see
+# CompactDictSet) or a frozenset that may be shared with other keys
+# (see InterningDictSet and DictSet.dedupe). Methods that only read
+# DS[k] use these as they are, methods that mutate DS[k] replace them
+# with a private set first.
+_empty = frozenset()
+
+def _as_set(v):
+    """returns v if it is a set or frozenset, else frozenset(v)"""
+    if isinstance(v, (set, frozenset)):
+        return v
+    return frozenset(v)
+
+# for the comparison methods
+def _as_mapping(E):
+    """
+    Returns E if it has a .keys() method, else E as a DictSet. Raises
+    TypeError like DictSet(E) if E can't be made into a DictSet.
+    """
+    if hasattr(E, 'keys'):
+        return E
+    return DictSet(E)
+
+def _as_dictset(E):
+    """
+    Returns E if it is a DictSet or a DictSetView, which are read in
+    place, else a DictSet of a copy of E.
+    """
+    if isinstance(E, (DictSet, DictSetView)):
+        return E
+    return DictSet(copy(E))
+
+def _share_sets(foo, D, skip):
+    """
+    Stores the non-empty sets of D whose keys k aren't skip(k) in foo,
+    sharing the immutable ones instead of copying them.
+    """
+    for (k, v) in _items(D):
+        if len(v) and not skip(k):
+            foo._store(k, v if isinstance(v, (frozenset, tuple)) else set(v))
+
+def _combine(foo, D, method, E, keys):
+    """stores the set method of D and E for each of the keys in foo"""
+    for k in keys:
+        s = set(D._peek(k))
+        getattr(s, method)(E._peek(k))
+        if s:
+            foo._store(k, s) # skip empty sets
+
+def _scoped(D, method, E, keys):
+    """
+    a new DictSet of the set method of D and E on the keys, with the
+    sets of the other keys of D taken over as they are
+    """
+    keys = set(keys)
+    foo = D._new()
+    _share_sets(foo, D, keys.__contains__)
+    _combine(foo, D, method, E, keys)
+    return foo
+
+def _getter(E):
+    """
+    Returns a function that looks up the elements of E[k] without
+    copying them, an empty frozenset for missing keys.
+    """
+    if isinstance(E, (DictSet, DictSetView)):
+        return E._peek
+    get = E.get
+    return lambda k: get(k, _empty)
+
+def _items(E):
+    """the (key, elements) pairs of E without copying the elements"""
+    if isinstance(E, DictSet):
+        return dict.items(E)
+    if isinstance(E, DictSetView):
+        return E._items()
+    return E.items()
+
+
+# for the invert method
+def _invert_pairs(pairs):
+    """
+    Returns a dict mapping the elements of the (key, elements) pairs
+    to lists of their keys.
+    """
+    lists = {}
+    for (k, v) in pairs:
+        for e in v:
+            if e in lists:
+                lists[e].append(k)
+            else:
+                lists[e] = [k]
+    return lists
+
+def _chunks(pairs, size):
+    """
+    Yields lists of the (key, elements) pairs with non-empty elements,
+    each holding about size elements in total.
+    """
+    (chunk, n) = ([], 0)
+    for (k, v) in pairs:
+        if len(v):
+            chunk.append((k, v))
+            n += len(v)
+            if n >= size:
+                yield chunk
+                (chunk, n) = ([], 0)
+    if chunk:
+        yield chunk
+
+def _merge_lists(lists, partial):
+    """adds the key lists of partial to lists"""
+    for (e, ks) in partial.items():
+        if e in lists:
+            lists[e].extend(ks)
+        else:
+            lists[e] = ks
+
+# for the compose method
+def _compose_pairs(pairs, relation, memo):
+    """
+    Returns a list of the (key, union of relation[v] for v in elements)
+    pairs of pairs, with the non-empty unions. relation is a dict.
+    memo caches the unions of frozensets, which can be shared between
+    keys, as frozensets so the keys of the result can share them too.
+    """
+    get = dict.get # also reads the stored values of a DictSet
+    result = []
+    for (k, v) in pairs:
+        shared = type(v) is frozenset
+        s = memo.get(v) if shared else None
+        if s is None:
+            s = set()
+            for e in v:
+                w = get(relation, e)
+                if w:
+                    s.update(w)
+            if shared:
+                s = memo[v] = frozenset(s)
+        if s:
+            result.append((k, s))
+    return result
+
+_compose_relation = None
+
+def _init_compose(relation):
+    """initializes a compose worker process with the second relation"""
+    global _compose_relation
+    _compose_relation = relation
+
+def _compose_chunk(pairs):
+    """the _compose_pairs of a chunk in a compose worker process"""
+    return _compose_pairs(pairs, _compose_relation, {})
+
+# for the similarity_join method
+#
+# The elements of both DictSets are ranked from the rarest to the most
+# common. Two sets of sizes n and m with a Jaccard similarity of at
+# least t share at least t*(n+m)/(1+t) elements, so their prefixes of
+# _jaccard_prefix(n, t) and _jaccard_prefix(m, t) lowest ranked
+# elements share at least one element (prefix filtering), their sizes
+# are within a factor of t of each other (size filtering) and the
+# elements after a shared prefix element have to make up the rest of
+# the overlap (positional filtering).
+_EPS = 1e-9 # keeps the float bounds on the safe side
+
+def _jaccard_prefix(n, threshold):
+    """the length of the prefix that a set of n elements is indexed by"""
+    return n - int(math.ceil(threshold * n - _EPS)) + 1
+
+def _similarity_index(pairs, rank, threshold):
+    """
+    Returns (keys, sets, index) for the (key, elements) pairs of the
+    probed DictSet: keys[j] is the j-th key with a non-empty set,
+    sets[j] the frozenset of the ranks of its elements and index maps
+    a rank to a list of (j, size of the set, number of elements after
+    the rank) for the prefixes that hold it.
+    """
+    (keys, sets, index) = ([], [], {})
+    for (k, v) in pairs:
+        m = len(v)
+        if m:
+            r = sorted(rank[e] for e in v)
+            j = len(keys)
+            keys.append(k)
+            sets.append(frozenset(r))
+            for p in _xrange(_jaccard_prefix(m, threshold)):
+                x = r[p]
+                if x in index:
+                    index[x].append((j, m, m - p - 1))
+                else:
+                    index[x] = [(j, m, m - p - 1)]
+    return (keys, sets, index)
+
+def _similarity_pairs(pairs, rank, keys, sets, index, threshold):
+    """
+    Returns a list of the (key, other key, similarity) triples of the
+    (key, elements) pairs with the sets of _similarity_index.
+    """
+    ratio = threshold / (1.0 + threshold)
+    result = []
+    for (k, v) in pairs:
+        n = len(v)
+        if not n:
+            continue
+        r = sorted(rank[e] for e in v)
+        (lo, hi) = (threshold * n - _EPS, n / threshold + _EPS)
+
+        need = ratio * n - _EPS
+
+        # j -> 1 + prefix elements shared so far, 0 once j is ruled out
+        overlap = {}
+        for i in _xrange(_jaccard_prefix(n, threshold)):
+            rest = n - i - 1
+            for (j, m, tail) in index.get(r[i], ()):
+                c = overlap.get(j)
+                if c is None:
+                    c = 1 if lo <= m <= hi else 0
+                if c and c + (rest if rest < tail else tail) >= \
+                   need + ratio * m:
+                    overlap[j] = c + 1
+                else:
+                    overlap[j] = 0
+
+        s = frozenset(r)
+        for (j, c) in overlap.items():
+            if c:
+                m = len(sets[j])
+                o = len(s & sets[j])
+                score = o / float(n + m - o)
+                if score >= threshold:
+                    result.append((k, keys[j], score))
+    return result
+
+_similarity_state = None
+
+def _init_similarity(state):
+    """initializes a similarity_join worker process with the index"""
+    global _similarity_state
+    _similarity_state = state
+
+def _similarity_chunk(pairs):
+    """the _similarity_pairs of a chunk in a similarity_join worker"""
+    return _similarity_pairs(pairs, *_similarity_state)
+
+# Change tracking
+#
+# Trackers are callables attached to a DictSet that receive lists of
+# (kind, key, elements) events describing how its contents changed:
+#
+#   'create'  key was added (with an empty set)
+#   'add'     elements were added to the set of key
+#   'remove'  elements were removed from the set of key
+#   'drop'    key was deleted (after a 'remove' of its elements)
+#   'touch'   the set of key was handed out or stored as is, so it can
+#             change without the DictSet seeing it
+#
+# Nothing is computed or emitted while a DictSet has no trackers.
+_MASK = (1 << 64) - 1
+
+def _mix64(x):
+    """the splitmix64 finalizer, mixes the bits of a 64 bit integer"""
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _MASK
+    return x ^ (x >> 31)
+
+def _hash64(obj):
+    """hash(obj) as a well mixed 64 bit integer"""
+    return _mix64(hash(obj) & _MASK)
+
+def _canonical(obj):
+    """
+    Returns bytes that encode obj the same way in every process.
+    Numbers that compare equal are encoded alike, tuples and frozensets
+    are encoded from their members. Other objects are encoded by their
+    type and repr, which must then not depend on the process.
+    """
+    if isinstance(obj, numbers.Integral):
+        return ('i%d' % obj).encode('ascii')
+    if isinstance(obj, float):
+        if obj.is_integer():
+            return ('i%d' % obj).encode('ascii')
+        return ('f' + repr(obj)).encode('ascii')
+    if isinstance(obj, bytes):
+        return b'b' + obj
+    if isinstance(obj, type(u'')):
+        return b'u' + obj.encode('utf-8')
+    if isinstance(obj, (tuple, frozenset)):
+        parts = [_canonical(item) for item in obj]
+        if isinstance(obj, frozenset):
+            parts.sort()
+        return (b't(' if isinstance(obj, tuple) else b'f(') + \
+               b''.join(('%d:' % len(p)).encode('ascii') + p for p in parts) + b')'
+    return ('r%s.%s:%r' % (type(obj).__module__, type(obj).__name__,
+                           obj)).encode('utf-8')
+
+def _stable_hash64(obj):
+    """a 64 bit hash of obj that is the same in every process"""
+    return int(hashlib.sha256(_canonical(obj)).hexdigest()[:16], 16)
+
+def _freeze(s):
+    """returns s as a frozenset, copying it only if it is a set"""
+    return s if type(s) is frozenset else frozenset(s)
+
+def _drop_events(k, v):
+    """the events for deleting key k holding the elements v"""
+    if len(v):
+        return [('remove', k, _freeze(v)), ('drop', k, _empty)]
+    return [('drop', k, _empty)]
+
+# A touched key stays dirty only while its set is held outside the
+# DictSet, e.g. by the caller of DS[k]; once the only reference left is
+# the DictSet's own the set can't change unseen any more. Without
+# sys.getrefcount touched keys stay dirty.
+_getrefcount = getattr(sys, 'getrefcount', None)
+
+def _refs(ds, k):
+    """the number of references to the value of ds[k]"""
+    v = dict.get(ds, k)
+    return _getrefcount(v) if v is not None else 0
+
+_OWN_REFS = _refs({0: set()}, 0) if _getrefcount is not None else -1
+
+def _released(ds, k):
+    """whether the set of the touched key k is only held by ds"""
+    return _getrefcount is not None and _refs(ds, k) <= _OWN_REFS
+
+class _Subscription(object):
+    """A subscriber of a DictSet, receives all but the 'touch' events."""
+    deferred = True
+
+    def __init__(self, callback, batched):
+        self.callback = callback
+        self.batched = batched
+
+    def __call__(self, events):
+        events = [e for e in events if e[0] != 'touch']
+        if not events:
+            return
+        if self.batched:
+            self.callback(events)
+        else:
+            for (kind, k, elements) in events:
+                self.callback(kind, k, elements)
+
+class _UndoLog(object):
+    """
+    Records the change events of a DictSet, with a copy of the set of
+    every touched key, so they can be undone in reverse order.
+    """
+    def __init__(self, ds):
+        self.ds = ds
+        self.log = []
+
+    def __call__(self, events):
+        for event in events:
+            if event[0] == 'touch':
+                k = event[1]
+                event = ('touch', k, frozenset(self.ds._peek(k)))
+            self.log.append(event)
+
+    def rollback(self):
+        ds = self.ds
+        with ds.batch():
+            for (kind, k, elements) in reversed(self.log):
+                if kind == 'add':
+                    ds._key_update(k, 'difference_update', elements, False)
+                elif kind == 'remove':
+                    ds._key_update(k, 'update', elements, False)
+                elif kind == 'create':
+                    ds.pop(k, None)
+                elif kind == 'drop':
+                    ds.add(k)
+                else: # touch, restore the copy of the set
+                    ds._key_update(k, 'intersection_update', elements, False)
+                    ds._key_update(k, 'update', elements, False)
+        del self.log[:]
+
+class _SizeIndex(object):
+    """
+    Keeps the keys of a DictSet indexed by the sizes of their sets up to
+    date from its change events. Empty sets are not indexed.
+    """
+    def __init__(self, ds):
+        self.ds = ds
+        self.size = {}    # key -> size of its set
+        self.buckets = {} # size -> keys with sets of that size
+        self.sizes = []   # the sizes of the buckets, sorted
+        self.total = 0
+        self.dirty = set()
+        for (k, v) in dict.items(ds):
+            self._resize(k, len(v))
+
+    def _resize(self, k, n):
+        old = self.size.pop(k, 0)
+        if old:
+            bucket = self.buckets[old]
+            bucket.discard(k)
+            if not bucket:
+                del self.buckets[old]
+                del self.sizes[bisect_left(self.sizes, old)]
+        if n:
+            self.size[k] = n
+            bucket = self.buckets.get(n)
+            if bucket is None:
+                bucket = self.buckets[n] = set()
+                insort(self.sizes, n)
+            bucket.add(k)
+        self.total += n - old
+
+    def __call__(self, events):
+        # the events are delivered after the change, so the stored
+        # sets already have their new sizes
+        for (kind, k, elements) in events:
+            if kind == 'touch':
+                self.dirty.add(k)
+            else:
+                if kind == 'drop':
+                    self.dirty.discard(k)
+                self._resize(k, len(self.ds._peek(k)))
+
+    def _refresh(self):
+        if self.dirty:
+            for k in self.dirty:
+                self._resize(k, len(self.ds._peek(k)))
+            self.dirty = set(k for k in self.dirty
+                             if not _released(self.ds, k))
+
+    def top_k(self, n):
+        self._refresh()
+        result = []
+        for size in reversed(self.sizes):
+            for k in self.buckets[size]:
+                if len(result) >= n:
+                    return result
+                result.append((k, size))
+        return result
+
+    def keys_with_size(self, lo, hi):
+        self._refresh()
+        i = bisect_left(self.sizes, lo)
+        j = len(self.sizes) if hi is None else bisect_right(self.sizes, hi)
+        return [k for size in self.sizes[i:j] for k in self.buckets[size]]
+
+# for reachable_from and transitive_closure
+def _bit_indices(x):
+    """the positions of the set bits of the non-negative int x"""
+    s = bin(x)[:1:-1] # lowest bit first
+    result = []
+    i = s.find('1')
+    while i >= 0:
+        result.append(i)
+        i = s.find('1', i + 1)
+    return result
+
+def _closure_bits(ds):
+    """
+    Returns (index, nodes, reach) for the graph with the edges k -> v
+    for the elements v of ds[k]. index numbers the nodes, nodes[i] is
+    node i and bit j of reach[i] is set if node j can be reached from
+    node i along one or more edges.
+
+    The strongly connected components are found with Tarjan's
+    algorithm, which finishes a component after all the components it
+    leads to, so the reach of a component is the union of the reach
+    of the components its edges lead to, plus its own nodes if it is
+    a cycle. Nodes of a component share one int.
+    """
+    index = {}
+    nodes = []
+    succ = []
+    def number(x):
+        i = index.get(x)
+        if i is None:
+            i = index[x] = len(nodes)
+            nodes.append(x)
+            succ.append(())
+        return i
+    for (k, v) in dict.items(ds):
+        i = number(k)
+        succ[i] = [number(e) for e in v]
+
+    n = len(nodes)
+    num = [0] * n
+    low = [0] * n
+    on_stack = [False] * n
+    comp = [-1] * n
+    stack = []
+    reach = [0] * n
+    full = [] # reach of each component, including its own nodes
+    counter = 0
+    for root in _xrange(n):
+        if num[root]:
+            continue
+        work = [(root, 0)]
+        while work:
+            (v, i) = work[-1]
+            if i == 0:
+                counter += 1
+                num[v] = low[v] = counter
+                stack.append(v)
+                on_stack[v] = True
+            edges = succ[v]
+            while i < len(edges):
+                w = edges[i]
+                i += 1
+                if not num[w]:
+                    work[-1] = (v, i)
+                    work.append((w, 0))
+                    break
+                elif on_stack[w]:
+                    low[v] = min(low[v], num[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                if low[v] == num[v]:
+                    members = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        comp[w] = len(full)
+                        members.append(w)
+                        if w == v:
+                            break
+                    c = len(full)
+                    mbits = 0
+                    for m in members:
+                        mbits |= 1 << m
+                    bits = 0
+                    cyclic = len(members) > 1
+                    targets = set()
+                    for m in members:
+                        for w in succ[m]:
+                            if comp[w] != c:
+                                targets.add(comp[w])
+                            elif w == m:
+                                cyclic = True
+                    for d in targets:
+                        bits |= full[d]
+                    if cyclic:
+                        bits |= mbits
+                    full.append(bits | mbits)
+                    for m in members:
+                        reach[m] = bits
+    return (index, nodes, reach)
+
+class _Reachability(object):
+    """
+    Keeps the reachability bitsets of the graph of a DictSet (see
+    _closure_bits) up to date from its change events. New edges are
+    added incrementally, removed edges and touched keys make the
+    bitsets be recomputed when they are next used.
+    """
+    def __init__(self, ds):
+        self.ds = ds
+        self.stale = True
+
+    def __call__(self, events):
+        if self.stale:
+            return
+        for (kind, k, elements) in events:
+            if kind == 'add':
+                for e in elements:
+                    self._add_edge(k, e)
+            elif kind in ('remove', 'touch'):
+                self.stale = True
+                return
+
+    def _number(self, x):
+        i = self.index.get(x)
+        if i is None:
+            i = self.index[x] = len(self.nodes)
+            self.nodes.append(x)
+            self.reach.append(0)
+        return i
+
+    def _add_edge(self, k, e):
+        (u, v) = (self._number(k), self._number(e))
+        reach = self.reach
+        added = reach[v] | (1 << v)
+        if reach[u] | added == reach[u]:
+            return # v was already reachable from u
+        ubit = 1 << u
+        for x in _xrange(len(reach)):
+            if x == u or reach[x] & ubit:
+                reach[x] |= added
+
+    def bits(self):
+        if self.stale:
+            (self.index, self.nodes, self.reach) = _closure_bits(self.ds)
+            self.stale = False
+        return (self.index, self.nodes, self.reach)
+
+# for the MinHash methods
+#
+# The i-th hash function of a signature is x -> (a*x + b) mod p over
+# the 64 bit hashes x of the elements, with p the Mersenne prime 2**61-1
+# and (a, b) drawn from a seeded random.Random. The minimums are taken
+# for batches of elements at a time with map(min, ...), which does the
+# comparisons in C.
+_MERSENNE = (1 << 61) - 1
+_MINHASH_BATCH = 256
+
+def _minhash_params(num_perm, seed):
+    """the (a, b) pairs of the num_perm hash functions of a signature"""
+    rng = random.Random(seed)
+    return tuple((rng.randrange(1, _MERSENNE), rng.randrange(_MERSENNE))
+                 for i in _xrange(num_perm))
+
+def _minhash(elements, params, sig=None):
+    """
+    Returns the MinHash signature, a tuple, of the elements with the
+    hash functions params, merged with the signature sig of other
+    elements if it isn't None.
+    """
+    p = _MERSENNE
+    it = iter(elements)
+    while True:
+        rows = [[(a * x + b) % p for (a, b) in params]
+                for x in [_hash64(e) % p for e in islice(it, _MINHASH_BATCH)]]
+        if not rows:
+            break
+        if sig is not None:
+            rows.append(sig)
+        sig = tuple(map(min, *rows)) if len(rows) > 1 else tuple(rows[0])
+    return sig
+
+def _agreement(sig, other):
+    """the fraction of the positions where two signatures agree"""
+    if sig is None or other is None:
+        return 0.0
+    return sum(1 for (x, y) in zip(sig, other) if x == y) / float(len(sig))
+
+class _MinHash(object):
+    """
+    Keeps the MinHash signatures of the non-empty sets of a DictSet, and
+    an LSH index of their bands, up to date from its change events.
+    Added elements are merged into the signatures. Removed elements
+    can't be taken out of a minimum, so the keys that lose elements are
+    signed again when next queried, as are touched keys.
+    """
+    def __init__(self, ds, num_perm, bands, seed):
+        if bands < 1 or num_perm % bands:
+            raise ValueError('bands must divide num_perm')
+        self.ds = ds
+        self.params = _minhash_params(num_perm, seed)
+        self.rows = num_perm // bands
+        self.sigs = {}    # key -> signature
+        self.buckets = {} # (band, rows of a signature) -> keys
+        self.stale = set()
+        self.touched = set()
+        for (k, v) in dict.items(ds):
+            if len(v):
+                self._set(k, _minhash(v, self.params))
+
+    def _bands(self, sig):
+        r = self.rows
+        return [(i, sig[i:i + r]) for i in _xrange(0, len(sig), r)]
+
+    def _set(self, k, sig):
+        old = self.sigs.pop(k, None)
+        if old is not None:
+            for band in self._bands(old):
+                bucket = self.buckets[band]
+                bucket.discard(k)
+                if not bucket:
+                    del self.buckets[band]
+        if sig is not None:
+            self.sigs[k] = sig
+            for band in self._bands(sig):
+                bucket = self.buckets.get(band)
+                if bucket is None:
+                    bucket = self.buckets[band] = set()
+                bucket.add(k)
+
+    def __call__(self, events):
+        for (kind, k, elements) in events:
+            if kind == 'add':
+                if k not in self.stale and k not in self.touched:
+                    self._set(k, _minhash(elements, self.params,
+                                          self.sigs.get(k)))
+            elif kind == 'remove':
+                self.stale.add(k)
+            elif kind == 'touch':
+                self.touched.add(k)
+            elif kind == 'drop':
+                self.stale.discard(k)
+                self.touched.discard(k)
+                self._set(k, None)
+
+    def _refresh(self):
+        for k in self.stale | self.touched:
+            v = self.ds._peek(k)
+            self._set(k, _minhash(v, self.params) if len(v) else None)
+        self.stale.clear()
+        if self.touched:
+            self.touched = set(k for k in self.touched
+                               if not _released(self.ds, k))
+
+    def signature(self, k):
+        self._refresh()
+        return self.sigs.get(k)
+
+    def candidates(self, k):
+        self._refresh()
+        sig = self.sigs.get(k)
+        result = set()
+        if sig is not None:
+            for band in self._bands(sig):
+                result.update(self.buckets[band])
+            result.discard(k)
+        return result
+
+# for the Bloom filter methods
+#
+# A filter is a (number of bits, number of hashes, capacity, bits)
+# tuple sized for capacity elements. The i-th bit of an element is
+# (h1 + i*h2) mod the number of bits, with h1 and h2 the two halves of
+# its _bloom_hash. The filters are pickled with their DictSet, so that
+# hash must be the same in every process and equal for elements that
+# compare equal: numbers go by hash(), which is not salted and is the
+# same for equal ints, floats, Decimals and Fractions, strings and
+# bytes by a digest of their contents, tuples and frozensets by the
+# hashes of their members. Other elements have no such hash; a key
+# holding one is left unfiltered and they are never ruled out.
+_LN2 = math.log(2)
+
+# the numbers hash alike only on the same major version and word size
+_BLOOM_HASH = (sys.version_info[0], sys.maxsize)
+
+def _bloom_hash(e):
+    """a 64 bit hash of the element e for the filters, None if it has none"""
+    if isinstance(e, numbers.Number):
+        return _mix64(hash(e) & _MASK)
+    if isinstance(e, bytes) and bytes is str:
+        try: # 'a' == u'a' on Python 2
+            e = e.decode('ascii')
+        except UnicodeDecodeError:
+            pass
+    if isinstance(e, (bytes, type(u''))):
+        return _stable_hash64(e)
+    if isinstance(e, (tuple, frozenset)):
+        hashes = [_bloom_hash(item) for item in e]
+        if None in hashes:
+            return None
+        if isinstance(e, frozenset):
+            return _mix64((sum(hashes) + 1) & _MASK)
+        h = 2
+        for item in hashes:
+            h = _mix64((h * 31 + item) & _MASK)
+        return h
+    if e is None:
+        return 0
+    return None
+
+def _bloom_filter(elements, capacity, fp_rate):
+    """
+    a new filter of the elements for capacity elements, None if one of
+    them has no _bloom_hash
+    """
+    n = max(capacity, 1)
+    nbits = max(8, int(math.ceil(-n * math.log(fp_rate) / (_LN2 * _LN2))))
+    nhashes = max(1, int(round(nbits * _LN2 / n)))
+    f = (nbits, nhashes, n, bytearray((nbits + 7) // 8))
+    if not _bloom_add(f, elements):
+        return None
+    return f
+
+def _bloom_bits(f, h):
+    """the positions of the bits of the element hash h in the filter f"""
+    (nbits, nhashes) = f[:2]
+    (h1, h2) = (h & 0xFFFFFFFF, (h >> 32) | 1)
+    return [(h1 + i * h2) % nbits for i in _xrange(nhashes)]
+
+def _bloom_add(f, elements):
+    """adds the elements to the filter f, False if one has no _bloom_hash"""
+    bits = f[3]
+    for e in elements:
+        h = _bloom_hash(e)
+        if h is None:
+            return False
+        for i in _bloom_bits(f, h):
+            bits[i >> 3] |= 1 << (i & 7)
+    return True
+
+def _bloom_test(f, e):
+    """False if the element e was certainly not added to the filter f"""
+    h = _bloom_hash(e)
+    if h is None:
+        return True
+    bits = f[3]
+    for i in _bloom_bits(f, h):
+        if not bits[i >> 3] & (1 << (i & 7)):
+            return False
+    return True
+
+class _BloomFilters(object):
+    """
+    Keeps a Bloom filter of every non-empty set of a DictSet up to date
+    from its change events. A filter that outgrows its capacity is
+    made again for twice the size of the set. Removed elements stay in
+    the filters, which only raises the false positive rate until they
+    are rebuilt. Touched keys, and keys holding an element without a
+    _bloom_hash, are not filtered. filters is a pickled state, see
+    state().
+    """
+    def __init__(self, ds, fp_rate, filters=None):
+        if not 0 < fp_rate < 1:
+            raise ValueError('fp_rate must be in (0, 1)')
+        self.ds = ds
+        self.fp_rate = fp_rate
+        self.touched = set()
+        if filters is None:
+            self.rebuild()
+        else:
+            (bits, self.unfiltered) = filters
+            self.filters = dict((k, (nbits, nhashes, n, bytearray(b)))
+                                for (k, (nbits, nhashes, n, b)) in bits.items())
+
+    def rebuild(self):
+        self.filters = {}
+        self.unfiltered = set()
+        for (k, v) in dict.items(self.ds):
+            if len(v):
+                self._refilter(k, v, len(v))
+
+    def _refilter(self, k, v, capacity):
+        f = _bloom_filter(v, capacity, self.fp_rate)
+        if f is None:
+            self.filters.pop(k, None)
+            self.unfiltered.add(k)
+        else:
+            self.filters[k] = f
+            self.unfiltered.discard(k)
+
+    def __call__(self, events):
+        for (kind, k, elements) in events:
+            if kind == 'add':
+                if k in self.unfiltered:
+                    continue
+                f = self.filters.get(k)
+                v = self.ds._peek(k)
+                if f is None or len(v) > f[2]:
+                    self._refilter(k, v, 2 * len(v))
+                elif not _bloom_add(f, elements):
+                    self.filters.pop(k)
+                    self.unfiltered.add(k)
+            elif kind == 'touch':
+                self.touched.add(k)
+            elif kind == 'drop':
+                self.filters.pop(k, None)
+                self.unfiltered.discard(k)
+                self.touched.discard(k)
+
+    def _settle(self, k):
+        """
+        whether the touched key k can be filtered again, which it then
+        is
+        """
+        if not _released(self.ds, k):
+            return False
+        # the set can't change unseen any more, filter it again
+        self.touched.discard(k)
+        v = self.ds._peek(k)
+        self._refilter(k, v, 2 * len(v))
+        return True
+
+    def might_contain(self, k, e):
+        if k in self.touched and not self._settle(k):
+            return True
+        if k in self.unfiltered:
+            return True
+        f = self.filters.get(k)
+        return f is not None and _bloom_test(f, e)
+
+    def state(self):
+        """
+        the filters as plain bytes, with the touched keys filtered
+        again from their sets as they are now, the keys without a
+        filter and the _BLOOM_HASH they were made with
+        """
+        for k in list(self.touched):
+            if not self._settle(k):
+                v = self.ds._peek(k)
+                self._refilter(k, v, 2 * len(v))
+        bits = dict((k, (nbits, nhashes, n, bytes(b)))
+                    for (k, (nbits, nhashes, n, b)) in self.filters.items())
+        return (self.fp_rate, bits, set(self.unfiltered), _BLOOM_HASH)
+
+def _signature(E, k, params):
+    """
+    the MinHash signature of E[k] with params, from the signatures E
+    keeps if they have the same hash functions
+    """
+    index = E.__dict__.get('_minhash') if isinstance(E, DictSet) else None
+    if index is not None and index.params == params:
+        return index.signature(k)
+    v = _getter(E)(k)
+    return _minhash(v, params) if len(v) else None
+
+class _ContentHash(object):
+    """
+    Keeps an order independent hash of the contents of a DictSet up to
+    date from its change events.
+
+    Every key contributes a hash of the key and of the sum and number
+    of the hashes of its elements, and the total is the sum of the key
+    contributions modulo 2**64, so adding or removing elements only
+    changes the terms of their key. Empty keys don't contribute, like
+    they don't count for equality. Keys that were touched can have been
+    mutated directly and are rehashed when the value is read.
+    """
+    def __init__(self, ds, hash_element, hash_key, keys=None):
+        self.ds = ds
+        self.hash_element = hash_element
+        self.hash_key = hash_key
+        self.keys = {} # key -> (sum of element hashes, number of elements)
+        self.total = 0
+        self.dirty = set()
+        for k in list(dict.keys(ds) if keys is None else keys):
+            self._rehash(k)
+
+    def _term(self, k, state):
+        return _mix64((self.hash_key(k) + _mix64(state[0] ^ state[1])) & _MASK)
+
+    def _set(self, k, ksum, n):
+        old = self.keys.pop(k, None)
+        if old is not None:
+            self.total = (self.total - self._term(k, old)) & _MASK
+        if n:
+            state = self.keys[k] = (ksum & _MASK, n)
+            self.total = (self.total + self._term(k, state)) & _MASK
+
+    def _rehash(self, k):
+        v = self.ds._peek(k)
+        h = self.hash_element
+        self._set(k, sum(h(e) for e in v), len(v))
+
+    def __call__(self, events):
+        h = self.hash_element
+        for (kind, k, elements) in events:
+            if kind == 'touch':
+                self.dirty.add(k)
+            elif kind == 'drop':
+                self.dirty.discard(k)
+                self._set(k, 0, 0)
+            elif kind != 'create' and k not in self.dirty:
+                (ksum, n) = self.keys.get(k, (0, 0))
+                d = sum(h(e) for e in elements)
+                if kind == 'add':
+                    self._set(k, ksum + d, n + len(elements))
+                else:
+                    self._set(k, ksum - d, n - len(elements))
+
+    def key_value(self, k):
+        """the hash of the elements of key k, 0 for an empty set"""
+        if k in self.dirty:
+            self._rehash(k)
+            if _released(self.ds, k):
+                self.dirty.discard(k)
+        state = self.keys.get(k)
+        return 0 if state is None else self._term(k, state)
+
+    def value(self):
+        """the hash of the contents of the DictSet"""
+        if self.dirty:
+            for k in self.dirty:
+                self._rehash(k)
+            self.dirty = set(k for k in self.dirty
+                             if not _released(self.ds, k))
+        return self.total
+
 
 class DictSet(dict):
     """A dictionary of sets that behaves like a set."""
+
+    # sets with at most inline_max elements are stored as tuples,
+    # 0 disables inline storage (see CompactDictSet)
+    inline_max = 0
+
+    # when True new sets are stored as shared frozensets, one per
+    # distinct set (see InterningDictSet)
+    interning = False
+
+    # change trackers and the events of the running batch, set per
+    # instance (see _add_tracker and batch)
+    _trackers = ()
+    _pending = None
+
+    # instance attributes that belong to this DictSet only and are not
+    # copied or pickled with it
+    _transient = ('_trackers', '_pending', '_fingerprint', '_digest',
+                  '_size_index', '_closure', '_minhash', '_bloom',
+                  '_promoted', '_promoted_limit')
+
+    # the number of keys DS[k] switched to private sets (see _promote)
+    # that make DS store the released ones compactly again
+    _promoted_limit = 64
+
     def __init__(*args, **kwds): # args[0] -> 'self'
         """
             DictSet() -> new empty dictionary of sets
@@ -150,29 +1187,277 @@ class DictSet(dict):
         # At this point we can be fairly certain the args and kwds 
         # will successfully initialize. Now we can go back through
         # args and kwds and add them to ds
-        if len(args) == 2:
-            obj = args[1]
+        with args[0].batch():
+            if len(args) == 2:
+                obj = args[1]
 
-            # obj is dict or dict subclass
-            if hasattr(obj, 'keys'):
-                for k, val in obj.items():
-                    if not k in args[0].keys():
-                        args[0][k] = set(val)
-                    args[0][k] |= set(val)
+                # obj is dict or dict subclass
+                if hasattr(obj, 'keys'):
+                    for k, val in obj.items():
+                        args[0]._key_update(k, 'update', val, False)
+
+                # obj is list/tuple or list/tuple subclass
+                else:
+                    for item in obj:
+                        (k, val) = item
+                        args[0]._key_update(k, 'update', val, False)
 
-            # obj is list/tuple or list/tuple subclass
+            # Now add keyword arguments
+            for (k, val) in kwds.items():
+                args[0]._key_update(k, 'update', val, False)
+
+    # All of the methods that change the set of a key go through
+    # _store and _key_update so storage policies (see CompactDictSet)
+    # are applied in one place.
+    def _peek(self, k):
+        """
+        Returns the stored elements of DS[k] without copying them,
+        an empty frozenset if k is not a key. The result can be a
+        set, frozenset or tuple and must not be mutated.
+        """
+        return dict.get(self, k, _empty)
+
+    def _new(self):
+        """Returns an empty DictSet of the same class as DS."""
+        return self.__class__.__new__(self.__class__)
+
+    def _store(self, k, s, intern=True):
+        """
+        Stores the new set s at DS[k], inline if s is small enough or
+        interned if DS is interning and intern is True.
+        """
+        if self.inline_max and len(s) <= self.inline_max:
+            dict.__setitem__(self, k, tuple(s))
+        elif intern and self.interning:
+            dict.__setitem__(self, k, self._intern(s))
+        else:
+            dict.__setitem__(self, k, s)
+
+    def _intern(self, s):
+        """Returns the shared frozenset equal to s from the pool of DS."""
+        f = s if type(s) is frozenset else frozenset(s)
+        pool = self.__dict__.get('_pool')
+        if pool is None:
+            pool = self._pool = {}
+        return pool.setdefault(f, f)
+
+    def _mutable(self, k):
+        """
+        Returns the set stored at DS[k], first replacing an inline
+        value with a set. Creates an empty set if k is not a key.
+        """
+        v = dict.get(self, k)
+        if isinstance(v, set):
+            return v
+        s = set(() if v is None else v)
+        dict.__setitem__(self, k, s)
+        return s
+
+    def _promote(self, k):
+        """
+        Returns the set of DS[k] to hand out, switching an inline or
+        shared value to a private set. When a storage policy applies
+        (inline_max or interning) the key is remembered, and once
+        _promoted_limit keys are, the ones whose sets are no longer held
+        outside DS are stored compactly again, so reading keys doesn't
+        undo the policy for good.
+        """
+        s = self._mutable(k)
+        if self.inline_max or self.interning:
+            promoted = self.__dict__.get('_promoted')
+            if promoted is None:
+                promoted = self._promoted = set()
+            promoted.add(k)
+            if len(promoted) >= self._promoted_limit:
+                self._restore_promoted()
+        return s
+
+    def _restore_promoted(self):
+        """stores the promoted keys whose sets were released with _store"""
+        kept = set()
+        for k in self.__dict__.pop('_promoted', ()):
+            if not isinstance(dict.get(self, k), set):
+                continue # deleted or stored compactly since
+            if _released(self, k):
+                self._store(k, dict.get(self, k))
             else:
-                for item in obj:
-                    (k, val) = item
-                    if not k in args[0].keys():
-                        args[0][k] = set(val)
-                    args[0][k] |= set(val)
+                kept.add(k)
+        self._promoted = kept
+        # at least doubles, so restoring is amortized O(1) per read
+        self._promoted_limit = max(DictSet._promoted_limit, 2 * len(kept))
 
-        # Now add keyword arguments
-        for (k, val) in kwds.items():
-            if not k in args[0].keys():
-                args[0][k] = set(val)
-            args[0][k] |= set(val)
+    def _key_update(self, k, method, elements, drop_empty=True):
+        """
+        Applies the set method (e.g. 'update', 'difference_update') to
+        DS[k] with elements. When drop_empty is True a key left with an
+        empty set is deleted, otherwise a missing k is created.
+        """
+        if self._trackers:
+            self._tracked_key_update(k, method, elements, drop_empty)
+        else:
+            self._apply_key_update(k, method, elements, drop_empty)
+
+    def _apply_key_update(self, k, method, elements, drop_empty):
+        """_key_update without emitting the changes"""
+        v = dict.get(self, k)
+        if isinstance(v, set):
+            getattr(v, method)(elements)
+            if drop_empty and not v:
+                dict.__delitem__(self, k)
+            return
+
+        # k is missing or holds an inline or shared value. The new set
+        # isn't referenced anywhere else so it can be stored in any form.
+        if v is None and method == 'update':
+            # built like DS[k] = set(E[k]); DS[k] |= set(E[k]) always
+            # was, the resize of the merge sets the iteration order
+            s = set(elements)
+            s |= set(s)
+        else:
+            s = set(() if v is None else v)
+            getattr(s, method)(elements)
+        if isinstance(v, frozenset) and s == v:
+            return # unchanged, keep sharing v
+
+        if s or not drop_empty:
+            # a key that was just unshared keeps its private set, so
+            # the next mutation doesn't have to copy it again
+            self._store(k, s, not isinstance(v, frozenset))
+        elif v is not None:
+            dict.__delitem__(self, k)
+
+    def _tracked_key_update(self, k, method, elements, drop_empty):
+        """_key_update for a tracked DS, emits the changes to DS[k]"""
+        v = dict.get(self, k)
+        cur = _empty if v is None else _as_set(v)
+        added = removed = _empty
+        if method == 'add':
+            if elements not in cur:
+                added = frozenset((elements,))
+        elif method in ('remove', 'discard'):
+            if elements in cur:
+                removed = frozenset((elements,))
+        else:
+            # elements can be an iterator, so the copy is what's applied
+            elements = _as_set(elements)
+            if method in ('update', 'symmetric_difference_update'):
+                added = elements - cur
+            if method in ('difference_update', 'symmetric_difference_update'):
+                removed = elements & cur
+            elif method == 'intersection_update':
+                removed = cur - elements
+
+        self._apply_key_update(k, method, elements, drop_empty)
+
+        events = []
+        present = dict.__contains__(self, k)
+        if v is None and present:
+            events.append(('create', k, _empty))
+        if added:
+            events.append(('add', k, _freeze(added)))
+        if removed:
+            events.append(('remove', k, _freeze(removed)))
+        if v is not None and not present:
+            events.append(('drop', k, _empty))
+        if events:
+            self._emit(events)
+
+    def _emit(self, events):
+        """
+        Delivers events to the trackers. Trackers with a true deferred
+        attribute (the subscribers) get them when the batch ends.
+        """
+        pending = self._pending
+        for tracker in list(self._trackers):
+            if pending is None or not getattr(tracker, 'deferred', False):
+                tracker(events)
+        if pending is not None:
+            pending.extend(events)
+
+    @contextmanager
+    def batch(self):
+        """
+        with DS.batch(): ... Queues the change events of the mutations
+        made in the with block and delivers them to the subscribers of
+        DS in a single call when the block exits (see subscribe).
+
+        update, apply and the *_update methods are batched this way.
+        Batches can be nested, the outermost one delivers the events.
+        """
+        if not self._trackers or self._pending is not None:
+            yield
+            return
+        self._pending = []
+        try:
+            yield
+        finally:
+            (events, self._pending) = (self._pending, None)
+            if events:
+                for tracker in list(self._trackers):
+                    if getattr(tracker, 'deferred', False):
+                        tracker(events)
+
+    def _add_tracker(self, tracker):
+        """Attaches tracker, a callable taking lists of events, to DS."""
+        if not self._trackers:
+            self._trackers = []
+        self._trackers.append(tracker)
+
+    def _remove_tracker(self, tracker):
+        """Detaches tracker from DS."""
+        self._trackers.remove(tracker)
+        if not self._trackers:
+            del self._trackers
+
+    def _replaced(self, k, old, touch=False):
+        """
+        Emits the changes from replacing the value old of DS[k] (None
+        if k was missing) with the value now stored.
+        """
+        new = dict.get(self, k)
+        if old is None:
+            events = [('create', k, _empty)]
+            if new:
+                events.append(('add', k, _freeze(new)))
+        else:
+            (old, cur) = (_as_set(old), _as_set(new))
+            events = []
+            if cur - old:
+                events.append(('add', k, _freeze(cur - old)))
+            if old - cur:
+                events.append(('remove', k, _freeze(old - cur)))
+        if touch:
+            events.append(('touch', k, _empty))
+        if events:
+            self._emit(events)
+
+    def __getstate__(self):
+        """
+        leaves out the trackers, they belong to this instance only, but
+        keeps the Bloom filters (see enable_bloom)
+        """
+        state = dict((name, value) for (name, value) in self.__dict__.items()
+                     if name not in self._transient)
+        bloom = self.__dict__.get('_bloom')
+        if bloom is not None:
+            state['_bloom'] = bloom.state()
+        return state
+
+    def __setstate__(self, state):
+        """restores the state of __getstate__"""
+        state = dict(state)
+        bloom = state.pop('_bloom', None)
+        self.__dict__.update(state)
+        if bloom is None:
+            return
+        (fp_rate, bits, unfiltered, tag) = bloom
+        if tag != _BLOOM_HASH:
+            # the numbers hash differently here, make the filters again
+            # from the items, which are restored by now
+            self.enable_bloom(fp_rate)
+            return
+        self._bloom = _BloomFilters(self, fp_rate, (bits, unfiltered))
+        self._add_tracker(self._bloom)
 
     def __ior__(self, E): # overloads |=
         """
@@ -194,10 +1479,8 @@ class DictSet(dict):
 
         DS|=E  <==> DS.update(E)
         """
-        if not isinstance(E, DictSet):
-            E = DictSet(copy(E))
-            
-        return self.union(E)
+        self.update(E)
+        return self
     
     def __eq__(self, E): # overloads ==
         """
@@ -207,27 +1490,45 @@ class DictSet(dict):
 
         DS==E  <==> DS.__eq__(E)
         """
+        # unequal fingerprints settle it without looking at the sets.
+        # Digests can't, equal elements of different types (1 and
+        # Decimal(1)) needn't have equal digests, but they do hash alike
+        if self.__dict__ and isinstance(E, DictSet):
+            (h, other) = (self.__dict__.get('_fingerprint'),
+                          E.__dict__.get('_fingerprint'))
+            if h is not None and other is not None and \
+               h.value() != other.value():
+                return False
+
         # Fails of d is not mappable with iterable values
         try:
-            E = DictSet(E)
+            E = _as_mapping(E)
+            get = _getter(E)
+
+            # compare the non-empty sets of DS with the same keys in E,
+            # stopping at the first difference
+            n = 0
+            for (k, v) in _items(self):
+                if not len(v):
+                    continue
+                w = get(k)
+                if isinstance(w, (set, frozenset)):
+                    if len(v) != len(w) or not w.issuperset(v):
+                        return False
+                elif _as_set(v) != frozenset(w):
+                    return False
+                n += 1
+
+            # E can only have more non-empty keys than DS
+            for (k, w) in _items(E):
+                if len(w):
+                    n -= 1
+                    if n < 0:
+                        return False
+            return True
         except:
             return False
 
-        # check to see if self and E have the same keys
-        # if they don't we know they aren't equal and
-        # can return False
-        if len(set(k for (k, v) in self.items() if len(v) != 0)  ^
-               set(k for (k, v) in    E.items() if len(v) != 0)) > 0:
-            return False
-
-        # at this point we know they have the same keys
-        # if all the non-empty set differences have 0 cardinality
-        # the sets are equal
-        s = 0
-        for k in self.keys():
-            s += len(self.get(k, []) ^ E.get(k, []))
-        return s == 0
-
     def __ne__(self, E): # overloads !=
         """
         Returns the non-equality comparison of ES with E type
@@ -236,45 +1537,487 @@ class DictSet(dict):
 
         DS==E  <==> DS.__ne__(E)
         """
-        # Fails of d is not mappable with iterable values
+        return not self == E
+
+    def enable_fingerprint(self):
+        """
+        DS.enable_fingerprint() -> None. Starts keeping the content
+        fingerprint of DS up to date as DS changes.
+
+        Comparing two DictSets that both keep a fingerprint returns
+        False in O(1) when the fingerprints differ. Sets handed out by
+        DS[k] are rehashed when the fingerprint is read, because they
+        can be changed without DS seeing it.
+        """
+        if '_fingerprint' not in self.__dict__:
+            self._fingerprint = _ContentHash(self, _hash64, _hash64)
+            self._add_tracker(self._fingerprint)
+
+    def disable_fingerprint(self):
+        """DS.disable_fingerprint() -> None. Stops keeping the fingerprint."""
+        fp = self.__dict__.pop('_fingerprint', None)
+        if fp is not None:
+            self._remove_tracker(fp)
+
+    def fingerprint(self):
+        """
+        DS.fingerprint() -> int. An order independent 64 bit hash of the
+        non-empty sets of DS, equal for equal DictSets.
+
+        The value is kept up to date after enable_fingerprint(),
+        otherwise it is computed from the sets. Like hash() it is only
+        meaningful within one process.
+        """
+        fp = self.__dict__.get('_fingerprint')
+        if fp is None:
+            fp = _ContentHash(self, _hash64, _hash64)
+        return fp.value()
+
+    def enable_digest(self):
+        """
+        DS.enable_digest() -> None. Starts keeping the content digest
+        of DS and of its keys up to date as DS changes.
+
+        add, discard, update, ... only rehash the elements they add or
+        remove. Sets handed out by DS[k] are rehashed when a digest is
+        read, because they can be changed without DS seeing it.
+        """
+        if '_digest' not in self.__dict__:
+            self._digest = _ContentHash(self, _stable_hash64, _stable_hash64)
+            self._add_tracker(self._digest)
+
+    def disable_digest(self):
+        """DS.disable_digest() -> None. Stops keeping the digests."""
+        h = self.__dict__.pop('_digest', None)
+        if h is not None:
+            self._remove_tracker(h)
+
+    def digest(self):
+        """
+        DS.digest() -> str. An order independent 64 bit digest of the
+        non-empty sets of DS as 16 hex digits, equal for equal DictSets.
+
+        Unlike fingerprint() the digest is the same in every process
+        and on every host for keys and elements that are numbers,
+        strings, bytes or tuples and frozensets of those, so it can be
+        used as a cache key or to compare DictSets held elsewhere. The
+        value is kept up to date after enable_digest(), otherwise it is
+        computed from the sets.
+        """
+        h = self.__dict__.get('_digest')
+        if h is None:
+            h = _ContentHash(self, _stable_hash64, _stable_hash64)
+        return '%016x' % h.value()
+
+    def key_digest(self, k):
+        """
+        DS.key_digest(k) -> str. The digest of k and the elements of
+        DS[k] as 16 hex digits, the same in every process. An empty or
+        missing key has the digest '0000000000000000'. DS.digest() is
+        the sum of the key digests modulo 2**64.
+        """
+        h = self.__dict__.get('_digest')
+        if h is None:
+            h = _ContentHash(self, _stable_hash64, _stable_hash64, [k])
+        return '%016x' % h.key_value(k)
+
+    def diff(self, E):
+        """
+        DS.diff(E) -> Delta of the elements added to and removed from
+        the sets of DS to get E, so that DS.apply(DS.diff(E)) == E.
+
+        When both DS and E keep a digest (see enable_digest) equal
+        DictSets are recognized in O(1) and only the keys with unequal
+        key digests have their sets compared.
+        """
+        if not isinstance(E, DictSet):
+            E = DictSet(copy(E))
+
+        delta = Delta()
+        for k in self._changed_keys(E):
+            (v, w) = (_as_set(self._peek(k)), _as_set(E._peek(k)))
+            (added, removed) = (w - v, v - w)
+            if added or removed:
+                delta[k] = (_freeze(added), _freeze(removed))
+        return delta
+
+    def subscribe(self, callback, batched=True):
+        """
+        DS.subscribe(callback[, batched]) -> callback. Reports the
+        changes made to DS to callback until DS.unsubscribe(callback).
+
+        Changes are reported as (kind, key, elements) events, where
+        kind is one of
+
+            'create'  key was added, with an empty set
+            'add'     the elements were added to the set of key
+            'remove'  the elements were removed from the set of key
+            'drop'    key was deleted, after a 'remove' of its elements
+
+        and elements is a frozenset (empty for 'create' and 'drop').
+        Only actual changes are reported, adding an element that is
+        already in a set doesn't make an event.
+
+        When batched is True callback(events) gets a list of events
+        per mutation and one list for update, apply, the *_update
+        methods and the with DS.batch() block. Otherwise callback is
+        called as callback(kind, key, elements) for every event.
+
+        Elements added to or removed from a set obtained with DS[k]
+        directly (DS[k].add(v) instead of DS.add(k, v)) are not seen
+        by DS and are not reported.
+        """
+        self._add_tracker(_Subscription(callback, batched))
+        return callback
+
+    def unsubscribe(self, callback):
+        """
+        DS.unsubscribe(callback) -> None. Stops reporting the changes of
+        DS to callback. Raises ValueError if callback isn't subscribed.
+        """
+        for tracker in self._trackers:
+            if isinstance(tracker, _Subscription) and \
+               tracker.callback == callback:
+                self._remove_tracker(tracker)
+                return
+        raise ValueError('callback is not subscribed')
+
+    def enable_size_index(self):
+        """
+        DS.enable_size_index() -> None. Starts keeping an index of the
+        keys of DS by the sizes of their sets, so top_k, keys_with_size
+        and total_elements don't have to scan DS.
+        """
+        if '_size_index' not in self.__dict__:
+            self._size_index = _SizeIndex(self)
+            self._add_tracker(self._size_index)
+
+    def disable_size_index(self):
+        """DS.disable_size_index() -> None. Stops keeping the size index."""
+        index = self.__dict__.pop('_size_index', None)
+        if index is not None:
+            self._remove_tracker(index)
+
+    def top_k(self, n):
+        """
+        DS.top_k(n) -> list of the (key, size) pairs of the n keys with
+        the largest sets, largest first. Keys with sets of equal size
+        are in arbitrary order.
+        """
+        index = self.__dict__.get('_size_index')
+        if index is not None:
+            return index.top_k(n)
+        return heapq.nlargest(n, ((k, len(v)) for (k, v) in dict.items(self)
+                                                if len(v)),
+                              key=lambda item: item[1])
+
+    def keys_with_size(self, lo, hi=None):
+        """
+        DS.keys_with_size(lo[, hi]) -> list of the keys whose sets have
+        at least lo and at most hi elements (no upper limit if hi is
+        None). Keys with empty sets are never included.
+        """
+        index = self.__dict__.get('_size_index')
+        if index is not None:
+            return index.keys_with_size(lo, hi)
+        return [k for (k, v) in dict.items(self)
+                if len(v) and lo <= len(v) and (hi is None or len(v) <= hi)]
+
+    def total_elements(self):
+        """
+        DS.total_elements() -> the sum of the sizes of the sets of DS,
+        O(1) when the size index is kept (see enable_size_index).
+        """
+        index = self.__dict__.get('_size_index')
+        if index is not None:
+            index._refresh()
+            return index.total
+        return sum(len(v) for v in dict.values(self))
+
+    def reachable_from(self, k):
+        """
+        DS.reachable_from(k) -> set of the nodes that can be reached
+        from k, treating DS as a graph with an edge from every key k to
+        each element of DS[k]. k itself is only included if it is on a
+        cycle.
+
+        Uses the bitsets kept by enable_closure() if they are, else
+        searches the graph from k.
+        """
+        closure = self.__dict__.get('_closure')
+        if closure is not None:
+            (index, nodes, reach) = closure.bits()
+            i = index.get(k)
+            if i is None:
+                return set()
+            return set(nodes[j] for j in _bit_indices(reach[i]))
+
+        get = dict.get
+        seen = set()
+        stack = list(get(self, k, ()))
+        while stack:
+            x = stack.pop()
+            if x not in seen:
+                seen.add(x)
+                stack.extend(get(self, x, ()))
+        return seen
+
+    def transitive_closure(self):
+        """
+        DS.transitive_closure() -> DictSet mapping every node of DS (see
+        reachable_from) to the set of nodes reachable from it.
+
+        The nodes are numbered and their reach is computed as big-int
+        bitsets, one strongly connected component at a time in reverse
+        topological order, so every component is visited once. Nodes
+        of a component share their set of the result until it is
+        changed.
+        """
+        closure = self.__dict__.get('_closure')
+        if closure is not None:
+            (index, nodes, reach) = closure.bits()
+        else:
+            (index, nodes, reach) = _closure_bits(self)
+
+        result = self._new()
+        decoded = {}
+        for (i, bits) in enumerate(reach):
+            if bits:
+                s = decoded.get(bits)
+                if s is None:
+                    s = decoded[bits] = \
+                        frozenset(nodes[j] for j in _bit_indices(bits))
+                result._store(nodes[i], s)
+        return result
+
+    def enable_closure(self):
+        """
+        DS.enable_closure() -> None. Starts keeping the reachability
+        bitsets of reachable_from and transitive_closure up to date.
+
+        Added edges update the bitsets incrementally, in time linear
+        in the number of nodes. Removing elements, or handing out a set
+        with DS[k], makes them be recomputed on the next query.
+        """
+        if '_closure' not in self.__dict__:
+            self._closure = _Reachability(self)
+            self._add_tracker(self._closure)
+
+    def disable_closure(self):
+        """DS.disable_closure() -> None. Stops keeping the bitsets."""
+        closure = self.__dict__.pop('_closure', None)
+        if closure is not None:
+            self._remove_tracker(closure)
+
+    # the signatures used when DS doesn't keep any
+    _minhash_defaults = dict(num_perm=128, bands=32, seed=1)
+
+    def enable_minhash(self, num_perm=128, bands=32, seed=1):
+        """
+        DS.enable_minhash([num_perm[, bands[, seed]]]) -> None. Starts
+        keeping a MinHash signature of num_perm hashes for every set of
+        DS, and an LSH index of the signatures cut into bands of
+        num_perm/bands hashes, for minhash, estimate_jaccard and
+        similar_keys. Raises ValueError if bands doesn't divide
+        num_perm.
+
+        Keys whose signatures agree on a whole band are candidates for
+        each other. More, shorter bands find less similar keys. With
+        the defaults a pair with a Jaccard similarity of 0.5 is found
+        with a probability of about 0.87 and one of 0.2 with 0.05.
+
+        Added elements are merged into the signatures as they come.
+        Removing elements, or handing out a set with DS[k], makes the
+        signature of the key be computed again on the next query.
+        Signatures are only comparable between DictSets that use the
+        same num_perm and seed.
+        """
+        index = _MinHash(self, num_perm, bands, seed)
+        self.disable_minhash()
+        self._minhash = index
+        self._add_tracker(index)
+
+    def disable_minhash(self):
+        """DS.disable_minhash() -> None. Stops keeping the signatures."""
+        index = self.__dict__.pop('_minhash', None)
+        if index is not None:
+            self._remove_tracker(index)
+
+    def _minhash_index(self):
+        """the _MinHash kept by DS, or a throwaway one over all of DS"""
+        index = self.__dict__.get('_minhash')
+        if index is None:
+            index = _MinHash(self, **self._minhash_defaults)
+        return index
+
+    def _minhash_params(self):
+        """the hash functions of the signatures of DS"""
+        index = self.__dict__.get('_minhash')
+        if index is not None:
+            return index.params
+        return _minhash_params(self._minhash_defaults['num_perm'],
+                               self._minhash_defaults['seed'])
+
+    def minhash(self, k):
+        """
+        DS.minhash(k) -> tuple, the MinHash signature of DS[k], None if
+        k isn't a key or its set is empty. Without enable_minhash the
+        signature is computed with the default parameters.
+        """
+        return _signature(self, k, self._minhash_params())
+
+    def estimate_jaccard(self, k, j, E=None):
+        """
+        DS.estimate_jaccard(k, j[, E]) -> the estimated Jaccard
+        similarity of DS[k] and E[j] (DS[j] if E is None), the fraction
+        of the hashes of their MinHash signatures that agree. 0.0 if
+        either set is empty.
+
+        The signatures kept by DS and E are used when they have the
+        hash functions of DS, the others are computed.
+        """
+        params = self._minhash_params()
+        if E is None:
+            E = self
+        return _agreement(_signature(self, k, params),
+                          _signature(E, j, params))
+
+    def similar_keys(self, k, threshold=None):
+        """
+        DS.similar_keys(k[, threshold]) -> set of the other keys of DS
+        whose signatures agree with the one of DS[k] on at least one
+        band (see enable_minhash). With a threshold only the keys with
+        an estimate_jaccard of at least threshold are kept.
+
+        With enable_minhash this looks up the bands of k in the LSH
+        index, else all the signatures are computed.
+        """
+        index = self._minhash_index()
+        result = index.candidates(k)
+        if threshold is not None:
+            sig = index.signature(k)
+            result = set(j for j in result
+                         if _agreement(sig, index.sigs[j]) >= threshold)
+        return result
+
+    def enable_bloom(self, fp_rate=0.01):
+        """
+        DS.enable_bloom([fp_rate]) -> None. Starts keeping a Bloom filter
+        of every set of DS, sized for a false positive rate of fp_rate,
+        so contains(k, v) can answer most misses without looking at
+        DS[k]. That pays off when reading the sets is expensive, e.g.
+        in a subclass whose _peek loads them from disk.
+
+        The filters follow the mutations of DS. Removed elements stay in
+        them until rebuild_bloom, and keys whose sets were handed out
+        with DS[k] are not filtered. The filters are pickled with DS;
+        they are made again only when it is unpickled by a Python of
+        another major version or word size. Elements other than
+        numbers, strings, bytes, None and tuples or frozensets of these
+        are never ruled out, nor are the other elements of their key.
+        """
+        bloom = _BloomFilters(self, fp_rate)
+        self.disable_bloom()
+        self._bloom = bloom
+        self._add_tracker(bloom)
+
+    def disable_bloom(self):
+        """DS.disable_bloom() -> None. Stops keeping the Bloom filters."""
+        bloom = self.__dict__.pop('_bloom', None)
+        if bloom is not None:
+            self._remove_tracker(bloom)
+
+    def rebuild_bloom(self):
+        """
+        DS.rebuild_bloom() -> None. Makes all the Bloom filters again
+        from the sets of DS, sized for their current sizes, which drops
+        the removed elements.
+        """
+        bloom = self.__dict__.get('_bloom')
+        if bloom is not None:
+            bloom.rebuild()
+
+    def contains(self, k, v):
+        """
+        DS.contains(k, v) -> True if v is an element of DS[k], else
+        False. With enable_bloom DS[k] is only read if its filter may
+        hold v.
+        """
+        bloom = self.__dict__.get('_bloom')
+        if bloom is not None and not bloom.might_contain(k, v):
+            return False
+        return v in self._peek(k)
+
+    @contextmanager
+    def transaction(self):
+        """
+        with DS.transaction(): ... Undoes the changes made to DS in the
+        with block if it raises an exception.
+
+        Only the changes are recorded, the keys and elements added or
+        removed and a copy of the sets handed out by DS[k] or stored
+        by DS[k] = v, so undoing takes time proportional to the changes
+        instead of the size of DS. Undoing restores the elements of the
+        keys, sets stored or handed out in the block are updated in
+        place. Subscribers are told about the undone changes like
+        about any other change. Transactions can be nested.
+        """
+        log = _UndoLog(self)
+        self._add_tracker(log)
         try:
-            E = DictSet(E)
-        except:
-            return True
+            yield
+        except BaseException:
+            self._remove_tracker(log)
+            log.rollback()
+            raise
+        self._remove_tracker(log)
 
-        # check to see if self and d have the same keys
-        # if they don't we know they aren't equal and
-        # can return False
-        if len(set(k for (k, v) in self.items() if len(v) != 0)  ^
-               set(k for (k, v) in    E.items() if len(v) != 0)) > 0:
-            return True
+    def _changed_keys(self, E):
+        """the keys whose sets can differ between DS and the DictSet E"""
+        (h, other) = (self.__dict__.get('_digest'), E.__dict__.get('_digest'))
+        if h is None or other is None:
+            return set(dict.keys(self)) | set(dict.keys(E))
+
+        if h.value() == other.value():
+            return ()
+        (a, b) = (h.keys, other.keys)
+        return [k for k in a if a[k] != b.get(k)] + [k for k in b if k not in a]
+
+    def apply(self, delta):
+        """
+        DS.apply(delta) -> None. Adds and removes the elements of delta,
+        a Delta or a mapping of keys to (added, removed) pairs of
+        iterables, in place. Keys left with empty sets are deleted.
+        """
+        with self.batch():
+            for (k, (added, removed)) in delta.items():
+                if added:
+                    self._key_update(k, 'update', added, False)
+                if removed:
+                    self._key_update(k, 'difference_update', removed)
 
-        # at this point we know they have the same keys
-        # if all the set differences have 0 cardinality
-        # the sets are equal
-        s = 0
-        for k in self.keys():
-            s += len(self.get(k, []) ^ E.get(k, []))
-        return s != 0
-        
     def issubset(self, E):
         """
         Report whether all the sets of this DictSet are subsets of the E.
 
+        Returns as soon as a key fails. E can be a DictSet, a dict of
+        iterables (used as they are) or an iterable of (key, value)
+        pairs.
+
         DS<=E  <==> DS.issubset(E)
         """
-        if not isinstance(E, DictSet):
-            E = DictSet(copy(E))
-            
-        if self == E == {}:
-            return True
-
-        b = True
-        for k in set(self) | set(E):
-            if not self.get(k, []) <= E.get(k, []):
-                b = False
-            
-        return b
+        get = _getter(_as_mapping(E))
+        for (k, v) in _items(self):
+            if not v:
+                continue
+
+            w = get(k)
+            # compare the sizes before looking at any elements
+            if isinstance(w, (set, frozenset)) and len(v) > len(w):
+                return False
+            if not _as_set(v).issubset(w):
+                return False
+        return True
 
     def __le__(self, E): # overloads <=
         """
@@ -284,24 +2027,38 @@ class DictSet(dict):
         """        
         return self.issubset(E)
 
+    def __lt__(self, E): # overloads <
+        """
+        Report whether all the sets of this DictSet are subsets of the E
+        and DS != E.
+
+        DS<E  <==> DS.issubset(E) and DS!=E
+        """
+        E = _as_mapping(E)
+        return self.issubset(E) and self != E
+
     def issuperset(self, E):
         """
         Report whether all the sets of this DictSet are supersets of the E.
 
+        Returns as soon as a key fails. E can be a DictSet, a dict of
+        iterables (used as they are) or an iterable of (key, value)
+        pairs.
+
         DS>=E  <==> DS.issuperset(E)
         """        
-        if not isinstance(E, DictSet):
-            E = DictSet(copy(E))
-            
-        if self == E == {}:
-            return True
-
-        b = True
-        for k in set(self) | set(E):
-            if not self.get(k, []) >= E.get(k, []):
-                b = False
-            
-        return b
+        E = _as_mapping(E)
+        for (k, w) in _items(E):
+            if not w:
+                continue
+
+            v = self._peek(k)
+            # compare the sizes before looking at any elements
+            if isinstance(w, (set, frozenset)) and len(w) > len(v):
+                return False
+            if not _as_set(v).issuperset(w):
+                return False
+        return True
     
     def __ge__(self, E): # overloads >=
         """
@@ -310,25 +2067,57 @@ class DictSet(dict):
         DS>=E  <==> DS.issuperset(E)
         """        
         return self.issuperset(E)
+
+    def __gt__(self, E): # overloads >
+        """
+        Report whether all the sets of this DictSet are supersets of the E
+        and DS != E.
+
+        DS>E  <==> DS.issuperset(E) and DS!=E
+        """
+        E = _as_mapping(E)
+        return self.issuperset(E) and self != E
+
+    def isdisjoint(self, E):
+        """
+        Report whether the sets of this DictSet have no elements in
+        common with the sets of E under the same key.
+
+        Returns as soon as a key fails and only visits the keys of the
+        smaller of DS and E.
+        """
+        E = _as_mapping(E)
+        if len(E) < len(self):
+            for (k, w) in _items(E):
+                v = self._peek(k)
+                if v and not _as_set(v).isdisjoint(w):
+                    return False
+        else:
+            get = _getter(E)
+            for (k, v) in _items(self):
+                if v and not _as_set(v).isdisjoint(get(k)):
+                    return False
+        return True
         
-    def union(self, E):
+    def union(self, E, keys=None):
         """
         Return the union of the sets of self with the sets of E.
         
         (i.e. all elements that are in either sets of the DictSets.)
 
+        Only the keys of E are combined, the sets of the other keys of
+        DS are taken over as they are. With keys only the sets of those
+        keys are combined instead, the result still has the other keys.
+
         DS|E  <==> DS.union(E)
         """        
-        if not isinstance(E, DictSet):
-            E = DictSet(copy(E))
-            
-        foo = deepcopy(self)
-        for k in set(foo.keys()) | set(E.keys()):
-            foo.setdefault(k, [])
-            foo[k].update(E.get(k, []))
-            if not foo[k]:
-                del foo[k] # delete if empty set
+        E = _as_dictset(E)
+        if keys is not None:
+            return _scoped(self, 'update', E, keys)
 
+        foo = self._new()
+        _share_sets(foo, self, lambda k: len(E._peek(k)))
+        _combine(foo, self, 'update', E, E)
         return foo
 
     def __or__(self, E): # overloads |
@@ -341,29 +2130,28 @@ class DictSet(dict):
         """    
         return self.union(E)
 
-    def intersection(self, E):
+    def intersection(self, E, keys=None):
         """
         Return the intersection of the sets of self with the sets of E.
         
         (i.e. elements that are common to all of the sets of the
          DictSets.)
 
+        Only the keys of the smaller of DS and E are visited. With keys
+        only the sets of those keys are intersected and the sets of the
+        other keys of DS are taken over as they are, like with
+        DS.intersection_update(E, keys=keys).
+
         DS&E  <==> DS.intersection(E)
         """           
-        if not isinstance(E, DictSet):
-            E = DictSet(copy(E))
-
-        # handle case where d=={}
-        if E == {}:
-            return DictSet()
-        
-        foo = deepcopy(self)
-        for k in set(foo.keys()) | set(E.keys()):
-            foo.setdefault(k, [])
-            foo[k].intersection_update(E.get(k, []))
-            if not foo[k]:
-                del foo[k] # delete if empty set
-
+        E = _as_dictset(E)
+        if keys is not None:
+            return _scoped(self, 'intersection_update', E, keys)
+
+        # only the keys in both DictSets can have elements in common
+        foo = self._new()
+        _combine(foo, self, 'intersection_update', E,
+                 E if len(E) < len(self) else self)
         return foo
 
     def __and__(self, E): # overloads &
@@ -377,25 +2165,26 @@ class DictSet(dict):
         """   
         return self.intersection(E)
 
-    def difference(self, E):
+    def difference(self, E, keys=None):
         """
         Return the difference of the sets of self with the sets of E.
         
         (i.e. all elements that are in the sets of this DictSet but
          not the others.)
 
+        The sets of the keys of DS that aren't in E are taken over as
+        they are. With keys only the sets of those keys are combined,
+        like with DS.difference_update(E, keys=keys).
+
         DS-E  <==> DS.difference(E)
         """   
-        if not isinstance(E, DictSet):
-            E = DictSet(copy(E))
-
-        foo = deepcopy(self)
-        for k in set(foo.keys()) | set(E.keys()):
-            foo.setdefault(k, [])
-            foo[k].difference_update(E.get(k, []))
-            if not foo[k]:
-                del foo[k] # delete if empty set
+        E = _as_dictset(E)
+        if keys is not None:
+            return _scoped(self, 'difference_update', E, keys)
 
+        foo = self._new()
+        _share_sets(foo, self, lambda k: len(E._peek(k)))
+        _combine(foo, self, 'difference_update', E, E)
         return foo
 
     def __sub__(self, E): # overloads -
@@ -409,7 +2198,7 @@ class DictSet(dict):
         """         
         return self.difference(E)
 
-    def symmetric_difference(self, E):
+    def symmetric_difference(self, E, keys=None):
         """
         Return the symmetric difference of the sets of self with the
         sets of E.
@@ -417,18 +2206,20 @@ class DictSet(dict):
         (i.e. for each DictSet all elements that are in exactly one
          of the sets .)
 
+        Only the keys of E are combined, the sets of the other keys of
+        DS are taken over as they are. With keys only the sets of those
+        keys are combined, like with
+        DS.symmetric_difference_update(E, keys=keys).
+
         DS^E  <==> DS.symmetric_difference(E)
         """        
-        if not isinstance(E, DictSet):
-            E = DictSet(copy(E))
-
-        foo = deepcopy(self)
-        for k in set(foo.keys()) | set(E.keys()):
-            foo.setdefault(k, [])
-            foo[k].symmetric_difference_update(E.get(k, []))
-            if not foo[k]:
-                del foo[k] # delete if empty set
+        E = _as_dictset(E)
+        if keys is not None:
+            return _scoped(self, 'symmetric_difference_update', E, keys)
 
+        foo = self._new()
+        _share_sets(foo, self, lambda k: len(E._peek(k)))
+        _combine(foo, self, 'symmetric_difference_update', E, E)
         return foo
 
     def __xor__(self, E): # overloads ^
@@ -443,20 +2234,23 @@ class DictSet(dict):
         """
         return self.symmetric_difference(E)
 
-    def intersection_update(self, E):
+    def intersection_update(self, E, keys=None):
         """
         Update a DictSet with the intersection of itself and E.
 
+        Every key of DS is visited, as the keys missing from E lose
+        their elements. With keys only the sets of those keys are
+        updated, the others are left alone.
+
         DS&=E  <==> DS.intersection_update(E)
         """        
-        if not isinstance(E, DictSet):
-            E = DictSet(copy(E))
-        
-        for k in set(self) | set(E):
-            self.setdefault(k, [])
-            self[k].intersection_update(E.get(k, []))
-            if len(self[k]) == 0:
-                del self[k]
+        E = _as_dictset(E)
+        if keys is None:
+            keys = list(self)
+
+        with self.batch():
+            for k in keys:
+                self._key_update(k, 'intersection_update', E._peek(k))
 
     def __iand__(self, E): # overloads &=
         """
@@ -464,22 +2258,27 @@ class DictSet(dict):
 
         DS&=E  <==> DS.intersection_update(E)
         """   
-        return self.intersection(E)
+        self.intersection_update(E)
+        return self
         
-    def difference_update(self, E):
+    def difference_update(self, E, keys=None):
         """
         Update a DictSet with the difference of itself and E.
 
+        Only the keys of E are visited, so the cost is proportional to
+        the size of E. With keys only the sets of those keys are
+        updated.
+
         DS-=E  <==> DS.difference_update(E)
         """     
-        if not isinstance(E, DictSet):
-            E = DictSet(copy(E))
-        
-        for k in set(self)|set(E):
-            self.setdefault(k, [])
-            self[k].difference_update(E.get(k, []))
-            if len(self[k]) == 0:
-                del self[k]
+        E = _as_dictset(E)
+        if keys is None:
+            keys = E
+
+        with self.batch():
+            for k in keys:
+                if dict.__contains__(self, k):
+                    self._key_update(k, 'difference_update', E._peek(k))
 
     def __isub__(self, E): # overloads -=
         """
@@ -487,23 +2286,27 @@ class DictSet(dict):
 
         DS-=E  <==> DS.difference_update(E)
         """     
-        return self.difference(E)
+        self.difference_update(E)
+        return self
         
-    def symmetric_difference_update(self, E):
+    def symmetric_difference_update(self, E, keys=None):
         """
         Update a DictSet with the symmetric difference of
         itself and E.
 
+        Only the keys of E are visited, so the cost is proportional to
+        the size of E. With keys only the sets of those keys are
+        updated.
+
         DS^=E  <==> DS.symmetric_difference_update(E)
         """     
-        if not isinstance(E, DictSet):
-            E = DictSet(copy(E))
-        
-        for k in set(self) | set(E):
-            self.setdefault(k, [])
-            self[k].symmetric_difference_update(E.get(k, []))
-            if len(self[k]) == 0:
-                del self[k]
+        E = _as_dictset(E)
+        if keys is None:
+            keys = E
+
+        with self.batch():
+            for k in keys:
+                self._key_update(k, 'symmetric_difference_update', E._peek(k))
 
     def __ixor__(self, E): # overloads ^=
         """
@@ -512,7 +2315,8 @@ class DictSet(dict):
 
         DS^=E  <==> DS.symmetric_difference_update(E)
         """    
-        return self.symmetric_difference(E)
+        self.symmetric_difference_update(E)
+        return self
 
     def add(self, k, v=None):
         """
@@ -523,21 +2327,87 @@ class DictSet(dict):
         Raises KeyError if k is not hashable.
         """
 
-        if k not in self.keys():
-            self[k] = set()
-            
-        if v != None:
-            self[k].add(v)
+        if v is not None:
+            self._key_update(k, 'add', v, False)
+        elif not dict.__contains__(self, k):
+            self._store(k, set())
+            if self._trackers:
+                self._replaced(k, None)
+
+    def __getitem__(self, k):
+        """
+        DS.__getitem__(k) <==> x[k]
+
+        Returns the set of DS[k]. A key holding its elements inline or
+        in a shared frozenset is switched to a private set first.
+        """
+        v = dict.__getitem__(self, k)
+        if not isinstance(v, set):
+            v = self._promote(k)
+        if self._trackers: # the set can now be changed from outside
+            self._emit([('touch', k, _empty)])
+        return v
 
     def __setitem__(self, k, v):
-        """DS.__setitem__(k, v) <==> x[k]=set(v)"""
-        if isinstance(v, set):
+        """
+        DS.__setitem__(k, v) <==> x[k]=set(v)
+
+        Sets are stored as they are, frozensets are stored as shared
+        values that are copied when DS[k] is mutated.
+        """
+        old = dict.get(self, k) if self._trackers else None
+        if self.interning:
+            self._store(k, v if isinstance(v, (set, frozenset)) else set(v))
+        elif isinstance(v, (set, frozenset)):
             super(DictSet, self).__setitem__(k, v)
         else:
-            try:
-                super(DictSet, self).__setitem__(k, set(v))
-            except:
-                raise
+            self._store(k, set(v))
+        if self._trackers:
+            self._replaced(k, old, dict.get(self, k) is v and
+                                   isinstance(v, set))
+
+    def __delitem__(self, k):
+        """DS.__delitem__(k) <==> del DS[k]"""
+        if self._trackers:
+            v = dict.__getitem__(self, k)
+            dict.__delitem__(self, k)
+            self._emit(_drop_events(k, v))
+        else:
+            dict.__delitem__(self, k)
+
+    def pop(self, k, *args):
+        """
+        DS.pop(k[,d]) -> v, remove specified key and return the stored
+        elements. If key is not found, d is returned if given,
+        otherwise KeyError is raised
+        """
+        if self._trackers and dict.__contains__(self, k):
+            v = dict.pop(self, k)
+            self._emit(_drop_events(k, v))
+            return v
+        return dict.pop(self, k, *args)
+
+    def popitem(self):
+        """
+        DS.popitem() -> (k, v), remove and return some (key, elements)
+        pair as a 2-tuple; but raise KeyError if DS is empty.
+        """
+        (k, v) = dict.popitem(self)
+        if self._trackers:
+            self._emit(_drop_events(k, v))
+        return (k, v)
+
+    def clear(self):
+        """DS.clear() -> None.  Remove all items from DS."""
+        if self._trackers:
+            events = []
+            for (k, v) in dict.items(self):
+                events.extend(_drop_events(k, v))
+            dict.clear(self)
+            if events:
+                self._emit(events)
+        else:
+            dict.clear(self)
 
     def __contains__(self, k):
         """
@@ -546,7 +2416,10 @@ class DictSet(dict):
         DS.__contains__(k) <==> k in D 
         """
 
-        return k in [key for (key, val) in self.items() if len(val) > 0]
+        try:
+            return len(dict.get(self, k, ())) > 0
+        except TypeError: # unhashable keys can't be in DS
+            return False
 
     def __iter__(self):
         """
@@ -554,9 +2427,48 @@ class DictSet(dict):
         
         DS.__iter__(k) <==> for k in D 
         """
-        for (key, val) in self.items():
+        for (key, val) in dict.items(self):
             if len(val) > 0:
                 yield key
+
+    def _touch_sets(self):
+        """tells the trackers that all the sets of DS are handed out"""
+        if self._trackers:
+            self._emit([('touch', k, _empty) for (k, v) in dict.items(self)
+                        if isinstance(v, set)])
+
+    def items(self):
+        """
+        DS.items() -> the (key, set) pairs of DS as they are stored.
+
+        The sets are the live sets of DS, so the trackers of DS (see
+        enable_fingerprint, enable_size_index, ...) take them as handed
+        out, like the sets returned by DS[k].
+        """
+        self._touch_sets()
+        return dict.items(self)
+
+    def values(self):
+        """DS.values() -> the sets of DS as they are stored, see items"""
+        self._touch_sets()
+        return dict.values(self)
+
+    if sys.version_info[0] == 2:
+        def iteritems(self):
+            self._touch_sets()
+            return dict.iteritems(self)
+
+        def itervalues(self):
+            self._touch_sets()
+            return dict.itervalues(self)
+
+        def viewitems(self):
+            self._touch_sets()
+            return dict.viewitems(self)
+
+        def viewvalues(self):
+            self._touch_sets()
+            return dict.viewvalues(self)
                     
     def get(self, k, v=None):
         """
@@ -573,6 +2485,66 @@ class DictSet(dict):
         except:
             raise
 
+    def get_many(self, keys, v=None):
+        """
+        DS.get_many(keys[, v]) -> list of DS.get(k, v) for the keys, in
+        order, looked up in a single pass.
+
+        This is a read path: keys holding their elements inline or in a
+        shared frozenset (see CompactDictSet, InterningDictSet and
+        dedupe) give a frozenset instead of being switched to a private
+        set. Use DS[k] to get a set to mutate.
+        """
+        get = dict.get
+        tracked = bool(self._trackers)
+        result = []
+        for k in keys:
+            try:
+                s = get(self, k)
+            except TypeError: # unhashable keys can't be in DS
+                s = None
+            if s is not None and len(s):
+                if not isinstance(s, set):
+                    s = _freeze(s)
+                elif tracked:
+                    s = self[k]
+                result.append(s)
+            else:
+                result.append(None if v is None else set(v))
+        return result
+
+    def has_keys(self, keys):
+        """
+        DS.has_keys(keys) -> list of the bools k in DS for the keys, in
+        order.
+        """
+        keys = keys if isinstance(keys, list) else list(keys)
+        get = dict.get
+        try:
+            return [len(get(self, k, ())) > 0 for k in keys]
+        except TypeError: # unhashable keys can't be in DS
+            return [self.__contains__(k) for k in keys]
+
+    def contains_many(self, pairs):
+        """
+        DS.contains_many(pairs) -> list of DS.contains(k, v) for the
+        (k, v) pairs, in order. The Bloom filters are used like in
+        contains when DS keeps them.
+        """
+        bloom = self.__dict__.get('_bloom')
+        peek = self._peek
+        result = []
+        for (k, v) in pairs:
+            try:
+                if bloom is not None and not bloom.might_contain(k, v):
+                    result.append(False)
+                    continue
+                s = peek(k)
+            except TypeError: # unhashable keys can't be in DS
+                s = _empty
+            result.append(v in s)
+        return result
+
     def setdefault(self, k, v=None):
         """
         DS.setdefault(k[,v]) -> DS.get(k, v), also set DS[k]=set(v)
@@ -584,15 +2556,178 @@ class DictSet(dict):
         if v == None:
             return
         else:
-            try:
-                super(DictSet, self).__setitem__(k, set(v))
-            except:
-                raise
+            old = dict.get(self, k) # an empty set if k is present
+            self._store(k, set(v))
+            if self._trackers:
+                self._replaced(k, old)
             return self[k]
         
     def copy(self):
-        """DS.copy() -> a shallow copy of DS."""
+        """
+        DS.copy() -> a copy of DS. The sets are copied, so mutating the
+        sets of one DictSet (also in place with |=, -=, ...) doesn't
+        change the other; inline and shared values are immutable and
+        stay shared.
+        """
         return copy(self)
+
+    def __copy__(self):
+        """copy(DS) <==> DS.copy()"""
+        foo = self._new()
+        for (k, v) in dict.items(self):
+            dict.__setitem__(foo, k, set(v) if isinstance(v, set) else v)
+        foo.__setstate__(self.__getstate__())
+        return foo
+
+    def view(self, keys):
+        """
+        DS.view(keys) -> DictSetView, a read-only projection of DS on
+        the keys, without copying any sets.
+
+        The view supports iteration, get, the comparisons and the binary
+        operators, which read the sets of DS in place; only the result
+        of an operator is a new DictSet. DictSet operators take a view
+        as their other operand without copying it either.
+        """
+        return DictSetView(self, keys)
+
+    def dedupe(self):
+        """
+        DS.dedupe() -> dict of sharing stats (see sharing_stats)
+
+        Makes all keys with equal sets share one frozenset. A key gets
+        a private copy again when it is mutated. Sets that were obtained
+        from DS[k] before are no longer the sets of DS afterwards.
+        Inline values (see CompactDictSet) are left alone.
+
+        On an InterningDictSet every set is interned and the pool of
+        shared sets is rebuilt, dropping sets no key holds anymore.
+        """
+        groups = {}
+        for (k, v) in dict.items(self):
+            if isinstance(v, tuple):
+                continue
+            f = frozenset(v)
+            groups.setdefault(f, []).append(k)
+
+        for (f, keys) in groups.items():
+            if len(keys) > 1 or self.interning:
+                for k in keys:
+                    dict.__setitem__(self, k, f)
+
+        if self.interning:
+            self._pool = dict((f, f) for f in groups)
+
+        return self.sharing_stats()
+
+    def sharing_stats(self):
+        """
+        DS.sharing_stats() -> dict describing the sharing of set objects
+
+        The returned dict has the keys:
+            n_keys        -- the number of keys
+            n_sets        -- the number of distinct set objects
+            n_shared_sets -- the set objects held by more than one key
+            n_shared_keys -- the keys holding a shared set object
+            bytes_saved   -- the bytes the shared keys would take up
+                             for their own copies
+        """
+        refs = {}
+        for v in dict.values(self):
+            if isinstance(v, tuple):
+                continue
+            if id(v) in refs:
+                refs[id(v)][1] += 1
+            else:
+                refs[id(v)] = [v, 1]
+
+        shared = [(v, n) for (v, n) in refs.values() if n > 1]
+        return dict(n_keys=len(self),
+                    n_sets=len(refs),
+                    n_shared_sets=len(shared),
+                    n_shared_keys=sum(n for (v, n) in shared),
+                    bytes_saved=sum((n - 1) * sys.getsizeof(v)
+                                    for (v, n) in shared))
+
+    def memory_usage(self, deep=True, sample=None):
+        """
+        DS.memory_usage([deep[, sample]]) -> dict of bytes used by DS.
+
+        The returned dict has the keys:
+            table      -- the dict object holding the keys (and the
+                          pool of an InterningDictSet)
+            sets       -- the non-empty set objects (or inline tuples)
+            empty_sets -- the empty set objects, e.g. from add(k)
+                          or fromkeys(seq)
+            keys       -- the key objects (0 unless deep)
+            elements   -- the element objects (0 unless deep)
+            total      -- the sum of the above
+        and the counts n_keys, n_empty_sets and n_elements (the number
+        of distinct element objects, 0 unless deep).
+
+        Set, key and element objects are counted once no matter how many
+        keys share them. Tuple and frozenset elements include their
+        members. Objects that are both keys and elements (e.g. the nodes
+        of a graph) are reported under keys and elements, but only
+        counted once in total.
+
+        When sample is an integer smaller than len(DS) only that many
+        randomly chosen keys are walked and the per-key figures are
+        scaled up to len(DS). Elements shared between keys that are not
+        in the sample can't be recognized, so with shared elements the
+        estimate is on the high side.
+        """
+        keys = list(dict.keys(self))
+        scale = 1.
+        if sample is not None and sample < len(keys):
+            if len(keys) > 0:
+                scale = len(keys) / float(max(sample, 1))
+            keys = random.sample(keys, sample)
+
+        # keys, sets and elements are de-duplicated separately, seen
+        # de-duplicates the bytes of the keys and elements for the total
+        seen_keys, seen_sets, seen_elements, seen = set(), set(), set(), set()
+        sets = empty_sets = key_bytes = element_bytes = shared = 0
+        n_empty_sets = n_elements = 0
+        for k in keys:
+            v = dict.__getitem__(self, k)
+            if deep:
+                key_bytes += _deep_sizeof(k, seen_keys)
+                shared += _deep_sizeof(k, seen)
+
+            if id(v) in seen_sets:
+                continue
+            seen_sets.add(id(v))
+
+            if len(v) == 0:
+                empty_sets += sys.getsizeof(v)
+                n_empty_sets += 1
+            else:
+                sets += sys.getsizeof(v)
+
+            if deep:
+                for e in v:
+                    if id(e) not in seen_elements:
+                        n_elements += 1
+                        element_bytes += _deep_sizeof(e, seen_elements)
+                        shared += _deep_sizeof(e, seen)
+
+        table = sys.getsizeof(self)
+        if '_pool' in self.__dict__:
+            table += sys.getsizeof(self._pool)
+
+        usage = dict(table=table,
+                     sets=int(sets * scale),
+                     empty_sets=int(empty_sets * scale),
+                     keys=int(key_bytes * scale),
+                     elements=int(element_bytes * scale),
+                     n_keys=len(self),
+                     n_empty_sets=int(n_empty_sets * scale),
+                     n_elements=int(n_elements * scale))
+        usage['total'] = (sum(usage[name] for name in
+                              ('table', 'sets', 'empty_sets')) +
+                          int(shared * scale))
+        return usage
     
     def remove(self, k, v=None):
         """
@@ -602,11 +2737,17 @@ class DictSet(dict):
         If v is not supplied removes DS[k]; it must be an item.
         if D[k] is not an item, raise a KeyError.
         """
-        if k not in self.keys():
+        try:
+            present = dict.__contains__(self, k)
+        except TypeError:
+            if sys.version_info[0] == 2:
+                raise KeyError(k) # as the lookup in DS.keys() always did
+            raise
+        if not present:
             raise KeyError(k)
         
-        if v != None:
-            self[k].remove(v)
+        if v is not None:
+            self._key_update(k, 'remove', v, False)
         else:
             del self[k]
             
@@ -619,9 +2760,10 @@ class DictSet(dict):
         If D[k] is not an item, raise a KeyError.
         """
 
-        if v != None:
+        if v is not None:
             try:
-                self[k].discard(v)
+                if dict.__contains__(self, k):
+                    self._key_update(k, 'discard', v, False)
             except:
                 pass
         else:
@@ -630,13 +2772,218 @@ class DictSet(dict):
             except:
                 pass
 
+    def _grouped(self, k, elements):
+        """
+        the (key, elements) pairs of a key and its elements, or of the
+        (key, element) pairs k grouped by key if elements is None
+        """
+        if elements is not None:
+            return [(k, elements)]
+        groups = {}
+        for (key, e) in k:
+            if key in groups:
+                groups[key].append(e)
+            else:
+                groups[key] = [e]
+        return groups.items()
+
+    def add_many(self, k, elements=None):
+        """
+        DS.add_many(k, elements) -> None. Adds the elements to DS[k].
+        DS.add_many(pairs) -> None. Adds the element of every (key,
+        element) pair to the set of its key.
+
+        Each key is looked up once and its elements are added with a
+        single set.update. Like add, adding no elements to a missing
+        key k still adds k with an empty set.
+        """
+        with self.batch():
+            for (key, v) in self._grouped(k, elements):
+                self._key_update(key, 'update', v, False)
+
+    def discard_many(self, k, elements=None):
+        """
+        DS.discard_many(k, elements) -> None. Removes the elements that
+        are members of DS[k] from it.
+        DS.discard_many(pairs) -> None. Removes the element of every
+        (key, element) pair from the set of its key, if it is there.
+
+        Each key is looked up once and its elements are removed with a
+        single set.difference_update. Missing keys are ignored.
+        """
+        with self.batch():
+            for (key, v) in self._grouped(k, elements):
+                if dict.__contains__(self, key):
+                    self._key_update(key, 'difference_update', v, False)
+
+    def remove_many(self, k, elements=None):
+        """
+        DS.remove_many(k, elements) -> None. Removes the elements from
+        DS[k]; they must all be members.
+        DS.remove_many(pairs) -> None. Removes the element of every
+        (key, element) pair from the set of its key; they must all be
+        members.
+
+        Raises KeyError, before anything is removed, if a key or an
+        element is missing.
+        """
+        groups = [(key, list(v)) for (key, v) in self._grouped(k, elements)]
+        for (key, v) in groups:
+            if not dict.__contains__(self, key):
+                raise KeyError(key)
+            cur = _as_set(self._peek(key))
+            if not cur.issuperset(v):
+                raise KeyError(next(e for e in v if e not in cur))
+        with self.batch():
+            for (key, v) in groups:
+                self._key_update(key, 'difference_update', v, False)
+
     
     # borrowed from the collections.OrderedDict in the standard library 
     def __repr__(self):
         """DS.__repr__() <==> repr(DS)"""
         if not self:
             return '%s()' % (self.__class__.__name__,)
-        return '%s(%r)' % (self.__class__.__name__, list(self.items()))
+        return '%s(%r)' % (self.__class__.__name__,
+                           [(k, v if isinstance(v, set) else set(v))
+                            for (k, v) in dict.items(self)])
+
+    def invert(self, processes=None, chunksize=100000):
+        """
+        DS.invert([processes[, chunksize]]) -> DictSet mapping every
+        element of DS to the set of the keys whose sets hold it.
+
+        The keys of an element are gathered in a list and made into a
+        set in one step, which sizes the set once instead of growing it
+        an element at a time.
+
+        With processes > 1 the sets of DS are sent in chunks of about
+        chunksize elements to a multiprocessing pool of that many
+        processes, which inverts them separately, and the partial
+        inversions are merged as they come back. At most two chunks per
+        process are in flight at a time, so the memory used on top of
+        the result is bounded by chunksize. Keys and elements have to
+        be picklable, and as the partial inversions are pickled and
+        merged in this process the pool only pays off when the sets are
+        large compared to the number of distinct elements.
+        """
+        if processes is not None and processes > 1:
+            lists = self._invert_parallel(processes, chunksize)
+        else:
+            lists = _invert_pairs(dict.items(self))
+
+        result = self._new()
+        while lists:
+            (e, ks) = lists.popitem()
+            result._store(e, set(ks))
+        return result
+
+    def _invert_parallel(self, processes, chunksize):
+        """the key lists of invert, built on a pool of processes"""
+        from collections import deque
+        from multiprocessing import Pool
+
+        lists = {}
+        pool = Pool(processes)
+        try:
+            pending = deque()
+            for chunk in _chunks(dict.items(self), chunksize):
+                pending.append(pool.apply_async(_invert_pairs, (chunk,)))
+                if len(pending) >= 2 * processes:
+                    _merge_lists(lists, pending.popleft().get())
+            while pending:
+                _merge_lists(lists, pending.popleft().get())
+        finally:
+            pool.terminate()
+        return lists
+
+    def compose(self, E, processes=None, chunksize=100000):
+        """
+        DS.compose(E[, processes[, chunksize]]) -> DictSet of the
+        relational composition of DS and E: every key k of DS maps to
+        the union of E[v] for the elements v of DS[k].
+
+        With DS mapping users to groups and E groups to permissions,
+        DS.compose(E) maps users to permissions. The sets of E are read
+        in place without copying, and the union of a frozenset shared
+        by several keys (see InterningDictSet) is made once and reused.
+
+        With processes > 1 chunks of about chunksize elements of DS are
+        composed on a multiprocessing pool; E is sent once to every
+        process. Keys, elements and E have to be picklable.
+        """
+        relation = E if isinstance(E, dict) else dict(_as_mapping(E).items())
+
+        result = self._new()
+        if processes is not None and processes > 1:
+            pairs = self._compose_parallel(relation, processes, chunksize)
+        else:
+            pairs = _compose_pairs(_items(self), relation, {})
+
+        for (k, s) in pairs:
+            result._store(k, s)
+        return result
+
+    def _compose_parallel(self, relation, processes, chunksize):
+        """the (key, union) pairs of compose, made on a pool of processes"""
+        from multiprocessing import Pool
+
+        pool = Pool(processes, _init_compose, (relation,))
+        try:
+            pairs = []
+            for chunk in pool.imap(_compose_chunk,
+                                   _chunks(dict.items(self), chunksize)):
+                pairs.extend(chunk)
+        finally:
+            pool.terminate()
+        return pairs
+
+    def similarity_join(self, E, threshold, processes=None, chunksize=100000):
+        """
+        DS.similarity_join(E, threshold[, processes[, chunksize]]) ->
+        list of the (key of DS, key of E, similarity) triples of the
+        keys whose sets have a Jaccard similarity of at least threshold,
+        in arbitrary order. Keys with empty sets are never paired.
+
+        The elements are ordered from the rarest to the most common and
+        E is indexed by the first few elements of every set. Only the
+        pairs that share one of those elements and have sizes within a
+        factor of threshold of each other are compared, instead of all
+        the pairs of keys.
+
+        With processes > 1 DS is probed in chunks of about chunksize
+        elements on a multiprocessing pool; the index of E is sent once
+        to every process. Keys and elements have to be picklable.
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError('threshold must be in (0, 1]')
+
+        E = _as_mapping(E)
+        counts = {}
+        for pairs in (_items(self), _items(E)):
+            for (k, v) in pairs:
+                for e in v:
+                    counts[e] = counts.get(e, 0) + 1
+        rank = dict((e, i) for (i, e) in
+                    enumerate(sorted(counts, key=counts.get)))
+        del counts
+
+        state = (rank,) + _similarity_index(_items(E), rank, threshold) + \
+                (threshold,)
+        if processes is None or processes < 2:
+            return _similarity_pairs(_items(self), *state)
+
+        from multiprocessing import Pool
+
+        pool = Pool(processes, _init_similarity, (state,))
+        try:
+            result = []
+            for chunk in pool.imap(_similarity_chunk,
+                                   _chunks(dict.items(self), chunksize)):
+                result.extend(chunk)
+        finally:
+            pool.terminate()
+        return result
 
     def unique_combinations(self, keys=None):
         """
@@ -671,7 +3018,7 @@ class DictSet(dict):
             
             # the number of unique combinations is the product 
             # of the cardinalities of the non-zero sets
-            N = reduce(int.__mul__,(len(self[k]) for k in keys))
+            N = reduce(int.__mul__,(len(self._peek(k)) for k in keys))
 
             # now we need to build a dict of generators so we
             # can build a generator or generators. To do this
@@ -684,10 +3031,10 @@ class DictSet(dict):
             for i, k in enumerate(reversed(keys)):
                 if i != 0:
                     each *= prev_n
-                times = N / (len(self[k]) * each)
-                prev_n = len(self[k])
+                times = N / (len(self._peek(k)) * each)
+                prev_n = len(self._peek(k))
 
-                gen_dict[k] = _rep_generator(sorted(self[k]),
+                gen_dict[k] = _rep_generator(sorted(self._peek(k)),
                                              int(times),int(each))
 
             # Now we just have to yield the results
@@ -704,8 +3051,399 @@ class DictSet(dict):
         d = cls()
         for key in seq:
             if values == None:
-                d[key] = set()
+                d._store(key, set())
             else:
-                d[key] = set(values)
+                d._store(key, set(values))
                 
         return d
+
+
+def _function(method):
+    """the function of a method, so another class can share it"""
+    return getattr(method, '__func__', method)
+
+class _Elements(Set):
+    """
+    A read-only view of the set of key k of a DictSet, as returned by
+    DSV[k]. It reads the set in place and always shows its current
+    contents; the set operators return frozensets.
+    """
+    __slots__ = ('_ds', '_k')
+
+    def __init__(self, ds, k):
+        self._ds = ds
+        self._k = k
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return frozenset(iterable)
+
+    def __contains__(self, e):
+        return e in self._ds._peek(self._k)
+
+    def __iter__(self):
+        return iter(self._ds._peek(self._k))
+
+    def __len__(self):
+        return len(self._ds._peek(self._k))
+
+    def issubset(self, other):
+        return _as_set(self._ds._peek(self._k)).issubset(other)
+
+    def issuperset(self, other):
+        return _as_set(self._ds._peek(self._k)).issuperset(other)
+
+    def copy(self):
+        """a frozenset of the current elements"""
+        return _freeze(self._ds._peek(self._k))
+
+    def __repr__(self):
+        return repr(self.copy())
+
+class DictSetView(Mapping):
+    """
+    A read-only projection of a DictSet on some of its keys, see
+    DictSet.view.
+
+    The view holds no sets of its own: it reads the sets of its
+    DictSet in place, so it always shows their current contents. The
+    comparisons and the binary operators are the ones of DictSet, and
+    like them return a new DictSet; DictSet operators read a view
+    without copying it. DSV[k], DSV.get(k), values() and items() give
+    read-only views of the sets, which aren't copied either.
+    """
+    def __init__(self, ds, keys):
+        self._ds = ds
+        self._keys = []
+        self._keyset = set()
+        for k in keys:
+            if k not in self._keyset:
+                self._keys.append(k)
+                self._keyset.add(k)
+
+    def _peek(self, k):
+        """the stored elements of k without copying them, see DictSet"""
+        if k in self._keyset:
+            return self._ds._peek(k)
+        return _empty
+
+    def _items(self):
+        """the (key, elements) pairs of DSV without copying the elements"""
+        peek = self._ds._peek
+        return [(k, peek(k)) for k in self._keys]
+
+    def _new(self):
+        return self._ds._new()
+
+    def __iter__(self):
+        """Iterate over the keys of DSV with non-empty sets."""
+        peek = self._ds._peek
+        for k in self._keys:
+            if len(peek(k)):
+                yield k
+
+    def __len__(self):
+        return sum(1 for k in self)
+
+    def __contains__(self, k):
+        """True if k is a key of DSV and len(DSV[k])!=0, else False"""
+        try:
+            return len(self._peek(k)) > 0
+        except TypeError: # unhashable keys can't be in DSV
+            return False
+
+    def __getitem__(self, k):
+        """
+        DSV[k] -> read-only view of DS[k], KeyError if k isn't a key of
+        DSV. view.copy() gives a frozenset of the elements.
+        """
+        if k not in self._keyset or not dict.__contains__(self._ds, k):
+            raise KeyError(k)
+        return _Elements(self._ds, k)
+
+    def get(self, k, v=None):
+        """DSV.get(k[,v]) -> DSV[k] if k in DSV, else set(v)."""
+        if k in self:
+            return self[k]
+        if v is None:
+            return
+        return set(v)
+
+    def to_dictset(self):
+        """DSV.to_dictset() -> DictSet with copies of the sets of DSV"""
+        result = self._ds._new()
+        for (k, v) in self._items():
+            if len(v):
+                result._store(k, set(v))
+        return result
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__,
+                           [(k, set(v)) for (k, v) in self._items() if len(v)])
+
+    __eq__ = _function(DictSet.__eq__)
+    __ne__ = _function(DictSet.__ne__)
+    __hash__ = None
+    issubset = _function(DictSet.issubset)
+    issuperset = _function(DictSet.issuperset)
+    isdisjoint = _function(DictSet.isdisjoint)
+    __le__ = _function(DictSet.__le__)
+    __lt__ = _function(DictSet.__lt__)
+    __ge__ = _function(DictSet.__ge__)
+    __gt__ = _function(DictSet.__gt__)
+    union = _function(DictSet.union)
+    intersection = _function(DictSet.intersection)
+    difference = _function(DictSet.difference)
+    symmetric_difference = _function(DictSet.symmetric_difference)
+    __or__ = _function(DictSet.__or__)
+    __and__ = _function(DictSet.__and__)
+    __sub__ = _function(DictSet.__sub__)
+    __xor__ = _function(DictSet.__xor__)
+
+class Delta(dict):
+    """
+    The changes between two DictSets, as returned by DictSet.diff.
+
+    Maps every key whose set changed to a pair (added, removed) of
+    frozensets of the elements added to and removed from its set.
+    Deltas pickle like dicts, and as_dict() gives them as plain lists
+    for other formats such as JSON.
+    """
+    def compose(self, other):
+        """
+        D.compose(other) -> Delta with the changes of D followed by the
+        changes of other, so DS.apply(D.compose(other)) has the effect
+        of DS.apply(D); DS.apply(other).
+        """
+        result = Delta(self)
+        for (k, (added, removed)) in other.items():
+            (added, removed) = (frozenset(added), frozenset(removed))
+            if k in result:
+                (a, r) = result[k]
+                (added, removed) = ((a - removed) | (added - r),
+                                    (r - added) | (removed - a))
+            if added or removed:
+                result[k] = (added, removed)
+            else:
+                del result[k]
+        return result
+
+    def inverse(self):
+        """D.inverse() -> Delta that undoes the changes of D."""
+        return Delta((k, (removed, added))
+                     for (k, (added, removed)) in self.items())
+
+    def as_dict(self):
+        """D.as_dict() -> dict of keys to [added, removed] lists"""
+        return dict((k, [list(added), list(removed)])
+                    for (k, (added, removed)) in self.items())
+
+    @classmethod
+    def from_dict(cls, d):
+        """Delta.from_dict(d) -> Delta from the result of as_dict()"""
+        return cls((k, (frozenset(added), frozenset(removed)))
+                   for (k, (added, removed)) in d.items())
+
+
+class CompactDictSet(DictSet):
+    """
+    A DictSet that stores small sets inline.
+
+    Keys whose sets have at most inline_max elements hold their
+    elements in a tuple instead of a set, which takes a fraction of
+    the memory of a set (about 56 bytes instead of 216 for two
+    elements). Adding elements past inline_max switches the key to a
+    set. Subclass and change inline_max to tune the threshold.
+
+    The inline values are not visible through DS[k], get, setdefault
+    or the operators, which all see sets. DS[k] hands out a set that
+    can be mutated, so it switches the key to a set. The switched keys
+    whose sets are no longer referenced elsewhere are stored inline
+    again every _promoted_limit switches (this needs sys.getrefcount,
+    otherwise call compact()). get_many returns frozensets for inline
+    keys and switches nothing. items() and values() return the stored
+    values, tuples included.
+    """
+    inline_max = 2
+
+    def compact(self):
+        """
+        DS.compact() -> None. Stores the sets with at most inline_max
+        elements inline.
+
+        Sets that were obtained from DS[k] before are no longer the
+        sets of DS afterwards.
+        """
+        for (k, v) in list(dict.items(self)):
+            if isinstance(v, set) and len(v) <= self.inline_max:
+                dict.__setitem__(self, k, tuple(v))
+
+
+class InterningDictSet(DictSet):
+    """
+    A DictSet that shares one frozenset between all keys with equal sets.
+
+    Every new set stored in the DictSet (by update, DS[k] = v, fromkeys,
+    the operators, ...) is looked up in a pool of frozensets and the
+    pooled copy is stored instead, so keys with the same elements use a
+    single set object. Mutating a key through the DictSet methods gives
+    that key a private set first (copy-on-write); call dedupe() to share
+    it again and to drop unused sets from the pool.
+
+    DS[k], get and setdefault give the key a private set that can be
+    mutated like the set of any DictSet. The keys whose private sets are
+    no longer referenced elsewhere are interned again every
+    _promoted_limit such reads (this needs sys.getrefcount, otherwise
+    call dedupe()). get_many returns the shared frozensets and unshares
+    nothing. DS[k] = v stores a shared copy of v, v itself is not kept.
+    """
+    interning = True
+
+
+# Instrumentation
+#
+# enable_instrumentation() swaps the methods listed in INSTRUMENTED for
+# timing wrappers on the DictSet class and disable_instrumentation()
+# puts the originals back, so DictSet runs the plain methods whenever
+# instrumentation is off.
+INSTRUMENTED = ('update', 'union', 'intersection', 'difference',
+                'symmetric_difference', 'intersection_update',
+                'difference_update', 'symmetric_difference_update',
+                'issubset', 'issuperset', 'isdisjoint', '__or__',
+                '__and__', '__sub__', '__xor__', '__ior__', '__iand__',
+                '__isub__', '__ixor__', '__eq__', '__ne__', '__le__',
+                '__ge__', '__lt__', '__gt__')
+
+_instrumentation = None # {'originals':..., 'stats':..., 'sink':...}
+
+# the instrumented calls running in each thread, only the outermost one
+# is recorded (a | E runs union, and update to convert E)
+_instrument_calls = threading.local()
+
+def _bucket(n):
+    """the smallest power of 2 >= n (0 for 0), used as histogram bins"""
+    if n <= 0:
+        return 0
+    return 1 << (n - 1).bit_length()
+
+def _operand_size(obj):
+    """
+    Returns (number of keys, number of elements) of a DictSet operand,
+    or (None, None) when obj is not a mapping or sequence of pairs.
+    """
+    try:
+        if hasattr(obj, 'keys'):
+            return len(obj), sum(len(v) for v in obj.values())
+        return len(obj), sum(len(v) for (k, v) in obj)
+    except Exception:
+        return None, None
+
+def _count(hist, n):
+    if n is not None:
+        b = _bucket(n)
+        hist[b] = hist.get(b, 0) + 1
+
+def _instrument(name, func):
+    """wraps a DictSet method so its calls are recorded"""
+    @wraps(func)
+    def wrapper(*args, **kwds):
+        depth = getattr(_instrument_calls, 'depth', 0)
+        if depth:
+            return func(*args, **kwds)
+
+        # self is taken from args so that DictSet(self=...) still works
+        keys, elements = _operand_size(args[0])
+        other_keys, other_elements = (_operand_size(args[1])
+                                      if len(args) > 1 else (None, None))
+        _instrument_calls.depth = 1
+        t0 = _clock()
+        try:
+            return func(*args, **kwds)
+        finally:
+            seconds = _clock() - t0
+            _instrument_calls.depth = 0
+            state = _instrumentation
+            if state is not None:
+                stats = state['stats'].setdefault(name, _new_stats())
+                stats['calls'] += 1
+                stats['seconds'] += seconds
+                _count(stats['keys'], keys)
+                _count(stats['elements'], elements)
+                _count(stats['other_keys'], other_keys)
+                _count(stats['other_elements'], other_elements)
+
+                if state['sink'] is not None:
+                    state['sink'](dict(method=name, seconds=seconds,
+                                       keys=keys, elements=elements,
+                                       other_keys=other_keys,
+                                       other_elements=other_elements))
+    return wrapper
+
+def _new_stats():
+    return dict(calls=0, seconds=0.0, keys={}, elements={},
+                other_keys={}, other_elements={})
+
+def enable_instrumentation(sink=None, methods=INSTRUMENTED):
+    """
+    Starts recording the calls to the DictSet methods.
+
+    For every method call the number of calls, the cumulative wall
+    time and histograms of the key and element counts of self and of
+    the other operand are accumulated (see instrumentation_stats).
+
+    sink is an optional callable that is also handed a dict for every
+    call with the keys: method, seconds, keys, elements, other_keys
+    and other_elements.
+
+    Counting elements walks the sets of both operands, so the
+    instrumented methods are slower while recording. When
+    instrumentation is disabled DictSet runs the plain methods.
+    """
+    global _instrumentation
+    if _instrumentation is not None:
+        disable_instrumentation()
+
+    originals = {}
+    for name in methods:
+        originals[name] = DictSet.__dict__[name]
+        setattr(DictSet, name, _instrument(name, originals[name]))
+
+    _instrumentation = dict(originals=originals, stats={}, sink=sink)
+
+def disable_instrumentation():
+    """
+    Stops recording and restores the plain DictSet methods.
+    Returns the collected stats.
+    """
+    global _instrumentation
+    if _instrumentation is None:
+        return {}
+
+    state, _instrumentation = _instrumentation, None
+    for (name, func) in state['originals'].items():
+        setattr(DictSet, name, func)
+    return state['stats']
+
+def instrumentation_enabled():
+    """True if DictSet calls are being recorded"""
+    return _instrumentation is not None
+
+def instrumentation_stats():
+    """
+    Returns a copy of the stats recorded so far as a dict mapping
+    method names to dicts with the keys:
+        calls, seconds -- number of calls and cumulative wall time
+        keys, elements -- histograms of the size of self
+        other_keys, other_elements -- histograms of the other operand
+
+    Histograms map the smallest power of 2 >= the count to the number
+    of calls in that bin.
+    """
+    if _instrumentation is None:
+        return {}
+    return deepcopy(_instrumentation['stats'])
+
+def reset_instrumentation():
+    """Clears the recorded stats"""
+    if _instrumentation is not None:
+        _instrumentation['stats'].clear()
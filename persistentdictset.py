@@ -0,0 +1,548 @@
+# Copyright (c) 2011, Roger Lew [see LICENSE.txt]
+# This software is funded in part by NIH Grant P20 RR016454.
+"""This module contains the PersistentDictSet class"""
+
+try:
+    from collections.abc import Mapping, Set
+except ImportError: # Python 2
+    from collections import Mapping, Set
+
+from dictset import DictSet, _as_mapping, _getter, _items
+
+# Hash array mapped trie
+#
+# A trie node has a bitmap with a bit for each of the 32 values of the
+# next 5 bits of the hash of a key, and one entry per set bit: either a
+# (hash, key, value) triple or the node of the next 5 bits. Keys whose
+# 64 bit hashes are equal share a _Collision node. Nodes are never
+# changed, an update copies the nodes on the path to the key and
+# shares all the other nodes with the trie it was made from.
+_SHIFT = 5
+_BRANCH = 31
+_HASH_BITS = 64
+_missing = object()
+
+def _hash(key):
+    """the hash of key as an unsigned 64 bit integer"""
+    return hash(key) & 0xFFFFFFFFFFFFFFFF
+
+def _bitcount(n):
+    return bin(n).count('1')
+
+class _Node(object):
+    """a node of the trie"""
+    __slots__ = ('bitmap', 'entries')
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+class _Collision(object):
+    """the (hash, key, value) triples of keys with equal hashes"""
+    __slots__ = ('entries',)
+
+    def __init__(self, entries):
+        self.entries = entries
+
+_EMPTY_NODE = _Node(0, ())
+
+def _find(node, h, key):
+    """returns the value of key in the trie node, _missing if none"""
+    shift = 0
+    while True:
+        if isinstance(node, _Collision):
+            for (h2, k2, v2) in node.entries:
+                if k2 == key:
+                    return v2
+            return _missing
+
+        bit = 1 << ((h >> shift) & _BRANCH)
+        if not node.bitmap & bit:
+            return _missing
+        entry = node.entries[_bitcount(node.bitmap & (bit - 1))]
+        if isinstance(entry, tuple):
+            if entry[0] == h and (entry[1] is key or entry[1] == key):
+                return entry[2]
+            return _missing
+        node = entry
+        shift += _SHIFT
+
+def _pair(shift, a, b):
+    """a node holding the triples a and b, whose hashes differ after shift"""
+    if shift >= _HASH_BITS:
+        return _Collision((a, b))
+    (ba, bb) = ((a[0] >> shift) & _BRANCH, (b[0] >> shift) & _BRANCH)
+    if ba == bb:
+        return _Node(1 << ba, (_pair(shift + _SHIFT, a, b),))
+    if ba > bb:
+        (a, b) = (b, a)
+    return _Node((1 << ba) | (1 << bb), (a, b))
+
+def _assoc(node, shift, h, key, value):
+    """
+    Returns (node with key set to value, True if key is new). The node
+    itself is returned if key already has the value.
+    """
+    if isinstance(node, _Collision):
+        entries = list(node.entries)
+        for (i, (h2, k2, v2)) in enumerate(entries):
+            if k2 == key:
+                if v2 is value:
+                    return (node, False)
+                entries[i] = (h, key, value)
+                return (_Collision(tuple(entries)), False)
+        entries.append((h, key, value))
+        return (_Collision(tuple(entries)), True)
+
+    bit = 1 << ((h >> shift) & _BRANCH)
+    i = _bitcount(node.bitmap & (bit - 1))
+    entries = node.entries
+    if not node.bitmap & bit:
+        return (_Node(node.bitmap | bit,
+                      entries[:i] + ((h, key, value),) + entries[i:]), True)
+
+    entry = entries[i]
+    if isinstance(entry, tuple):
+        if entry[0] == h and (entry[1] is key or entry[1] == key):
+            if entry[2] is value:
+                return (node, False)
+            (new, added) = ((h, key, value), False)
+        else:
+            (new, added) = (_pair(shift + _SHIFT, entry, (h, key, value)), True)
+    else:
+        (new, added) = _assoc(entry, shift + _SHIFT, h, key, value)
+        if new is entry:
+            return (node, False)
+    return (_Node(node.bitmap, entries[:i] + (new,) + entries[i + 1:]), added)
+
+def _dissoc(node, shift, h, key):
+    """
+    Returns node without key: the node itself if key isn't in it, None
+    if it is left empty, or the remaining triple if only one is left.
+    """
+    if isinstance(node, _Collision):
+        entries = tuple(e for e in node.entries if e[1] != key)
+        if len(entries) == len(node.entries):
+            return node
+        if len(entries) == 1:
+            return entries[0]
+        return _Collision(entries)
+
+    bit = 1 << ((h >> shift) & _BRANCH)
+    if not node.bitmap & bit:
+        return node
+    i = _bitcount(node.bitmap & (bit - 1))
+    entries = node.entries
+    entry = entries[i]
+    if isinstance(entry, tuple):
+        if not (entry[0] == h and (entry[1] is key or entry[1] == key)):
+            return node
+        new = None
+    else:
+        new = _dissoc(entry, shift + _SHIFT, h, key)
+        if new is entry:
+            return node
+
+    if new is None:
+        bitmap = node.bitmap & ~bit
+        if not bitmap:
+            return None
+        entries = entries[:i] + entries[i + 1:]
+        if len(entries) == 1 and isinstance(entries[0], tuple):
+            return entries[0]
+        return _Node(bitmap, entries)
+
+    # a lone triple moves up to the first node that has other entries
+    if isinstance(new, tuple) and len(entries) == 1:
+        return new
+    return _Node(node.bitmap, entries[:i] + (new,) + entries[i + 1:])
+
+def _set(root, key, value):
+    """returns (root with key set to value, True if key is new)"""
+    return _assoc(root, 0, _hash(key), key, value)
+
+def _delete(root, key):
+    """returns (root without key, True if key was in root)"""
+    h = _hash(key)
+    new = _dissoc(root, 0, h, key)
+    if new is root:
+        return (root, False)
+    if new is None:
+        return (_EMPTY_NODE, True)
+    if isinstance(new, tuple):
+        return (_Node(1 << (new[0] & _BRANCH), (new,)), True)
+    return (new, True)
+
+def _triples(node):
+    """yields the (hash, key, value) triples of the trie node"""
+    for entry in node.entries:
+        if isinstance(entry, tuple):
+            yield entry
+        else:
+            for triple in _triples(entry):
+                yield triple
+
+
+class PersistentSet(Set):
+    """
+    An immutable set that shares its structure with the sets it was
+    made from.
+
+    add, discard, union, ... return a new PersistentSet and leave the
+    set they are called on unchanged. Changing one element copies
+    O(log n) small trie nodes, so keeping many versions of a large set
+    costs memory in proportion to their differences.
+    """
+    __slots__ = ('_root', '_len', '_hashcode')
+
+    def __init__(self, iterable=()):
+        (self._root, self._len) = _with(_EMPTY_NODE, 0, iterable)
+        self._hashcode = None
+
+    @classmethod
+    def _make(cls, root, n):
+        obj = cls.__new__(cls)
+        (obj._root, obj._len, obj._hashcode) = (root, n, None)
+        return obj
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return cls(iterable)
+
+    def _new(self, root, n):
+        return self if root is self._root else self._make(root, n)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for triple in _triples(self._root):
+            yield triple[1]
+
+    def __contains__(self, e):
+        try:
+            return _find(self._root, _hash(e), e) is not _missing
+        except TypeError: # unhashable elements can't be in the set
+            return False
+
+    def __hash__(self):
+        if self._hashcode is None:
+            self._hashcode = self._hash()
+        return self._hashcode
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, list(self))
+
+    def add(self, e):
+        """S.add(e) -> PersistentSet with e added"""
+        return self._new(*_with(self._root, self._len, (e,)))
+
+    def discard(self, e):
+        """S.discard(e) -> PersistentSet without e"""
+        return self._new(*_without(self._root, self._len, (e,)))
+
+    def remove(self, e):
+        """S.remove(e) -> PersistentSet without e, KeyError if e isn't in S"""
+        if e not in self:
+            raise KeyError(e)
+        return self.discard(e)
+
+    def union(self, *others):
+        """S.union(*others) -> PersistentSet with the elements of others added"""
+        (root, n) = (self._root, self._len)
+        for other in others:
+            (root, n) = _with(root, n, other)
+        return self._new(root, n)
+
+    update = union
+
+    def difference(self, *others):
+        """S.difference(*others) -> PersistentSet without the elements of others"""
+        (root, n) = (self._root, self._len)
+        for other in others:
+            (root, n) = _without(root, n, other)
+        return self._new(root, n)
+
+    def intersection(self, *others):
+        """S.intersection(*others) -> PersistentSet of the elements also in others"""
+        result = self
+        for other in others:
+            if not isinstance(other, (Set, set, frozenset)):
+                other = set(other)
+            result = result.difference([e for e in result if e not in other])
+        return result
+
+    def symmetric_difference(self, other):
+        """S.symmetric_difference(other) -> PersistentSet of the elements in
+        exactly one of S and other"""
+        (root, n) = (self._root, self._len)
+        for e in set(other):
+            if e in self:
+                (root, n) = _without(root, n, (e,))
+            else:
+                (root, n) = _with(root, n, (e,))
+        return self._new(root, n)
+
+    def __or__(self, other):
+        if not isinstance(other, (Set, set, frozenset)):
+            return NotImplemented
+        return self.union(other)
+
+    def __and__(self, other):
+        if not isinstance(other, (Set, set, frozenset)):
+            return NotImplemented
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        if not isinstance(other, (Set, set, frozenset)):
+            return NotImplemented
+        return self.difference(other)
+
+    def __xor__(self, other):
+        if not isinstance(other, (Set, set, frozenset)):
+            return NotImplemented
+        return self.symmetric_difference(other)
+
+    __ror__ = __or__
+    __rand__ = __and__
+    __rxor__ = __xor__
+
+def _with(root, n, elements):
+    """(root, n) with the elements added"""
+    for e in elements:
+        (root, added) = _set(root, e, True)
+        n += added
+    return (root, n)
+
+def _without(root, n, elements):
+    """(root, n) with the elements removed"""
+    for e in elements:
+        if not n:
+            break
+        (root, removed) = _delete(root, e)
+        n -= removed
+    return (root, n)
+
+_EMPTY_SET = PersistentSet()
+
+
+class PersistentDictSet(Mapping):
+    """
+    An immutable dictionary of sets that shares its structure with the
+    versions it was made from.
+
+    The keys are held in a hash array mapped trie and every set is a
+    PersistentSet. add, discard, remove, set, update, union, ... return
+    a new version and leave the one they are called on unchanged; only
+    the O(log n) trie nodes on the path to a changed key or element are
+    copied, everything else is shared. So a snapshot is just a
+    reference to a version, and keeping many versions for what-if
+    analysis costs memory in proportion to their changes.
+
+    Like a DictSet, keys with empty sets don't count: they are not
+    stored at all.
+    """
+    __slots__ = ('_root', '_len')
+
+    def __init__(*args, **kwds): # args[0] -> 'self'
+        """
+            PersistentDictSet() -> new empty PersistentDictSet
+            PersistentDictSet(mapping) -> new PersistentDictSet initialized
+                from a mapping object's (key, value) pairs.
+            PersistentDictSet(iterable) -> new PersistentDictSet initialized
+                from the (key, value) pairs of iterable
+            PersistentDictSet(**kwargs) -> new PersistentDictSet initialized
+                with the name=value pairs in the keyword argument list.
+        """
+        if len(args) > 2:
+            raise TypeError('PersistentDictSet expected at most 1 arguments, '
+                            'got %d' % (len(args) - 1))
+        self = args[0]
+        (self._root, self._len) = (_EMPTY_NODE, 0)
+        if len(args) == 2:
+            (self._root, self._len) = self._union(args[1])
+        if kwds:
+            (self._root, self._len) = self._union(kwds)
+
+    @classmethod
+    def _make(cls, root, n):
+        obj = cls.__new__(cls)
+        (obj._root, obj._len) = (root, n)
+        return obj
+
+    def _new(self, root, n):
+        return self if root is self._root else self._make(root, n)
+
+    def _put(self, root, n, k, s):
+        """(root, n) with the set of k replaced by the PersistentSet s"""
+        if len(s):
+            (root, added) = _set(root, k, s)
+            return (root, n + added)
+        (root, removed) = _delete(root, k)
+        return (root, n - removed)
+
+    def _union(self, E):
+        """(root, n) of the union of DS and E"""
+        (root, n) = (self._root, self._len)
+        for (k, v) in _pairs(E):
+            s = _find(root, _hash(k), k)
+            s = (_EMPTY_SET if s is _missing else s).union(v)
+            (root, n) = self._put(root, n, k, s)
+        return (root, n)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for triple in _triples(self._root):
+            yield triple[1]
+
+    def __contains__(self, k):
+        """True if DS has a key k, else False"""
+        try:
+            return _find(self._root, _hash(k), k) is not _missing
+        except TypeError: # unhashable keys can't be in DS
+            return False
+
+    def __getitem__(self, k):
+        """DS[k] -> the PersistentSet of k, raises KeyError if k isn't a key"""
+        s = _find(self._root, _hash(k), k)
+        if s is _missing:
+            raise KeyError(k)
+        return s
+
+    def get(self, k, v=None):
+        """DS.get(k[,v]) -> DS[k] if k in DS, else v."""
+        s = _find(self._root, _hash(k), k)
+        return v if s is _missing else s
+
+    def items(self):
+        """DS.items() -> list of the (key, PersistentSet) pairs of DS"""
+        return [(k, v) for (h, k, v) in _triples(self._root)]
+
+    def __eq__(self, E):
+        """
+        DS==E -> True if the non-empty sets of DS and of the mapping E
+        are equal.
+        """
+        if not hasattr(E, 'keys'):
+            return False
+        try:
+            n = 0
+            for (k, w) in _pairs(E):
+                if len(w):
+                    s = self.get(k)
+                    if s is None or s != (w if isinstance(w, (Set, set, frozenset))
+                                            else frozenset(w)):
+                        return False
+                    n += 1
+            return n == self._len
+        except TypeError:
+            return False
+
+    def __ne__(self, E):
+        return not self == E
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (self.__class__, ([(k, list(v)) for (k, v) in self.items()],))
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__,
+                           [(k, set(v)) for (k, v) in self.items()])
+
+    def set(self, k, elements):
+        """DS.set(k, elements) -> version with DS[k] = set(elements)"""
+        s = elements if isinstance(elements, PersistentSet) \
+                     else PersistentSet(elements)
+        return self._new(*self._put(self._root, self._len, k, s))
+
+    def add(self, k, v):
+        """DS.add(k, v) -> version with the element v added to DS[k]"""
+        return self.set(k, self.get(k, _EMPTY_SET).add(v))
+
+    def remove(self, k, v=None):
+        """
+        DS.remove(k[, v]) -> version without the element v of DS[k], or
+        without the key k if v isn't supplied. Raises KeyError if k or
+        v isn't in DS.
+        """
+        s = self[k]
+        if v is None:
+            return self.set(k, ())
+        return self.set(k, s.remove(v))
+
+    def discard(self, k, v=None):
+        """
+        DS.discard(k[, v]) -> version without the element v of DS[k], or
+        without the key k if v isn't supplied.
+        """
+        if k not in self:
+            return self
+        if v is None:
+            return self.set(k, ())
+        return self.set(k, self[k].discard(v))
+
+    def update(self, E=(), **F):
+        """DS.update(E, **F) -> version with the sets of E and F added"""
+        result = self._new(*self._union(E))
+        return result._new(*result._union(F)) if F else result
+
+    def union(self, E):
+        """DS.union(E) -> version with the sets of E added. DS|E"""
+        return self._new(*self._union(E))
+
+    def difference(self, E):
+        """DS.difference(E) -> version without the elements of E. DS-E"""
+        (root, n) = (self._root, self._len)
+        for (k, v) in _pairs(E):
+            s = _find(root, _hash(k), k)
+            if s is not _missing:
+                (root, n) = self._put(root, n, k, s.difference(v))
+        return self._new(root, n)
+
+    def intersection(self, E):
+        """DS.intersection(E) -> version of the elements also in E. DS&E"""
+        get = _getter(E if isinstance(E, PersistentDictSet) else _as_mapping(E))
+        (root, n) = (self._root, self._len)
+        for (k, s) in self.items():
+            (root, n) = self._put(root, n, k, s.intersection(get(k)))
+        return self._new(root, n)
+
+    def symmetric_difference(self, E):
+        """DS.symmetric_difference(E) -> version of the elements in exactly
+        one of DS and E. DS^E"""
+        (root, n) = (self._root, self._len)
+        for (k, v) in _pairs(E):
+            s = _find(root, _hash(k), k)
+            s = (_EMPTY_SET if s is _missing else s).symmetric_difference(v)
+            (root, n) = self._put(root, n, k, s)
+        return self._new(root, n)
+
+    def __or__(self, E):
+        return self.union(E)
+
+    def __and__(self, E):
+        return self.intersection(E)
+
+    def __sub__(self, E):
+        return self.difference(E)
+
+    def __xor__(self, E):
+        return self.symmetric_difference(E)
+
+    def to_dictset(self):
+        """DS.to_dictset() -> DictSet with the sets of DS"""
+        return DictSet([(k, list(v)) for (k, v) in self.items()])
+
+def _pairs(E):
+    """the (key, elements) pairs of a mapping or an iterable of pairs"""
+    if isinstance(E, PersistentDictSet):
+        return E.items()
+    if hasattr(E, 'keys'):
+        return _items(E) if isinstance(E, DictSet) else E.items()
+    return E
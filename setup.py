@@ -25,7 +25,7 @@ setup(name='dictset',
                  "Topic :: Scientific/Engineering :: Mathematics",
                  "Topic :: Software Development :: Libraries :: Python Modules"],
     url='http://code.google.com/p/dictset/',
-    py_modules=['dictset'],
+    py_modules=['dictset', 'persistentdictset', 'sketchdictset'],
       )
 
 """setup.py sdist upload --identity="Roger Lew" --sign"""
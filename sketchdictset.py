@@ -0,0 +1,287 @@
+# Copyright (c) 2011, Roger Lew [see LICENSE.txt]
+# This software is funded in part by NIH Grant P20 RR016454.
+"""This module contains the SketchDictSet class"""
+
+try:
+    from collections.abc import MutableMapping
+except ImportError: # Python 2
+    from collections import MutableMapping
+
+import math
+from itertools import chain
+
+from dictset import _stable_hash64
+
+# HyperLogLog
+#
+# The first p bits of the 64 bit hash of an element pick one of the
+# 2**p registers, which keeps the largest number of leading zeros + 1
+# seen in the other 64 - p bits. The registers of sketches with the
+# same precision merge by taking their maximums, and the estimate has
+# a relative standard error of about 1.04 / sqrt(2**p). The hashes are
+# the same in every process, so sketches made in different processes
+# can be merged.
+DEFAULT_PRECISION = 12
+_MIN_PRECISION = 4
+_MAX_PRECISION = 16
+_HASH_BITS = 64
+_POWERS = [2.0 ** -i for i in range(_HASH_BITS + 1)]
+
+def _check_precision(precision):
+    if not _MIN_PRECISION <= precision <= _MAX_PRECISION:
+        raise ValueError('precision must be between %d and %d'
+                         % (_MIN_PRECISION, _MAX_PRECISION))
+
+def _alpha(m):
+    """the bias correction constant for m registers"""
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+class HyperLogLog(object):
+    """
+    A sketch of a set that estimates the number of distinct elements
+    added to it in a constant 2**precision bytes.
+
+    Elements can be added but not removed or listed. len(S) is the
+    estimated number of distinct elements, and S | T is the sketch of
+    the union of the elements of S and T.
+    """
+    __slots__ = ('_p', '_registers', '_estimate')
+
+    def __init__(self, iterable=(), precision=DEFAULT_PRECISION):
+        _check_precision(precision)
+        self._p = precision
+        self._registers = bytearray(1 << precision)
+        self._estimate = 0.0
+        self.update(iterable)
+
+    @property
+    def precision(self):
+        return self._p
+
+    def add(self, e):
+        """S.add(e) -> None. Adds the element e to S."""
+        x = _stable_hash64(e)
+        bits = _HASH_BITS - self._p
+        (i, w) = (x >> bits, x & ((1 << bits) - 1))
+        rank = bits - w.bit_length() + 1
+        if rank > self._registers[i]:
+            self._registers[i] = rank
+            self._estimate = None
+
+    def update(self, *iterables):
+        """S.update(*iterables) -> None. Adds the elements of iterables."""
+        for iterable in iterables:
+            for e in iterable:
+                self.add(e)
+
+    def _check(self, other):
+        if not isinstance(other, HyperLogLog):
+            raise TypeError('expected a HyperLogLog, got %s'
+                            % type(other).__name__)
+        if other._p != self._p:
+            raise ValueError('sketches with precisions %d and %d can not '
+                             'be merged' % (self._p, other._p))
+
+    def merge(self, *others):
+        """S.merge(*others) -> None. Merges the sketches others into S."""
+        for other in others:
+            self._check(other)
+            self._registers = bytearray(map(max, self._registers,
+                                            other._registers))
+            self._estimate = None
+
+    def union(self, *others):
+        """S.union(*others) -> new HyperLogLog of S merged with others"""
+        result = self.copy()
+        result.merge(*others)
+        return result
+
+    def __or__(self, other):
+        if not isinstance(other, HyperLogLog):
+            return NotImplemented
+        return self.union(other)
+
+    def __ior__(self, other):
+        if not isinstance(other, HyperLogLog):
+            return NotImplemented
+        self.merge(other)
+        return self
+
+    def estimate(self):
+        """S.estimate() -> float, the estimated number of distinct elements"""
+        if self._estimate is None:
+            registers = self._registers
+            m = len(registers)
+            e = _alpha(m) * m * m / sum(map(_POWERS.__getitem__, registers))
+            zeros = registers.count(b'\x00')
+            if e <= 2.5 * m and zeros:
+                # few elements, count the empty registers instead
+                e = m * math.log(float(m) / zeros)
+            self._estimate = e
+        return self._estimate
+
+    def __len__(self):
+        return int(round(self.estimate()))
+
+    def copy(self):
+        """S.copy() -> a copy of S"""
+        result = self.__class__.__new__(self.__class__)
+        result._p = self._p
+        result._registers = bytearray(self._registers)
+        result._estimate = self._estimate
+        return result
+
+    def __eq__(self, other):
+        if not isinstance(other, HyperLogLog):
+            return False
+        return self._p == other._p and self._registers == other._registers
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (self.__class__, ((), self._p), bytes(self._registers))
+
+    def __setstate__(self, state):
+        self._registers = bytearray(state)
+        self._estimate = None
+
+    def __repr__(self):
+        return '%s(precision=%d, estimate=%d)' % (self.__class__.__name__,
+                                                  self._p, len(self))
+
+
+class SketchDictSet(MutableMapping):
+    """
+    A dictionary of HyperLogLog sketches for counting the distinct
+    elements of every key of a stream, in constant memory per key.
+
+    It takes its input like a DictSet: add(k, v), update with a mapping
+    or (key, elements) pairs, and add_pairs or from_pairs for a stream
+    of (key, element) pairs. But the elements themselves are not kept,
+    so DS[k] is the HyperLogLog of k, len(DS[k]) the estimated number
+    of distinct elements of k, and the set operations are limited to
+    union.
+    """
+    def __init__(self, E=(), precision=DEFAULT_PRECISION):
+        """
+            SketchDictSet([E[, precision]]) -> new SketchDictSet with
+                the (key, elements) pairs of the mapping or iterable E,
+                keeping sketches of 2**precision registers.
+        """
+        _check_precision(precision)
+        self.precision = precision
+        self._sketches = {}
+        self.update(E)
+
+    @classmethod
+    def from_pairs(cls, pairs, precision=DEFAULT_PRECISION):
+        """
+        SketchDictSet.from_pairs(pairs[, precision]) -> new
+        SketchDictSet from an iterable of (key, element) pairs
+        """
+        result = cls(precision=precision)
+        result.add_pairs(pairs)
+        return result
+
+    def _sketch(self, k):
+        """the sketch of k, created if k isn't a key"""
+        s = self._sketches.get(k)
+        if s is None:
+            s = self._sketches[k] = HyperLogLog((), self.precision)
+        return s
+
+    def _as_sketch(self, v):
+        """v as a sketch with the precision of DS"""
+        if isinstance(v, HyperLogLog):
+            if v.precision != self.precision:
+                raise ValueError('expected a sketch with precision %d, '
+                                 'got %d' % (self.precision, v.precision))
+            return v.copy()
+        return HyperLogLog(v, self.precision)
+
+    def __getitem__(self, k):
+        return self._sketches[k]
+
+    def __setitem__(self, k, v):
+        """DS[k] = v, a HyperLogLog or an iterable of elements"""
+        self._sketches[k] = self._as_sketch(v)
+
+    def __delitem__(self, k):
+        del self._sketches[k]
+
+    def __iter__(self):
+        return iter(self._sketches)
+
+    def __len__(self):
+        return len(self._sketches)
+
+    def __contains__(self, k):
+        return k in self._sketches
+
+    def add(self, k, v=None):
+        """
+        DS.add(k[, v]) -> None. Adds the element v to the sketch of k,
+        or only the key k with an empty sketch if v isn't supplied.
+        """
+        s = self._sketch(k)
+        if v is not None:
+            s.add(v)
+
+    def add_pairs(self, pairs):
+        """DS.add_pairs(pairs) -> None. Adds the (key, element) pairs."""
+        sketches = self._sketches
+        for (k, e) in pairs:
+            s = sketches.get(k)
+            if s is None:
+                s = self._sketch(k)
+            s.add(e)
+
+    def update(self, E=(), **F):
+        """
+        DS.update(E, **F) -> None. Adds the elements of the (key,
+        elements) pairs of the mapping or iterable E and of F. Sketches
+        are merged.
+        """
+        pairs = E.items() if hasattr(E, 'keys') else E
+        for (k, v) in chain(pairs, F.items()):
+            s = self._sketch(k)
+            if isinstance(v, HyperLogLog):
+                s.merge(v)
+            else:
+                s.update(v)
+
+    def union(self, E):
+        """DS.union(E) -> new SketchDictSet with the sketches of E merged. DS|E"""
+        result = self.copy()
+        result.update(E)
+        return result
+
+    def __or__(self, E):
+        return self.union(E)
+
+    def __ior__(self, E):
+        self.update(E)
+        return self
+
+    def copy(self):
+        """DS.copy() -> a copy of DS"""
+        result = self.__class__(precision=self.precision)
+        for (k, s) in self._sketches.items():
+            result._sketches[k] = s.copy()
+        return result
+
+    def counts(self):
+        """DS.counts() -> dict of the estimated distinct counts of the keys"""
+        return dict((k, len(s)) for (k, s) in self._sketches.items())
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, list(self.counts().items()))
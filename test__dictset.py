@@ -5,6 +5,7 @@
 This unittest tests the dictset module.
 """
 
+import os
 import sys
 import unittest
 import doctest
@@ -14,7 +15,9 @@ from random import shuffle
 from string import digits,ascii_lowercase
 
 import dictset
-from dictset import DictSet
+import bench__dictset
+from dictset import DictSet, CompactDictSet, InterningDictSet, Delta
+from dictset import DictSetView
 
 # First we need to define some translator functions so we
 # can compare DictSets without relying on DictSet itself.
@@ -341,6 +344,87 @@ class TestDictSet_copy(unittest.TestCase):
 
         self.assertEqual(d2l(M),R2)
 
+    def test2(self):
+        # the in-place operators on a copy leave DS alone
+        for op in ('__ior__', '__iand__', '__isub__', '__ixor__'):
+            for cls in (DictSet, CompactDictSet, InterningDictSet):
+                L = cls(s2d('a12 c5678'))
+                M = L.copy()
+                getattr(M, op)(s2d('a23 c5'))
+                self.assertEqual(d2l(L), s2l('a12 c5678'))
+
+class TestDictSet_view(unittest.TestCase):
+    def test0(self):
+        L = DictSet(s2d('a123 b45 c6 d0'))
+        V = L.view('acdza')
+        self.assertTrue(isinstance(V, DictSetView))
+        self.assertEqual(list(V), ['a', 'c'])
+        self.assertEqual(len(V), 2)
+        self.assertTrue('a' in V)
+        self.assertFalse('b' in V)
+        self.assertFalse([] in V)
+        self.assertEqual(V['a'], frozenset('123'))
+        self.assertEqual(V['d'], frozenset())
+        self.assertRaises(KeyError, V.__getitem__, 'b')
+        self.assertEqual(V.get('b'), None)
+        self.assertEqual(V.get('b', '9'), set('9'))
+        self.assertEqual(d2l(V), s2l('a123 c6'))
+        self.assertEqual(V.to_dictset(), DictSet(s2d('a123 c6')))
+
+    def test1(self):
+        # the view shows the current sets of DS
+        L = DictSet(s2d('a123 b45'))
+        V = L.view('ac')
+        L.add('c', '7')
+        L.discard('a')
+        self.assertEqual(d2l(V), s2l('c7'))
+
+    def test2(self):
+        L = DictSet(s2d('a123 b45 c6'))
+        V = L.view('ac')
+        R = DictSet(s2d('a123 c6'))
+        M = s2d('a19 c7 e1')
+        for op in ('__or__', '__and__', '__sub__', '__xor__'):
+            self.assertEqual(getattr(V, op)(M), getattr(R, op)(M))
+            self.assertEqual(getattr(L, op)(V), getattr(L, op)(R))
+        self.assertTrue(isinstance(V | M, DictSet))
+
+    def test3(self):
+        L = DictSet(s2d('a123 b45 c6'))
+        V = L.view('ac')
+        self.assertTrue(V == s2d('a321 c6'))
+        self.assertTrue(DictSet(s2d('a321 c6')) == V)
+        self.assertTrue(V != L)
+        self.assertTrue(V <= L and V < L and L >= V and L > V)
+        self.assertFalse(V > L)
+        self.assertTrue(V.isdisjoint(s2d('a4 b6')))
+        self.assertFalse(L.isdisjoint(V))
+
+    def test4(self):
+        # views are read in place, not copied into a DictSet
+        L = DictSet(s2d('a123 b45 c6'))
+        V = L.view('ac')
+        self.assertTrue(dictset._as_dictset(V) is V)
+        M = DictSet(s2d('a14 c0'))
+        M |= V
+        M -= L.view('c')
+        self.assertEqual(d2l(M), s2l('a1234'))
+
+    def test5(self):
+        # DSV[k] reads the set of DS in place instead of copying it
+        L = DictSet(s2d('a123 b45'))
+        V = L.view('ab')
+        a = V['a']
+        L.add('a', '4')
+        self.assertEqual(a, frozenset('1234'))
+        self.assertTrue('4' in a and len(a) == 4)
+        self.assertEqual(a | set('9'), frozenset('12349'))
+        self.assertTrue(isinstance(a & V['b'], frozenset))
+        self.assertTrue(a.issubset('123456') and a.issuperset('12'))
+        self.assertEqual(a.copy(), frozenset('1234'))
+        self.assertFalse(hasattr(a, 'add'))
+        self.assertEqual(dict(V.items()), {'a': set('1234'), 'b': set('45')})
+
 class TestDictSet_fromkeys(unittest.TestCase):
     def test0(self):
         L  = DictSet(s2d('a1 c5678'))
@@ -425,6 +509,112 @@ class TestDictSet_discard(unittest.TestCase):
         L.discard('a')
         L.discard('a') # Shouldn't complain
         
+class TestDictSet_add_many(unittest.TestCase):
+    def test0(self):
+        L = DictSet(s2d('a1 c56'))
+        L.add_many('a', '234')
+        L.add_many('d', iter('78'))
+        L.add_many('e', [])
+        self.assertEqual(d2l(L), s2l('a1234 c56 d78 e0'))
+
+    def test1(self):
+        L = DictSet(s2d('a1 c56'))
+        L.add_many([('a', '2'), ('c', '7'), ('a', '3'), ('b', '9')])
+        self.assertEqual(d2l(L), s2l('a123 b9 c567'))
+
+    def test2(self):
+        # one change event list per call
+        L = DictSet(s2d('a1'))
+        events = []
+        L.subscribe(events.append)
+        L.add_many([('a', '2'), ('b', '3')])
+        self.assertEqual(len(events), 1)
+
+    def test3(self):
+        L = CompactDictSet(s2d('a1 c56'))
+        L.add_many([('a', '2'), ('c', '7')])
+        self.assertEqual(d2l(L), s2l('a12 c567'))
+
+class TestDictSet_discard_many(unittest.TestCase):
+    def test0(self):
+        L = DictSet(s2d('a1234 c56'))
+        L.discard_many('a', '249')
+        L.discard_many('d', '1')
+        self.assertEqual(d2l(L), s2l('a13 c56'))
+
+    def test1(self):
+        L = DictSet(s2d('a1234 c56'))
+        L.discard_many([('a', '1'), ('c', '5'), ('c', '6'), ('d', '1'),
+                        ('a', '9')])
+        self.assertEqual(d2l(L), s2l('a234 c0'))
+
+class TestDictSet_remove_many(unittest.TestCase):
+    def test0(self):
+        L = DictSet(s2d('a1234 c56'))
+        L.remove_many('a', '24')
+        self.assertEqual(d2l(L), s2l('a13 c56'))
+        L.remove_many([('a', '1'), ('c', '6')])
+        self.assertEqual(d2l(L), s2l('a3 c5'))
+
+    def test1(self):
+        # nothing is removed when a key or an element is missing
+        L = DictSet(s2d('a1234 c56'))
+        self.assertRaises(KeyError, L.remove_many, 'a', '19')
+        self.assertRaises(KeyError, L.remove_many, 'd', '1')
+        self.assertRaises(KeyError, L.remove_many,
+                          [('a', '1'), ('c', '7')])
+        self.assertEqual(d2l(L), s2l('a1234 c56'))
+
+class TestDictSet_keys(unittest.TestCase):
+    def test0(self):
+        # only the named keys are combined, the others are kept
+        L = DictSet(s2d('a123 b45 c6'))
+        M = DictSet(s2d('a34 b5 d7'))
+        self.assertEqual(d2l(L.union(M, keys='ad')), s2l('a1234 b45 c6 d7'))
+        self.assertEqual(d2l(L.intersection(M, keys='ab')),
+                         s2l('a3 b5 c6'))
+        self.assertEqual(d2l(L.difference(M, keys='bc')), s2l('a123 b4 c6'))
+        self.assertEqual(d2l(L.symmetric_difference(M, keys='a')),
+                         s2l('a124 b45 c6'))
+        self.assertEqual(d2l(L), s2l('a123 b45 c6'))
+
+    def test1(self):
+        # the defaults agree with the keys of both DictSets
+        L = DictSet(s2d('a123 b45 c6 e'))
+        M = DictSet(s2d('a34 b5 d7 e'))
+        keys = set(L) | set(M)
+        for op in ['union', 'intersection', 'difference',
+                   'symmetric_difference']:
+            self.assertEqual(getattr(L, op)(M),
+                             getattr(L, op)(M, keys=keys))
+
+    def test2(self):
+        # the other keys are left alone by the updates
+        for (op, R) in [('intersection_update', 'a3 b45 c6'),
+                        ('difference_update', 'a12 b45 c6'),
+                        ('symmetric_difference_update', 'a124 b45 c6 d7')]:
+            L = DictSet(s2d('a123 b45 c6'))
+            getattr(L, op)(DictSet(s2d('a34 b5 d7')), keys='ad')
+            self.assertEqual(d2l(L), s2l(R))
+
+    def test4(self):
+        # the operators agree with the updates on the same keys
+        L = DictSet(s2d('a123 b45 c6'))
+        M = DictSet(s2d('a34 b5 d7'))
+        for op in ['intersection', 'difference', 'symmetric_difference']:
+            for keys in ['', 'a', 'ad', 'bcd', 'abcde']:
+                R = DictSet(L)
+                getattr(R, op + '_update')(M, keys=keys)
+                self.assertEqual(getattr(L, op)(M, keys=keys), R)
+        self.assertEqual(d2l(L), s2l('a123 b45 c6'))
+
+    def test3(self):
+        # sets shared with the result aren't changed through it
+        L = DictSet(s2d('a12 b3'))
+        R = L.union(DictSet(s2d('b4')))
+        R.add('a', '9')
+        self.assertEqual(d2l(L), s2l('a12 b3'))
+
 class TestDictSet__setitem__(unittest.TestCase):
     def test0(self):
         L = DictSet(s2d('a1 c5666788'))
@@ -488,6 +678,39 @@ class TestDictSet_get(unittest.TestCase):
         self.assertEqual(L.get('d','234'),set('234'))
         self.assertEqual(d2l(L),R)
 
+class TestDictSet_get_many(unittest.TestCase):
+    def test0(self):
+        L = DictSet(s2d('a1 b0 c5666788'))
+        self.assertEqual(L.get_many(['c', 'b', 'd', 'a']),
+                         [set('5678'), None, None, set('1')])
+        self.assertEqual(L.get_many('cd', '23'), [set('5678'), set('23')])
+        self.assertEqual(L.get_many([[]]), [None])
+        self.assertEqual(L.get_many([]), [])
+
+    def test1(self):
+        L = DictSet(s2d('a1 b0 c5666788'))
+        self.assertEqual(L.has_keys(['a', 'b', 'c', 'd', []]),
+                         [True, False, True, False, False])
+
+    def test2(self):
+        L = DictSet(s2d('a1 b0 c5666788'))
+        pairs = [('a', '1'), ('a', '5'), ('b', '1'), ('c', '8'), ('d', '1'),
+                 ([], '1')]
+        R = [True, False, False, True, False, False]
+        self.assertEqual(L.contains_many(pairs), R)
+        L.enable_bloom()
+        self.assertEqual(L.contains_many(pairs), R)
+
+    def test3(self):
+        # inline and tracked sets are handed out like with get
+        L = CompactDictSet(s2d('a1 c56'))
+        self.assertEqual(L.get_many('ac'), [L.get('a'), L.get('c')])
+        L.get_many('a')[0].add('2')
+        self.assertEqual(L['a'], set('12'))
+        L.enable_size_index()
+        L.get_many('c')[0].add('7')
+        self.assertEqual(L.top_k(1), [('c', 3)])
+
 class TestDictSet_setdefault(unittest.TestCase):
     def test0(self):
         L = DictSet(s2d('a1 c5666788'))
@@ -510,6 +733,23 @@ class TestDictSet_setdefault(unittest.TestCase):
         
         self.assertEqual(L.setdefault('d','234'),set('234'))
         self.assertEqual(d2l(L),R)
+
+    def test4(self):
+        # a key with an empty set isn't created again
+        L = DictSet(s2d('a0'))
+        events = []
+        L.subscribe(events.extend)
+        L.setdefault('a', '1')
+        self.assertEqual([e[0] for e in events], ['add'])
+
+        L = DictSet(s2d('a0'))
+        try:
+            with L.transaction():
+                L.setdefault('a', '1')
+                raise KeyError
+        except KeyError:
+            pass
+        self.assertEqual(d2l(L), s2l('a0'))
         
 ## update functions
 class TestDictSet_update(unittest.TestCase):
@@ -1428,6 +1668,941 @@ class TestDictSet__ge__(unittest.TestCase):
         M = {}
         self.assertTrue(L>=M)
 
+class TestDictSet__lt__(unittest.TestCase):
+    def test0(self):
+        L = DictSet()
+        M = s2d('a1 c5666788')
+        self.assertTrue(L<M)
+
+    def test1(self):
+        L = DictSet(s2d('a1 c5678'))
+        M = s2d('a1 c5666788 d0')
+        self.assertFalse(L<M)
+
+    def test2(self):
+        L = DictSet(s2d('a1 c567'))
+        M = [('a','1'),('c','5678')]
+        self.assertTrue(L<M)
+
+    def test3(self):
+        L = DictSet(s2d('a12 c567'))
+        M = s2d('a1 c5678')
+        self.assertFalse(L<M)
+
+class TestDictSet__gt__(unittest.TestCase):
+    def test0(self):
+        L = DictSet(s2d('a1 c5666788'))
+        M = {}
+        self.assertTrue(L>M)
+
+    def test1(self):
+        L = DictSet(s2d('a1 c5678 d0'))
+        M = s2d('a1 c5666788')
+        self.assertFalse(L>M)
+
+    def test2(self):
+        L = DictSet(s2d('a1 c5678 e9'))
+        M = [('a','1'),('c','56')]
+        self.assertTrue(L>M)
+
+class TestDictSet_isdisjoint(unittest.TestCase):
+    def test0(self):
+        L = DictSet()
+        M = s2d('a1 c5666788')
+        self.assertTrue(L.isdisjoint(M))
+
+    def test1(self):
+        L = DictSet(s2d('a1 c5678'))
+        M = s2d('a23 b1 c9 d0')
+        self.assertTrue(L.isdisjoint(M))
+
+    def test2(self):
+        L = DictSet(s2d('a1 c5678'))
+        M = s2d('a23 b1 c9 d0 e1 f2 g3')
+        self.assertTrue(L.isdisjoint(M))
+        self.assertFalse(L.isdisjoint(s2d('a23 b1 c5 d0 e1 f2 g3')))
+
+    def test3(self):
+        L = DictSet(s2d('a1 c5678'))
+        M = [('c','95')]
+        self.assertFalse(L.isdisjoint(M))
+
+    def test4(self):
+        with self.assertRaises(TypeError) as cm:
+            DictSet().isdisjoint(4)
+
+        self.assertEqual(str(cm.exception),
+                 "'int' object is not iterable")
+
+class TestDictSet_comparison_short_circuit(unittest.TestCase):
+    """the comparisons stop at the first failing key"""
+    class Counting(dict):
+        def get(self, k, v=None):
+            self.n = getattr(self, 'n', 0) + 1
+            return dict.get(self, k, v)
+
+    def test0(self):
+        L = DictSet([(i, [i]) for i in range(100)])
+        M = self.Counting((i, set([-i-1])) for i in range(100))
+        self.assertFalse(L.issubset(M))
+        self.assertEqual(M.n, 1)
+
+    def test1(self):
+        L = DictSet([(i, [i]) for i in range(100)])
+        M = self.Counting((i, set([i])) for i in range(100))
+        self.assertTrue(L.issubset(M))
+        self.assertEqual(M.n, 100)
+
+    def test2(self):
+        # plain dicts are used without being copied
+        v = set([1])
+        M = {'a': v}
+        self.assertTrue(DictSet(a=[1]).issubset(M))
+        self.assertTrue(M['a'] is v)
+
+    def test3(self):
+        # == stops at the first key with a different set
+        L = DictSet([(i, [i]) for i in range(100)])
+        M = self.Counting((i, set([-i-1])) for i in range(100))
+        self.assertFalse(L == M)
+        self.assertEqual(M.n, 1)
+
+    def test4(self):
+        # == doesn't copy E
+        v = set([1])
+        M = {'a': v, 'b': set()}
+        self.assertTrue(DictSet(a=[1]) == M)
+        self.assertTrue(M['a'] is v)
+
+class TestDictSet_fingerprint(unittest.TestCase):
+    def test0(self):
+        # equal DictSets have equal fingerprints
+        L = DictSet(s2d('a123 b45 c0'))
+        M = CompactDictSet(s2d('b54 a321'))
+        self.assertEqual(L.fingerprint(), M.fingerprint())
+
+    def test1(self):
+        L = DictSet(s2d('a123 b45'))
+        self.assertNotEqual(L.fingerprint(),
+                            DictSet(s2d('a123 b4')).fingerprint())
+        self.assertNotEqual(L.fingerprint(),
+                            DictSet(s2d('a123 c45')).fingerprint())
+        self.assertNotEqual(L.fingerprint(),
+                            DictSet(s2d('a12345')).fingerprint())
+
+    def test2(self):
+        # the maintained fingerprint follows the mutating methods
+        L = DictSet(s2d('a123 b45'))
+        L.enable_fingerprint()
+        L.add('c', '7')
+        L.add('d')
+        L.discard('a', '1')
+        L.remove('b', '4')
+        L.update(s2d('a9 e12'))
+        L |= DictSet(s2d('f1'))
+        L.difference_update(s2d('e1'))
+        L.intersection_update(s2d('a239 b5 c7 e2 f1'))
+        L.symmetric_difference_update(s2d('a2 g3'))
+        L['h'] = '12'
+        L.setdefault('i', '3')
+        del L['h']
+        L.pop('i')
+        L.clear()
+        L.update(s2d('a1 b2'))
+        L.popitem()
+        self.assertEqual(L.fingerprint(),
+                         DictSet(dict(L.items())).fingerprint())
+        L.disable_fingerprint()
+
+    def test3(self):
+        # sets handed out by DS[k] are rehashed
+        L = DictSet(s2d('a123'))
+        L.enable_fingerprint()
+        L['a'].add('4')
+        s = set('9')
+        L['b'] = s
+        s.add('8')
+        self.assertEqual(L.fingerprint(),
+                         DictSet(s2d('a1234 b89')).fingerprint())
+
+    def test4(self):
+        # unequal fingerprints reject without comparing the sets
+        L = DictSet(s2d('a123 b45'))
+        M = DictSet(s2d('a123 b46'))
+        L.enable_fingerprint()
+        M.enable_fingerprint()
+        dict.__setitem__(M, 'b', set(['4', '5'])) # bypasses the tracking
+        self.assertFalse(L == M)
+        self.assertTrue(L != M)
+        M.disable_fingerprint()
+        self.assertTrue(L == M)
+
+    def test5(self):
+        # copies don't share the fingerprint
+        from copy import copy, deepcopy
+        import pickle
+        L = DictSet(s2d('a123'))
+        L.enable_fingerprint()
+        for M in (L.copy(), copy(L), deepcopy(L),
+                  pickle.loads(pickle.dumps(L))):
+            self.assertEqual(M.__dict__, {})
+            M.add('a', '4')
+            self.assertEqual(d2l(L), s2l('a123'))
+            self.assertEqual(L.fingerprint(), DictSet(s2d('a123')).fingerprint())
+
+    def test6(self):
+        # sets handed out by items() and values() are followed
+        L = DictSet(s2d('a12 b3'))
+        L.enable_fingerprint()
+        R = DictSet(s2d('a129 b39'))
+        R.enable_fingerprint()
+        self.assertFalse(L == R)
+        for v in L.values():
+            v.add('9')
+        self.assertTrue(L == R)
+        for (k, v) in L.items():
+            v.discard('9')
+        self.assertEqual(L.fingerprint(), DictSet(s2d('a12 b3')).fingerprint())
+
+class TestDictSet_digest(unittest.TestCase):
+    def test0(self):
+        # the digest doesn't depend on the process (or its hash seed)
+        import os, subprocess
+        code = ("from dictset import DictSet; "
+                "print(DictSet(a=['x', 1, (2, 'y')], b=[2.5], c=[]).digest())")
+        out = []
+        for seed in ('1', '2'):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            out.append(subprocess.check_output([sys.executable, '-c', code],
+                                               env=env).strip())
+        self.assertEqual(out[0], out[1])
+        L = DictSet(a=['x', 1, (2, 'y')], b=[2.5])
+        self.assertEqual(out[0].decode('ascii'), L.digest())
+
+    def test1(self):
+        # equal DictSets have equal digests
+        L = DictSet(a=[1, 2], b=['x'], c=[])
+        M = CompactDictSet(b=['x'], a=[2.0, 1])
+        self.assertEqual(L.digest(), M.digest())
+        self.assertNotEqual(L.digest(), DictSet(a=[1, 2], b=['y']).digest())
+        self.assertNotEqual(L.digest(), DictSet(a=[1, 2], c=['x']).digest())
+
+    def test2(self):
+        # the digest is updated by the mutating methods
+        L = DictSet(s2d('a123 b45'))
+        L.enable_digest()
+        L.add('c', '7')
+        L.discard('a', '1')
+        L.update(s2d('a9 e12'))
+        L.difference_update(s2d('e1'))
+        L.symmetric_difference_update(s2d('a2 g3'))
+        L['b'].add('6')
+        self.assertEqual(L.digest(), DictSet(dict(L.items())).digest())
+        self.assertEqual(L.key_digest('b'), DictSet(s2d('b456')).digest())
+        L.disable_digest()
+        self.assertEqual(L.digest(), DictSet(dict(L.items())).digest())
+
+    def test3(self):
+        # the digest is the sum of the key digests
+        L = DictSet(s2d('a123 b45 c0'))
+        self.assertEqual(L.key_digest('c'), '0' * 16)
+        self.assertEqual(L.key_digest('d'), '0' * 16)
+        total = sum(int(L.key_digest(k), 16) for k in L) % 2**64
+        self.assertEqual(L.digest(), '%016x' % total)
+
+    def test4(self):
+        # unequal digests don't make equal DictSets unequal
+        from decimal import Decimal
+        L = DictSet(a=[1])
+        M = DictSet(a=[Decimal(1)])
+        L.enable_digest()
+        M.enable_digest()
+        self.assertTrue(L == M)
+
+class TestDictSet_diff(unittest.TestCase):
+    def test0(self):
+        L = DictSet(s2d('a123 b45 c6 d0'))
+        M = DictSet(s2d('a234 b45 e7 d0'))
+        D = L.diff(M)
+        self.assertTrue(isinstance(D, Delta))
+        self.assertEqual(D, {'a': (frozenset('4'), frozenset('1')),
+                             'c': (frozenset(), frozenset('6')),
+                             'e': (frozenset('7'), frozenset())})
+        L.apply(D)
+        self.assertEqual(d2l(L), d2l(M))
+
+    def test1(self):
+        # E doesn't have to be a DictSet
+        L = DictSet(s2d('a123'))
+        self.assertEqual(L.diff(s2d('a123 b0')), {})
+        self.assertEqual(L.diff(s2d('a12')), {'a': (frozenset(), frozenset('3'))})
+
+    def test2(self):
+        # deltas compose
+        L = DictSet(s2d('a123 b45 c6'))
+        M = DictSet(s2d('a234 b4 d7'))
+        N = DictSet(s2d('a1 b45 d78 e9'))
+        D = L.diff(M).compose(M.diff(N))
+        self.assertEqual(D, L.diff(N))
+        L.apply(D)
+        self.assertEqual(d2l(L), d2l(N))
+
+    def test3(self):
+        # inverse deltas undo and deltas survive serialization
+        import pickle, json
+        L = DictSet(s2d('a123 b45 c6'))
+        M = DictSet(s2d('a234 b4 d7'))
+        D = L.diff(M)
+        self.assertEqual(pickle.loads(pickle.dumps(D)), D)
+        self.assertEqual(Delta.from_dict(json.loads(json.dumps(D.as_dict()))), D)
+        N = DictSet(s2d('a123 b45 c6'))
+        N.apply(D)
+        N.apply(D.inverse())
+        self.assertEqual(d2l(N), d2l(L))
+
+    def test4(self):
+        # with digests only the keys with different digests are compared
+        L = DictSet([(i, [i]) for i in range(100)])
+        M = DictSet([(i, [i]) for i in range(100)])
+        L.enable_digest()
+        M.enable_digest()
+        self.assertEqual(list(L._changed_keys(M)), [])
+        self.assertEqual(L.diff(M), {})
+        M.add(5, 'x')
+        M.discard(7, 7)
+        M.add(200, 'y')
+        self.assertEqual(sorted(L._changed_keys(M)), [5, 7, 200])
+        self.assertEqual(L.diff(M), {5: (frozenset(['x']), frozenset()),
+                                     7: (frozenset(), frozenset([7])),
+                                     200: (frozenset(['y']), frozenset())})
+
+class TestDictSet_subscribe(unittest.TestCase):
+    def setUp(self):
+        self.L = DictSet(s2d('a12 b3'))
+        self.events = []
+        self.L.subscribe(self.events.append)
+
+    def test0(self):
+        L = self.L
+        L.add('a', '3')
+        L.add('a', '3') # no change, no event
+        L.add('c')
+        L.discard('a', '1')
+        L.remove('b', '3')
+        del L['b']
+        self.assertEqual(self.events,
+            [[('add', 'a', frozenset('3'))],
+             [('create', 'c', frozenset())],
+             [('remove', 'a', frozenset('1'))],
+             [('remove', 'b', frozenset('3'))],
+             [('drop', 'b', frozenset())]])
+
+    def test1(self):
+        # bulk methods deliver one batch
+        L = self.L
+        L.update(s2d('a4 d5'))
+        L.difference_update(s2d('a1'))
+        L.symmetric_difference_update(s2d('a2 e6'))
+        L.intersection_update(s2d('a34 d5 e6'))
+        # the order of the keys within a batch is arbitrary
+        self.assertEqual([sorted(batch) for batch in self.events],
+            [[('add', 'a', frozenset('4')),
+              ('add', 'd', frozenset('5')), ('create', 'd', frozenset())],
+             [('remove', 'a', frozenset('1'))],
+             [('add', 'e', frozenset('6')), ('create', 'e', frozenset()),
+              ('remove', 'a', frozenset('2'))],
+             [('drop', 'b', frozenset()), ('remove', 'b', frozenset('3'))]])
+
+    def test2(self):
+        L = self.L
+        L['a'] = '23'
+        L['c'] = '4'
+        with L.batch():
+            L.add('a', '5')
+            L.discard('c')
+        self.assertEqual(self.events,
+            [[('add', 'a', frozenset('3')), ('remove', 'a', frozenset('1'))],
+             [('create', 'c', frozenset()), ('add', 'c', frozenset('4'))],
+             [('add', 'a', frozenset('5')),
+              ('remove', 'c', frozenset('4')), ('drop', 'c', frozenset())]])
+
+    def test3(self):
+        # unbatched callbacks get one call per event
+        calls = []
+        self.L.subscribe(lambda *event: calls.append(event), batched=False)
+        self.L.update(s2d('a3 b4'))
+        self.assertEqual(calls, [('add', 'a', frozenset('3')),
+                                 ('add', 'b', frozenset('4'))])
+
+    def test4(self):
+        self.L.unsubscribe(self.events.append)
+        self.L.add('a', '9')
+        self.assertEqual(self.events, [])
+        self.assertRaises(ValueError, self.L.unsubscribe, self.events.append)
+
+    def test5(self):
+        # the events can maintain a derived count
+        counts = {'n': sum(len(v) for v in self.L.values())}
+        def count(events):
+            for (kind, k, elements) in events:
+                counts['n'] += {'add': 1, 'remove': -1}.get(kind, 0) * len(elements)
+        self.L.subscribe(count)
+        self.L.update(s2d('a34 c5'))
+        self.L -= DictSet(s2d('a1')) # in place, DS is still subscribed
+        self.L.difference_update(s2d('a1 c5'))
+        self.L.pop('b')
+        self.assertEqual(counts['n'], sum(len(v) for v in self.L.values()))
+
+class TestDictSet_transaction(unittest.TestCase):
+    def test0(self):
+        # the changes stay when the block succeeds
+        L = DictSet(s2d('a12 b3'))
+        with L.transaction():
+            L.update(s2d('a4 c5'))
+            L.difference_update(s2d('b3'))
+        self.assertEqual(d2l(L), s2l('a124 c5'))
+        self.assertEqual(L._trackers, ())
+
+    def test1(self):
+        # the changes are undone when the block raises
+        L = DictSet(s2d('a12 b3 d0'))
+        R = d2l(L)
+        def f():
+            with L.transaction():
+                L.update(s2d('a4 c5'))
+                L.difference_update(s2d('b3'))
+                L.symmetric_difference_update(s2d('a1 e6'))
+                L.intersection_update(s2d('a24 c5'))
+                L.discard('d')
+                L['f'] = '78'
+                L.add('g')
+                L.clear()
+                raise ValueError
+        self.assertRaises(ValueError, f)
+        self.assertEqual(d2l(L), R)
+        self.assertEqual(L._trackers, ())
+
+    def test2(self):
+        # sets changed through DS[k] are restored in place
+        L = DictSet(s2d('a12'))
+        s = set('9')
+        try:
+            with L.transaction():
+                L['a'].add('3')
+                L['b'] = s
+                s.add('8')
+                L['a'].discard('1')
+                raise KeyError
+        except KeyError:
+            pass
+        self.assertEqual(d2l(L), s2l('a12'))
+
+    def test3(self):
+        # an inner transaction undoes only its own changes
+        L = DictSet(s2d('a12'))
+        with L.transaction():
+            L.add('a', '3')
+            try:
+                with L.transaction():
+                    L.add('a', '4')
+                    L.remove('a', '1')
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(d2l(L), s2l('a123'))
+
+    def test4(self):
+        # subscribers are told about the undone changes, also in a batch
+        L = DictSet(s2d('a12'))
+        events = []
+        L.subscribe(events.extend)
+        try:
+            with L.batch():
+                with L.transaction():
+                    L.add('a', '3')
+                    L.discard('a', '1')
+                    raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(d2l(L), s2l('a12'))
+        added = [e for (kind, k, elements) in events if kind == 'add'
+                   for e in elements]
+        removed = [e for (kind, k, elements) in events if kind == 'remove'
+                     for e in elements]
+        self.assertEqual(sorted(added), sorted(removed))
+
+class TestDictSet_size_index(unittest.TestCase):
+    def check(self, L):
+        sizes = dict((k, len(v)) for (k, v) in L.items() if len(v))
+        top = L.top_k(3)
+        self.assertEqual([n for (k, n) in top],
+                         sorted(sizes.values(), reverse=True)[:3])
+        self.assertTrue(all(sizes[k] == n for (k, n) in top))
+        self.assertEqual(sorted(L.keys_with_size(2, 3)),
+                         sorted(k for k in sizes if 2 <= sizes[k] <= 3))
+        self.assertEqual(sorted(L.keys_with_size(0)), sorted(sizes))
+        self.assertEqual(L.total_elements(), sum(sizes.values()))
+
+    def test0(self):
+        # without the index the queries scan DS
+        L = DictSet(s2d('a1 b12 c123 d1234 e0'))
+        self.check(L)
+        self.assertEqual(L.top_k(2), [('d', 4), ('c', 3)])
+        self.assertEqual(L.keys_with_size(4, 9), ['d'])
+
+    def test1(self):
+        # the index follows the mutating methods
+        L = DictSet(s2d('a1 b12 c123 d1234 e0'))
+        L.enable_size_index()
+        self.check(L)
+        L.add('a', '9')
+        L.update(s2d('e123456 f1'))
+        L.discard('d', '1')
+        L.difference_update(s2d('c123'))
+        L['g'] = '12'
+        L['b'].update('3456789') # rehashed when queried
+        self.check(L)
+        self.assertEqual(L.top_k(2), [('b', 9), ('e', 6)])
+        del L['e']
+        L.clear()
+        self.check(L)
+        self.assertEqual(L.top_k(5), [])
+        L.disable_size_index()
+        self.assertFalse(L._trackers)
+
+    def test2(self):
+        random.seed(3)
+        L = DictSet()
+        L.enable_size_index()
+        for i in range(2000):
+            (k, v) = (random.randrange(50), random.randrange(20))
+            if random.random() < 0.6:
+                L.add(k, v)
+            else:
+                L.discard(k, v)
+        self.check(L)
+
+    @unittest.skipIf(dictset._getrefcount is None, 'needs sys.getrefcount')
+    def test3(self):
+        # keys that were only read are clean again once their sets are
+        # no longer held, held sets are still followed
+        L = DictSet(s2d('a1 b12 c123'))
+        L.enable_size_index()
+        L.enable_fingerprint()
+        for k in 'abc':
+            L.get(k)
+            L[k]
+        s = L['b']
+        self.check(L)
+        self.assertEqual(L._size_index.dirty, set('b'))
+        L.fingerprint()
+        self.assertEqual(L._fingerprint.dirty, set('b'))
+
+        s.add('9')
+        self.check(L)
+        self.assertEqual(L.fingerprint(), DictSet(dict(L.items())).fingerprint())
+        del s
+        self.check(L)
+        L.fingerprint()
+        self.assertFalse(L._size_index.dirty)
+        self.assertFalse(L._fingerprint.dirty)
+
+    def test4(self):
+        # copies and sets handed out by items() and values() don't go
+        # around the index
+        L = DictSet(k=[1, 2])
+        L.enable_size_index()
+        M = L.copy()
+        M.add('k', 5)
+        self.assertEqual(L.total_elements(), 2)
+        for v in L.values():
+            v.add(3)
+        self.check(L)
+        for (k, v) in L.items():
+            v.update([7, 8])
+        self.check(L)
+        self.assertEqual(L.top_k(1), [('k', 5)])
+
+class TestDictSet_invert(unittest.TestCase):
+    def expected(self, L):
+        R = {}
+        for (k, v) in L.items():
+            for e in v:
+                R.setdefault(e, set()).add(k)
+        return R
+
+    def test0(self):
+        L = DictSet(s2d('a123 b23 c3 d0'))
+        M = L.invert()
+        self.assertTrue(isinstance(M, DictSet))
+        self.assertEqual(d2l(M), d2l(self.expected(L)))
+
+    def test1(self):
+        self.assertEqual(DictSet().invert(), DictSet())
+
+    def test2(self):
+        # the result is of the class of DS
+        L = CompactDictSet(s2d('a123 b23'))
+        M = L.invert()
+        self.assertTrue(isinstance(M, CompactDictSet))
+        self.assertTrue(isinstance(dict.__getitem__(M, '1'), tuple))
+        self.assertEqual(d2l(M), d2l(self.expected(L)))
+
+    def test3(self):
+        # partial inversions on a pool of processes
+        random.seed(4)
+        L = DictSet([(i, random.sample(range(50), 5)) for i in range(200)])
+        M = L.invert(processes=2, chunksize=50)
+        self.assertEqual(d2l(M), d2l(self.expected(L)))
+        self.assertEqual(M, L.invert())
+
+class TestDictSet_compose(unittest.TestCase):
+    def expected(self, L, M):
+        R = {}
+        for (k, v) in L.items():
+            for e in v:
+                R.setdefault(k, set()).update(M.get(e, ()))
+        return dict((k, v) for (k, v) in R.items() if v)
+
+    def test0(self):
+        # users -> groups -> permissions
+        L = DictSet(ann=['admin', 'dev'], bob=['dev'], cy=['guest'], dee=[])
+        M = DictSet(admin=['read', 'write', 'delete'], dev=['read', 'write'])
+        R = L.compose(M)
+        self.assertTrue(isinstance(R, DictSet))
+        self.assertEqual(d2l(R), d2l(self.expected(L, M)))
+        self.assertEqual(R['bob'], set(['read', 'write']))
+        self.assertFalse('cy' in R)
+
+    def test1(self):
+        # E can be a dict or a list of pairs
+        L = DictSet(s2d('a12 b3'))
+        self.assertEqual(d2l(L.compose({'1': 'xy', '3': ''})),
+                         [('a', ['x', 'y'])])
+        self.assertEqual(d2l(L.compose([('2', 'z')])), [('a', ['z'])])
+
+    def test2(self):
+        # keys sharing a frozenset share its union
+        L = InterningDictSet(a='12', b='21', c='3')
+        M = DictSet(s2d('x0'))
+        M.update({'1': 'p', '2': 'q', '3': 'r'})
+        R = L.compose(M)
+        self.assertEqual(d2l(R), d2l(self.expected(L, M)))
+
+    def test3(self):
+        random.seed(5)
+        L = DictSet([(i, random.sample(range(50), 4)) for i in range(300)])
+        M = DictSet([(i, random.sample(range(80), 3)) for i in range(50)])
+        R = L.compose(M, processes=2, chunksize=100)
+        self.assertEqual(d2l(R), d2l(self.expected(L, M)))
+        self.assertEqual(R, L.compose(M))
+
+    def test4(self):
+        # the keys sharing a union don't change together
+        L = DictSet(u1='ab', u2='ab')
+        L.dedupe()
+        R = L.compose({'a': [1], 'b': [2]})
+        R.add('u1', 99)
+        self.assertEqual(d2l(R), [('u1', [1, 2, 99]), ('u2', [1, 2])])
+
+class TestDictSet_similarity_join(unittest.TestCase):
+    def expected(self, L, M, threshold):
+        R = set()
+        for (a, v) in L.items():
+            for (b, w) in M.items():
+                if v and w:
+                    score = len(v & w) / float(len(v | w))
+                    if score >= threshold:
+                        R.add((a, b, score))
+        return R
+
+    def test0(self):
+        L = DictSet(s2d('a1234 b56 c0 d1'))
+        M = DictSet(s2d('x1235 y567 z9'))
+        R = L.similarity_join(M, 0.5)
+        self.assertEqual(sorted(R), [('a', 'x', 0.6), ('b', 'y', 2 / 3.)])
+        self.assertEqual(L.similarity_join(M, 1), [])
+        self.assertEqual(L.similarity_join({'e': '56'}, 1), [('b', 'e', 1.0)])
+
+    def test1(self):
+        L = DictSet(s2d('a1'))
+        self.assertRaises(ValueError, L.similarity_join, L, 0)
+        self.assertRaises(ValueError, L.similarity_join, L, 1.5)
+
+    def test2(self):
+        random.seed(7)
+        for i in range(20):
+            L = DictSet([(k, random.sample(range(15), random.randrange(7)))
+                         for k in range(30)])
+            M = DictSet([(k, random.sample(range(15), random.randrange(7)))
+                         for k in range(25)])
+            for t in (0.1, 0.25, 1 / 3., 0.5, 0.7, 0.75, 1.0):
+                self.assertEqual(set(L.similarity_join(M, t)),
+                                 self.expected(L, M, t))
+
+    def test3(self):
+        random.seed(8)
+        L = DictSet([(i, random.sample(range(40), 5)) for i in range(300)])
+        R = L.similarity_join(L, 0.4, processes=2, chunksize=100)
+        self.assertEqual(set(R), self.expected(L, L, 0.4))
+
+class TestDictSet_minhash(unittest.TestCase):
+    def test0(self):
+        L = DictSet()
+        L['a'] = range(1000)
+        L['b'] = list(range(200, 1000)) + list(range(5000, 5100))
+        L['c'] = range(2000, 3000)
+        L['d'] = range(1000)
+        self.assertEqual(L.minhash('a'), L.minhash('d'))
+        self.assertEqual(len(L.minhash('a')), 128)
+        self.assertEqual(L.minhash('e'), None)
+        self.assertAlmostEqual(L.estimate_jaccard('a', 'b'), 800 / 1100.,
+                               delta=0.15)
+        self.assertTrue(L.estimate_jaccard('a', 'c') < 0.1)
+        self.assertEqual(L.estimate_jaccard('a', 'e'), 0.0)
+        self.assertEqual(L.similar_keys('a'), set('bd'))
+        self.assertEqual(L.similar_keys('a', 0.9), set('d'))
+
+    def test1(self):
+        # between DictSets, with and without kept signatures
+        L = DictSet(a=range(100))
+        M = DictSet(x=range(100), y=range(50, 150))
+        self.assertEqual(L.estimate_jaccard('a', 'x', M), 1.0)
+        M.enable_minhash()
+        self.assertEqual(L.estimate_jaccard('a', 'x', M), 1.0)
+        self.assertAlmostEqual(L.estimate_jaccard('a', 'y', M), 1 / 3.,
+                               delta=0.15)
+        self.assertEqual(L.estimate_jaccard('a', 'x', {'x': range(100)}), 1.0)
+
+    def test2(self):
+        L = DictSet()
+        self.assertRaises(ValueError, L.enable_minhash, 128, 3)
+        self.assertFalse(L._trackers)
+
+    def test3(self):
+        # the signatures and the index follow the mutating methods
+        random.seed(9)
+        L = DictSet()
+        L.enable_minhash(num_perm=32, bands=8)
+        for i in range(1000):
+            (k, v) = (random.randrange(8), random.randrange(40))
+            if random.random() < 0.7:
+                L.add(k, v)
+            else:
+                L.discard(k, v)
+        L[0].add(99) # signed again when queried
+        L.update({1: [98], 9: [97]})
+        L.difference_update({2: range(20)})
+
+        M = DictSet(L)
+        M.enable_minhash(num_perm=32, bands=8)
+        for k in L:
+            self.assertEqual(L.minhash(k), M.minhash(k))
+            self.assertEqual(L.similar_keys(k), M.similar_keys(k))
+        L.clear()
+        self.assertEqual(L.similar_keys(0), set())
+        L.disable_minhash()
+        self.assertFalse(L._trackers)
+
+class TestDictSet_bloom(unittest.TestCase):
+    def test0(self):
+        L = DictSet(s2d('a123 b45'))
+        self.assertTrue(L.contains('a', '1'))
+        self.assertFalse(L.contains('a', '4'))
+        self.assertFalse(L.contains('z', '1'))
+        L.enable_bloom()
+        self.assertTrue(L.contains('a', '1'))
+        self.assertFalse(L.contains('a', '4'))
+        self.assertFalse(L.contains('z', '1'))
+        self.assertRaises(ValueError, L.enable_bloom, 0)
+        L.disable_bloom()
+        self.assertFalse(L._trackers)
+
+    def test1(self):
+        # misses are answered without reading the set
+        class Counting(DictSet):
+            reads = 0
+            def _peek(self, k):
+                Counting.reads += 1
+                return DictSet._peek(self, k)
+
+        random.seed(10)
+        L = Counting([(i, random.sample(range(1000), 50)) for i in range(20)])
+        L.enable_bloom(0.01)
+        Counting.reads = 0
+        misses = [(i, e) for i in range(20) for e in range(1000, 3000)]
+        self.assertFalse(any(L.contains(k, e) for (k, e) in misses))
+        self.assertTrue(Counting.reads < 0.05 * len(misses))
+
+    def test2(self):
+        # the filters follow the mutating methods
+        random.seed(11)
+        L = DictSet()
+        L.enable_bloom()
+        for i in range(2000):
+            (k, v) = (random.randrange(20), random.randrange(200))
+            if random.random() < 0.7:
+                L.add(k, v)
+            else:
+                L.discard(k, v)
+        L[3].add(-1) # handed out, not filtered
+        L.update({4: range(300, 400)})
+        L.rebuild_bloom()
+        for k in range(21):
+            for v in range(-1, 400):
+                self.assertEqual(L.contains(k, v), v in L.get(k, ()))
+
+    def test3(self):
+        # the filters are pickled with DS, not made again from its sets
+        import pickle
+        L = DictSet([(i, range(i * 10, i * 10 + 30)) for i in range(10)])
+        L.enable_bloom()
+        L[2].add(-1)
+        data = pickle.dumps(L)
+        rebuild = dictset._BloomFilters.rebuild
+        def fail(self):
+            self.fail('rebuilt')
+        dictset._BloomFilters.rebuild = fail
+        try:
+            M = pickle.loads(data)
+        finally:
+            dictset._BloomFilters.rebuild = rebuild
+        self.assertEqual(M, L)
+        self.assertEqual(M._bloom.filters, L._bloom.filters)
+        self.assertFalse(M._bloom.touched)
+        self.assertTrue(M.contains(2, -1))
+        M.add(0, -2)
+        self.assertTrue(M.contains(0, -2))
+        self.assertFalse(L.contains(0, -2))
+
+    def test4(self):
+        # equal elements are never missed, whatever their type or repr
+        from decimal import Decimal
+        class P(object):
+            def __init__(self, x):
+                self.x = x
+            def __eq__(self, other):
+                return isinstance(other, P) and self.x == other.x
+            def __hash__(self):
+                return hash(self.x)
+
+        L = DictSet(a=[P(3), 1, 2.0])
+        L.enable_bloom()
+        self.assertTrue(L.contains('a', P(3)))
+        self.assertTrue(L.contains('a', Decimal(1)))
+        self.assertTrue(L.contains('a', 2))
+        self.assertEqual(L.contains_many([('a', P(3)), ('a', Decimal(1))]),
+                         [True, True])
+
+        # the strings, numbers and tuples of another process
+        import pickle
+        from datetime import date
+        L = DictSet(a=['x', u'y', b'z', 1.5, (1, 'x'), None],
+                    b=[date(2000, 1, 1), 2])
+        L.enable_bloom()
+        M = pickle.loads(pickle.dumps(L))
+        self.assertEqual(M._bloom.filters, L._bloom.filters)
+        for e in [u'x', 'y', b'z', Decimal('1.5'), (1.0, u'x'), None, 1.5]:
+            self.assertTrue(M.contains('a', e))
+        self.assertTrue(M.contains('b', date(2000, 1, 1)))
+        self.assertTrue(M.contains('b', 2))
+        self.assertFalse(M.contains('a', 'q'))
+
+    def test5(self):
+        # sets reached through copies and items() are never missed
+        L = DictSet(s2d('a12 b3'))
+        L.enable_bloom()
+        M = L.copy()
+        M.add('a', '9')
+        self.assertFalse(L.contains('a', '9'))
+        self.assertTrue(M.contains('a', '9'))
+        for (k, v) in L.items():
+            v.add('8')
+        for k in 'ab':
+            self.assertTrue(L.contains(k, '8'))
+        for v in L.values():
+            v.add('7')
+        self.assertTrue(L.contains('b', '7'))
+
+class TestDictSet_closure(unittest.TestCase):
+    def expected(self, L, k):
+        seen = set()
+        stack = list(L.get(k, ()))
+        while stack:
+            x = stack.pop()
+            if x not in seen:
+                seen.add(x)
+                stack.extend(L.get(x, ()))
+        return seen
+
+    def nodes(self, L):
+        return set(L) | set(e for v in L.values() for e in v)
+
+    def check(self, L):
+        R = L.transitive_closure()
+        for k in self.nodes(L):
+            self.assertEqual(L.reachable_from(k), self.expected(L, k))
+            self.assertEqual(set(R.get(k, ())), self.expected(L, k))
+
+    def test0(self):
+        # a -> b -> c, with the cycle d -> e -> d and the self loop f
+        L = DictSet(a='b', b='c', d='e', e='d', f='f')
+        R = L.transitive_closure()
+        self.assertTrue(isinstance(R, DictSet))
+        self.assertEqual(d2l(R), [('a', ['b', 'c']), ('b', ['c']),
+                                  ('d', ['d', 'e']), ('e', ['d', 'e']),
+                                  ('f', ['f'])])
+        self.assertEqual(L.reachable_from('a'), set('bc'))
+        self.assertEqual(L.reachable_from('c'), set())
+        self.assertEqual(L.reachable_from('z'), set())
+        self.check(L)
+
+    def test1(self):
+        # the nodes of a cycle share their set until it is changed
+        R = DictSet(a='b', b='c', c='a').transitive_closure()
+        R.add('a', 'x')
+        self.assertEqual(R['a'], set('abcx'))
+        self.assertEqual(R['b'], set('abc'))
+
+    def test2(self):
+        random.seed(4)
+        for i in range(20):
+            L = DictSet([(k, random.sample(range(40), random.randrange(3)))
+                         for k in range(30)])
+            self.check(L)
+
+    def test3(self):
+        # the bitsets follow the mutating methods
+        L = DictSet(a='b', b='c', d='e')
+        L.enable_closure()
+        self.check(L)
+        L.add('c', 'd') # added incrementally
+        self.assertEqual(L.reachable_from('a'), set('bcde'))
+        L.update(e='a', x='y')
+        self.check(L)
+        L.discard('b', 'c') # recomputed
+        self.check(L)
+        L['x'].add('a') # recomputed
+        self.check(L)
+        L.clear()
+        self.check(L)
+        L.disable_closure()
+        self.assertFalse(L._trackers)
+
+    def test4(self):
+        random.seed(6)
+        L = DictSet()
+        L.enable_closure()
+        for i in range(300):
+            (k, v) = (random.randrange(30), random.randrange(30))
+            if random.random() < 0.8:
+                L.add(k, v)
+            else:
+                L.discard(k, v)
+            if i % 20 == 0:
+                self.check(L)
+        self.check(L)
+
 class TestDictSet__contains__(unittest.TestCase):
     def test0(self):
         L = DictSet(s2d('a1 c5666788'))
@@ -1550,17 +2725,433 @@ class TestDictSet_unique_combinations(unittest.TestCase):
         '181718181827182818371838251725182527252825372538'
         '261726182627262826372638281728182827282828372838')
         
+class TestCompactDictSet(unittest.TestCase):
+    def test0(self):
+        L = CompactDictSet(s2d('a1 b12 c567 d0'))
+        self.assertEqual(dict.__getitem__(L,'a'), ('1',))
+        self.assertEqual(sorted(dict.__getitem__(L,'b')), ['1','2'])
+        self.assertEqual(dict.__getitem__(L,'c'), set('567'))
+        self.assertEqual(dict.__getitem__(L,'d'), ())
+        self.assertEqual(d2l(L), s2l('a1 b12 c567 d0'))
+
+    def test1(self):
+        L = CompactDictSet(s2d('a1 b12'))
+        L.add('a','2')
+        self.assertTrue(isinstance(dict.__getitem__(L,'a'), tuple))
+        L.add('a','3')
+        self.assertEqual(dict.__getitem__(L,'a'), set('123'))
+        L.discard('b','1')
+        self.assertEqual(dict.__getitem__(L,'b'), ('2',))
+        self.assertEqual(d2l(L), s2l('a123 b2'))
+
+    def test2(self):
+        # DS[k] always hands out the live set
+        L = CompactDictSet(s2d('a1'))
+        L['a'].add('2')
+        self.assertEqual(L['a'], set('12'))
+        self.assertEqual(L.get('a'), set('12'))
+        L.compact()
+        self.assertEqual(sorted(dict.__getitem__(L,'a')), ['1','2'])
+
+    def test3(self):
+        L = CompactDictSet(s2d('a1 b12 c567'))
+        M =                s2d('a2 b3  c5 d4')
+        R = DictSet(L)|M
+
+        self.assertTrue(isinstance(L|M, CompactDictSet))
+        self.assertEqual(d2l(L|M), d2l(R))
+        self.assertEqual(d2l(L&M), d2l(DictSet(L)&M))
+        self.assertEqual(d2l(L-M), d2l(DictSet(L)-M))
+        self.assertEqual(d2l(L^M), d2l(DictSet(L)^M))
+        self.assertTrue(L|M == R)
+        self.assertTrue(L <= R)
+        self.assertTrue(R >= L)
+
+    def test4(self):
+        L = CompactDictSet(s2d('a1 b12 c567'))
+        L.difference_update(s2d('b1 c56'))
+        self.assertEqual(dict.__getitem__(L,'b'), ('2',))
+        self.assertEqual(dict.__getitem__(L,'c'), set('7')) # until compact
+        L.intersection_update(s2d('a1'))
+        self.assertEqual(d2l(L), s2l('a1'))
+
+    def test5(self):
+        L = CompactDictSet(s2d('a1 b12'))
+        self.assertEqual(repr(L), "CompactDictSet(%r)" %
+                         [(k, set(v)) for (k, v) in L.items()])
+        self.assertEqual(list(L.unique_combinations()),
+                         [['1','1'], ['1','2']])
+
+    def test6(self):
+        L = CompactDictSet.fromkeys(['a','b'], '1')
+        self.assertEqual(dict.__getitem__(L,'a'), ('1',))
+        self.assertTrue(L.memory_usage()['sets'] <
+                        DictSet(L).memory_usage()['sets'])
+
+    def test7(self):
+        # get_many doesn't switch inline keys to sets
+        L = CompactDictSet(s2d('a1 b12 c567'))
+        self.assertEqual(L.get_many('abd'),
+                         [frozenset('1'), frozenset('12'), None])
+        self.assertTrue(isinstance(dict.__getitem__(L,'a'), tuple))
+
+    @unittest.skipIf(dictset._getrefcount is None, 'needs sys.getrefcount')
+    def test8(self):
+        # reading every key doesn't undo the inline storage for good
+        L = CompactDictSet([(i, [i]) for i in range(1000)])
+        usage = L.memory_usage()['total']
+        held = L[0]
+        for k in range(1000):
+            L.get(k)
+        self.assertTrue(L.memory_usage()['total'] < 1.5 * usage)
+        self.assertTrue(dict.__getitem__(L, 0) is held)
+        held.add(-1)
+        self.assertEqual(L[0], set([0, -1]))
+
+class TestInterningDictSet(unittest.TestCase):
+    def test0(self):
+        L = InterningDictSet(s2d('a12 b21 c3'))
+        self.assertTrue(dict.__getitem__(L,'a') is dict.__getitem__(L,'b'))
+        self.assertTrue(isinstance(dict.__getitem__(L,'a'), frozenset))
+        self.assertEqual(d2l(L), s2l('a12 b12 c3'))
+
+    def test1(self):
+        # mutating a key copies its set
+        L = InterningDictSet(s2d('a12 b21'))
+        L.add('a','3')
+        self.assertEqual(L['a'], set('123'))
+        self.assertEqual(L['b'], frozenset('12'))
+        self.assertTrue(isinstance(dict.__getitem__(L,'a'), set))
+
+    def test2(self):
+        # no-op updates keep the key shared
+        L = InterningDictSet(s2d('a12 b21'))
+        L.update(s2d('a1'))
+        L.discard('b','3')
+        self.assertTrue(dict.__getitem__(L,'a') is dict.__getitem__(L,'b'))
+
+    def test3(self):
+        L = InterningDictSet(s2d('a12 b21'))
+        L.add('a','3')
+        L.discard('a','3')
+        self.assertFalse(dict.__getitem__(L,'a') is dict.__getitem__(L,'b'))
+        R = L.dedupe()
+        self.assertTrue(dict.__getitem__(L,'a') is dict.__getitem__(L,'b'))
+        self.assertEqual(R['n_shared_keys'], 2)
+        self.assertEqual(R['bytes_saved'],
+                         sys.getsizeof(dict.__getitem__(L,'a')))
+
+    def test4(self):
+        L = InterningDictSet(s2d('a12 c3'))
+        M = L|s2d('b12')
+        self.assertTrue(isinstance(M, InterningDictSet))
+        self.assertTrue(dict.__getitem__(M,'a') is dict.__getitem__(M,'b'))
+        M['d'] = set('21')
+        self.assertTrue(dict.__getitem__(M,'a') is dict.__getitem__(M,'d'))
+
+    def test5(self):
+        # DS[k], get and setdefault hand out sets that copy on write
+        L = InterningDictSet(s2d('a12 b21'))
+        L['a'].add('3')
+        L.setdefault('b', []).add('4')
+        L.get('b').add('5')
+        self.assertEqual(d2l(L), s2l('a123 b1245'))
+        L.setdefault('c', []).add('6')
+        self.assertEqual(d2l(L), s2l('a123 b1245 c6'))
+        self.assertEqual(L.get_many('a'), [frozenset('123')])
+
+    @unittest.skipIf(dictset._getrefcount is None, 'needs sys.getrefcount')
+    def test6(self):
+        # keys unshared by reading are interned again once released
+        L = InterningDictSet([(i, '12') for i in range(200)])
+        for k in range(200):
+            L.get(k)
+        pooled = L._intern(set('12'))
+        shared = [k for k in range(200) if dict.__getitem__(L, k) is pooled]
+        self.assertTrue(len(shared) > 100)
+
+class TestDictSet_dedupe(unittest.TestCase):
+    def test0(self):
+        L = DictSet(s2d('a12 b21 c3 d0 e0'))
+        R = L.dedupe()
+        self.assertEqual(R['n_keys'], 5)
+        self.assertEqual(R['n_sets'], 3)
+        self.assertEqual(R['n_shared_sets'], 2)
+        self.assertEqual(R['n_shared_keys'], 4)
+        self.assertEqual(d2l(L), s2l('a12 b12 c3 d0 e0'))
+
+    def test1(self):
+        # DS[k] hands out a private copy
+        L = DictSet(s2d('a12 b21'))
+        L.dedupe()
+        L['a'].add('3')
+        self.assertEqual(d2l(L), s2l('a123 b12'))
+        self.assertEqual(L.sharing_stats()['n_shared_keys'], 0)
+
+    def test2(self):
+        L = DictSet(s2d('a12 b21'))
+        L.dedupe()
+        L.difference_update(s2d('a1'))
+        L.update(s2d('b3'))
+        self.assertEqual(d2l(L), s2l('a2 b123'))
+
+    def test3(self):
+        L = DictSet.fromkeys(range(100))
+        R = L.dedupe()
+        self.assertEqual(R['bytes_saved'], 99*sys.getsizeof(frozenset()))
+        self.assertEqual(L.memory_usage()['n_empty_sets'], 1)
+
+class TestDictSet_memory_usage(unittest.TestCase):
+    def test0(self):
+        L = DictSet()
+        R = L.memory_usage()
+        self.assertEqual(R['total'], sys.getsizeof(L))
+        self.assertEqual(R['n_keys'], 0)
+
+    def test1(self):
+        L = DictSet.fromkeys(['a','b'])
+        R = L.memory_usage()
+        self.assertEqual(R['n_empty_sets'], 2)
+        self.assertEqual(R['empty_sets'], 2*sys.getsizeof(set()))
+        self.assertEqual(R['sets'], 0)
+        self.assertEqual(R['elements'], 0)
+
+    def test2(self):
+        # shared elements are only counted once
+        x = 10**30
+        L = DictSet([('a',[x]),('b',[x])])
+        R = L.memory_usage()
+        self.assertEqual(R['n_elements'], 1)
+        self.assertEqual(R['elements'], sys.getsizeof(x))
+        self.assertEqual(R['sets'], sys.getsizeof(L['a'])+
+                                    sys.getsizeof(L['b']))
+
+    def test3(self):
+        L = DictSet([('a',[(10**30, 10**31)])])
+        R = L.memory_usage()
+        self.assertEqual(R['n_elements'], 1)
+        self.assertEqual(R['elements'], sys.getsizeof((1,2)) +
+                                        2*sys.getsizeof(10**30))
+
+    def test4(self):
+        L = DictSet(s2d('a1 c5666788 d0'))
+        R = L.memory_usage(deep=False)
+        self.assertEqual(R['keys'], 0)
+        self.assertEqual(R['elements'], 0)
+        self.assertEqual(R['total'], R['table']+R['sets']+R['empty_sets'])
+
+    def test5(self):
+        L = DictSet([(i, [10**30+i]) for i in range(100)])
+        self.assertEqual(L.memory_usage(sample=100), L.memory_usage())
+
+        R = L.memory_usage(sample=10)
+        self.assertEqual(R['n_elements'], 100)
+        self.assertEqual(R['sets'], L.memory_usage()['sets'])
+
+    def test6(self):
+        # elements that are also keys are still elements, but the total
+        # counts them once
+        nodes = [10**30+i for i in range(100)]
+        L = DictSet([(nodes[i], [nodes[(i+1)%100]]) for i in range(100)])
+        R = L.memory_usage()
+        self.assertEqual(R['n_elements'], 100)
+        self.assertEqual(R['elements'], R['keys'])
+        self.assertEqual(R['total'], R['table']+R['sets']+R['keys'])
+        self.assertEqual(L.memory_usage(sample=100), R)
+
+class TestDictSet_instrumentation(unittest.TestCase):
+    def tearDown(self):
+        dictset.disable_instrumentation()
+
+    def test0(self):
+        union = DictSet.__dict__['union']
+        dictset.enable_instrumentation()
+        self.assertTrue(dictset.instrumentation_enabled())
+        self.assertFalse(DictSet.__dict__['union'] is union)
+
+        dictset.disable_instrumentation()
+        self.assertFalse(dictset.instrumentation_enabled())
+        self.assertTrue(DictSet.__dict__['union'] is union)
+
+    def test1(self):
+        L = DictSet(s2d('a1 c5666788'))
+        M = DictSet(s2d('a123 b324'))
+        dictset.enable_instrumentation()
+        L | M
+        L | s2d('a9') # only the outermost call is recorded
+        L.update(M)
+        stats = dictset.instrumentation_stats()
+
+        self.assertEqual(sorted(stats), ['__or__', 'update'])
+        self.assertEqual(stats['__or__']['calls'], 2)
+        self.assertEqual(stats['update']['calls'], 1)
+        self.assertEqual(stats['__or__']['keys'], {2: 2})
+        self.assertEqual(stats['__or__']['elements'], {8: 2})
+        self.assertEqual(stats['__or__']['other_keys'], {1: 1, 2: 1})
+        self.assertEqual(stats['__or__']['other_elements'], {1: 1, 8: 1})
+        self.assertTrue(stats['__or__']['seconds'] >= 0.)
+
+    def test_self_keyword(self):
+        # 'self' is an ordinary key for the instrumented methods too
+        dictset.enable_instrumentation()
+        L = DictSet(self='ab')
+        L.update(self='c')
+        self.assertEqual(d2l(L), [('self', ['a', 'b', 'c'])])
+
+    def test2(self):
+        L = DictSet(s2d('a1 c5666788'))
+        M = DictSet(s2d('a1'))
+        records = []
+        dictset.enable_instrumentation(sink=records.append)
+        L -= M
+
+        self.assertEqual([r['method'] for r in records], ['__isub__'])
+        self.assertEqual(records[0]['keys'], 2)
+        self.assertEqual(records[0]['other_elements'], 1)
+
+    def test3(self):
+        dictset.enable_instrumentation(methods=['update'])
+        L = DictSet(s2d('a1 c5666788'))
+        L.intersection_update(s2d('a1'))
+        dictset.reset_instrumentation()
+        L.update(s2d('a1'))
+
+        self.assertEqual(list(dictset.instrumentation_stats().keys()),
+                         ['update'])
+        self.assertEqual(dictset.disable_instrumentation()['update']['calls'],
+                         1)
+        self.assertEqual(dictset.instrumentation_stats(), {})
+
+# the wall clock exponents are only checked on request since they
+# flake on loaded machines, the allocation exponents always are
+COMPLEXITY_TIMING = bool(os.environ.get('DICTSET_COMPLEXITY_TIMING'))
+
+class TestDictSet_complexity(unittest.TestCase):
+    """fits the scaling exponents of bench__dictset.COMPLEXITY"""
+
+    def assertScales(self, name):
+        if not COMPLEXITY_TIMING and \
+           bench__dictset.peak_allocation(len, ((),)) is None:
+            self.skipTest('tracemalloc is not available')
+        failures = bench__dictset.check_complexity(
+            [name], timing=COMPLEXITY_TIMING)
+        if failures:
+            (name, expected, result) = failures[0]
+            self.fail('%s scales as n**%.2f (time) n**%s (allocations), '
+                      'expected n**%d' %
+                      (name, result['time_exponent'],
+                       result['alloc_exponent'], expected))
+
+    def test_union(self):
+        self.assertScales('union')
+
+    def test_intersection(self):
+        self.assertScales('intersection')
+
+    def test_difference(self):
+        self.assertScales('difference')
+
+    def test_symmetric_difference(self):
+        self.assertScales('symmetric_difference')
+
+    def test_update(self):
+        self.assertScales('update')
+
+    def test_intersection_update(self):
+        self.assertScales('intersection_update')
+
+    def test_difference_update(self):
+        self.assertScales('difference_update')
+
+    def test_symmetric_difference_update(self):
+        self.assertScales('symmetric_difference_update')
+
+    def test_difference_update_sparse(self):
+        self.assertScales('difference_update_sparse')
+
+    def test_symmetric_difference_update_sparse(self):
+        self.assertScales('symmetric_difference_update_sparse')
+
+    def test_intersection_update_keys(self):
+        self.assertScales('intersection_update_keys')
+
+    def test_eq(self):
+        self.assertScales('__eq__')
+
+    def test_ne(self):
+        self.assertScales('__ne__')
+
+    def test_issubset(self):
+        self.assertScales('issubset')
+
+    def test_issuperset(self):
+        self.assertScales('issuperset')
+
+    def test_isdisjoint(self):
+        self.assertScales('isdisjoint')
+
+    def test_init(self):
+        self.assertScales('__init__')
+
+    def test_copy(self):
+        self.assertScales('copy')
+
+    def test_iter(self):
+        self.assertScales('__iter__')
+
+    def test_repr(self):
+        self.assertScales('__repr__')
+
+    def test_fromkeys(self):
+        self.assertScales('fromkeys')
+
+    def test_invert(self):
+        self.assertScales('invert')
+
+    def test_compose(self):
+        self.assertScales('compose')
+
+    def test_transitive_closure(self):
+        self.assertScales('transitive_closure')
+
+    def test_contains(self):
+        self.assertScales('__contains__')
+
+    def test_get(self):
+        self.assertScales('get')
+
+    def test_get_many(self):
+        self.assertScales('get_many')
+
+    def test_has_keys(self):
+        self.assertScales('has_keys')
+
+    def test_setdefault(self):
+        self.assertScales('setdefault')
+
+    def test_add(self):
+        self.assertScales('add')
+
+    def test_discard(self):
+        self.assertScales('discard')
+
 def suite():
     return unittest.TestSuite((
             unittest.makeSuite(TestDictSet__init__),
             unittest.makeSuite(TestDictSet_remove),
             unittest.makeSuite(TestDictSet_discard),
+            unittest.makeSuite(TestDictSet_add_many),
+            unittest.makeSuite(TestDictSet_discard_many),
+            unittest.makeSuite(TestDictSet_remove_many),
             unittest.makeSuite(TestDictSet_clear),
             unittest.makeSuite(TestDictSet_add),
             unittest.makeSuite(TestDictSet_delitem),
             unittest.makeSuite(TestDictSet_get),
+            unittest.makeSuite(TestDictSet_get_many),
             unittest.makeSuite(TestDictSet_setdefault),
             unittest.makeSuite(TestDictSet_copy),
+            unittest.makeSuite(TestDictSet_view),
+            unittest.makeSuite(TestDictSet_keys),
             unittest.makeSuite(TestDictSet_fromkeys),
             unittest.makeSuite(TestDictSet__setitem__),
             unittest.makeSuite(TestDictSet_update),
@@ -1585,10 +3176,32 @@ def suite():
             unittest.makeSuite(TestDictSet__le__),
             unittest.makeSuite(TestDictSet_issuperset),
             unittest.makeSuite(TestDictSet__ge__),
+            unittest.makeSuite(TestDictSet__lt__),
+            unittest.makeSuite(TestDictSet__gt__),
+            unittest.makeSuite(TestDictSet_isdisjoint),
+            unittest.makeSuite(TestDictSet_comparison_short_circuit),
+            unittest.makeSuite(TestDictSet_fingerprint),
+            unittest.makeSuite(TestDictSet_digest),
+            unittest.makeSuite(TestDictSet_diff),
+            unittest.makeSuite(TestDictSet_subscribe),
+            unittest.makeSuite(TestDictSet_transaction),
+            unittest.makeSuite(TestDictSet_size_index),
+            unittest.makeSuite(TestDictSet_invert),
+            unittest.makeSuite(TestDictSet_compose),
+            unittest.makeSuite(TestDictSet_similarity_join),
+            unittest.makeSuite(TestDictSet_minhash),
+            unittest.makeSuite(TestDictSet_bloom),
+            unittest.makeSuite(TestDictSet_closure),
             unittest.makeSuite(TestDictSet__contains__),
             unittest.makeSuite(TestDictSet_unique_combinations),
             unittest.makeSuite(TestDictSet__repr__),
-            unittest.makeSuite(TestDictSet__iter__)
+            unittest.makeSuite(TestDictSet__iter__),
+            unittest.makeSuite(TestCompactDictSet),
+            unittest.makeSuite(TestInterningDictSet),
+            unittest.makeSuite(TestDictSet_dedupe),
+            unittest.makeSuite(TestDictSet_memory_usage),
+            unittest.makeSuite(TestDictSet_instrumentation),
+            unittest.makeSuite(TestDictSet_complexity)
                               ))
 
 if __name__ == "__main__":
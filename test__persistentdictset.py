@@ -0,0 +1,148 @@
+# Copyright (c) 2011, Roger Lew [see LICENSE.txt]
+# This software is funded in part by NIH Grant P20 RR016454.
+
+"""
+This unittest tests the persistentdictset module.
+"""
+
+import pickle
+import random
+import unittest
+
+from dictset import DictSet
+from persistentdictset import PersistentDictSet, PersistentSet
+
+from test__dictset import s2d, d2l, s2l
+
+class Colliding(object):
+    """an element whose hash is always the same"""
+    def __init__(self, v):
+        self.v = v
+    def __hash__(self):
+        return 7
+    def __eq__(self, other):
+        return isinstance(other, Colliding) and other.v == self.v
+    def __ne__(self, other):
+        return not self == other
+
+class TestPersistentSet(unittest.TestCase):
+    def test0(self):
+        S = PersistentSet('123')
+        T = S.add('4')
+        self.assertEqual(S, set('123'))
+        self.assertEqual(T, set('1234'))
+        self.assertTrue(S.add('1') is S)
+        self.assertTrue(S.discard('9') is S)
+
+    def test1(self):
+        # random adds and discards agree with set
+        random.seed(1)
+        S, R = PersistentSet(), set()
+        for i in range(5000):
+            x = random.randrange(1000)
+            if random.random() < 0.5:
+                S, R = S.add(x), R | set([x])
+            else:
+                S, R = S.discard(x), R - set([x])
+            self.assertEqual(len(S), len(R))
+        self.assertEqual(set(S), R)
+
+    def test2(self):
+        # elements with equal hashes
+        S = PersistentSet(Colliding(i) for i in range(10))
+        self.assertEqual(len(S), 10)
+        self.assertTrue(Colliding(3) in S)
+        T = S.discard(Colliding(3)).discard(Colliding(4))
+        self.assertEqual(len(T), 8)
+        self.assertFalse(Colliding(3) in T)
+        self.assertEqual(len(S), 10)
+
+    def test3(self):
+        S = PersistentSet('1234')
+        self.assertEqual(S | set('5'), set('12345'))
+        self.assertEqual(S & set('459'), set('4'))
+        self.assertEqual(S - set('12'), set('34'))
+        self.assertEqual(S ^ set('459'), set('12359'))
+        self.assertTrue(isinstance(S - set('12'), PersistentSet))
+        self.assertRaises(KeyError, S.remove, '9')
+        self.assertEqual(hash(S), hash(PersistentSet('4321')))
+        self.assertEqual(pickle.loads(pickle.dumps(S)), S)
+
+class TestPersistentDictSet(unittest.TestCase):
+    def test0(self):
+        L = PersistentDictSet(s2d('a123 b45 c0'))
+        self.assertEqual(d2l(L), s2l('a123 b45'))
+        self.assertEqual(len(L), 2)
+        self.assertTrue('a' in L)
+        self.assertFalse('c' in L)
+        self.assertFalse([] in L)
+        self.assertEqual(PersistentDictSet(a='1', b=[2]),
+                         {'a': set('1'), 'b': set([2])})
+
+    def test1(self):
+        # every change returns a new version and leaves the old one alone
+        L = PersistentDictSet(s2d('a123 b45'))
+        M = L.add('a', '9')
+        N = M.discard('b', '4').remove('a', '1').set('c', '7')
+        O = N.discard('c')
+        self.assertEqual(d2l(L), s2l('a123 b45'))
+        self.assertEqual(d2l(M), s2l('a1239 b45'))
+        self.assertEqual(d2l(N), s2l('a239 b5 c7'))
+        self.assertEqual(d2l(O), s2l('a239 b5'))
+        self.assertRaises(KeyError, L.remove, 'a', '9')
+        self.assertRaises(KeyError, L.remove, 'z')
+
+    def test2(self):
+        # unchanged keys are shared between versions
+        L = PersistentDictSet([(i, [i]) for i in range(1000)])
+        M = L.add(5, 'x')
+        for i in range(1000):
+            if i != 5:
+                self.assertTrue(M[i] is L[i])
+        self.assertTrue(L.add(5, 5) is L)
+
+    def test3(self):
+        L = PersistentDictSet(s2d('a123 b45 c6'))
+        M = s2d('a34 b5 d7')
+        self.assertEqual(d2l(L | M), d2l(DictSet(s2d('a123 b45 c6')) | M))
+        self.assertEqual(d2l(L & M), d2l(DictSet(s2d('a123 b45 c6')) & M))
+        self.assertEqual(d2l(L - M), d2l(DictSet(s2d('a123 b45 c6')) - M))
+        self.assertEqual(d2l(L ^ M), d2l(DictSet(s2d('a123 b45 c6')) ^ M))
+        self.assertEqual(d2l(L.update(M, e='8')),
+                         d2l(DictSet(s2d('a12334 b45 c6 d7 e8'))))
+
+    def test4(self):
+        L = PersistentDictSet(s2d('a123 b45'))
+        self.assertTrue(L == DictSet(s2d('a123 b45 c0')))
+        self.assertTrue(L == s2d('b45 a321'))
+        self.assertTrue(L != s2d('a123'))
+        self.assertFalse(L == 42)
+        self.assertEqual(L.to_dictset(), DictSet(s2d('a123 b45')))
+        self.assertEqual(pickle.loads(pickle.dumps(L)), L)
+
+    def test5(self):
+        # random versions agree with DictSet
+        random.seed(2)
+        L, R = PersistentDictSet(), DictSet()
+        for i in range(3000):
+            (k, v) = (random.randrange(200), random.randrange(5))
+            if random.random() < 0.6:
+                L = L.add(k, v)
+                R.add(k, v)
+            else:
+                L = L.discard(k, v)
+                R.discard(k, v)
+        self.assertEqual(L, R)
+        self.assertEqual(len(L), len([k for k in R]))
+
+def suite():
+    return unittest.TestSuite((
+            unittest.makeSuite(TestPersistentSet),
+            unittest.makeSuite(TestPersistentDictSet)
+                              ))
+
+if __name__ == "__main__":
+
+    # run tests
+    runner = unittest.TextTestRunner()
+    runner.run(suite())
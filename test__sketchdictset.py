@@ -0,0 +1,100 @@
+# Copyright (c) 2011, Roger Lew [see LICENSE.txt]
+# This software is funded in part by NIH Grant P20 RR016454.
+
+"""
+This unittest tests the sketchdictset module.
+"""
+
+import pickle
+import unittest
+
+from sketchdictset import SketchDictSet, HyperLogLog
+
+class TestHyperLogLog(unittest.TestCase):
+    def assertClose(self, S, n, error=0.05):
+        self.assertTrue(abs(len(S) - n) <= error * n + 1, (len(S), n))
+
+    def test0(self):
+        S = HyperLogLog()
+        self.assertEqual(len(S), 0)
+        S.update('abc', 'cde')
+        S.add('a')
+        self.assertEqual(len(S), 5)
+        self.assertEqual(len(S.copy()), 5)
+        self.assertRaises(ValueError, HyperLogLog, (), 3)
+        self.assertRaises(ValueError, HyperLogLog, (), 17)
+
+    def test1(self):
+        for n in (100, 1000, 20000):
+            self.assertClose(HyperLogLog(range(n)), n)
+        # the memory doesn't grow with the elements
+        self.assertEqual(len(HyperLogLog(range(20000))._registers), 4096)
+
+    def test2(self):
+        S = HyperLogLog(range(10000))
+        T = HyperLogLog(range(5000, 15000))
+        self.assertClose(S | T, 15000)
+        self.assertEqual(S | T, T | S)
+        self.assertClose(S, 10000)
+        S |= T
+        self.assertClose(S, 15000)
+        self.assertRaises(ValueError, S.merge, HyperLogLog((), 10))
+        self.assertRaises(TypeError, S.merge, set([1]))
+
+    def test3(self):
+        S = HyperLogLog(range(1000), 8)
+        T = pickle.loads(pickle.dumps(S))
+        self.assertEqual(T, S)
+        self.assertEqual(T.precision, 8)
+        self.assertEqual(len(T), len(S))
+
+class TestSketchDictSet(unittest.TestCase):
+    def test0(self):
+        L = SketchDictSet({'a': '123', 'b': '45'})
+        L.add('a', '4')
+        L.add('c')
+        L.update([('b', '456')], d='7')
+        self.assertEqual(L.counts(), {'a': 4, 'b': 3, 'c': 0, 'd': 1})
+        self.assertTrue(isinstance(L['a'], HyperLogLog))
+        self.assertEqual(len(L), 4)
+        self.assertTrue('c' in L)
+        del L['c']
+        self.assertFalse('c' in L)
+        L['e'] = '89'
+        self.assertEqual(len(L['e']), 2)
+
+    def test1(self):
+        pairs = [(i % 3, i) for i in range(30000)]
+        L = SketchDictSet.from_pairs(iter(pairs), precision=10)
+        for k in range(3):
+            self.assertTrue(abs(len(L[k]) - 10000) < 1000)
+        self.assertEqual(L[0].precision, 10)
+
+    def test2(self):
+        # sketches are merged by union and update
+        L = SketchDictSet({'a': range(100), 'b': range(10)})
+        M = SketchDictSet({'a': range(50, 150), 'c': range(5)})
+        N = L | M
+        self.assertEqual(N, {'a': HyperLogLog(range(150)),
+                             'b': HyperLogLog(range(10)),
+                             'c': HyperLogLog(range(5))})
+        self.assertEqual(L['a'], HyperLogLog(range(100)))
+        L |= M
+        self.assertEqual(L, N)
+        self.assertRaises(ValueError, L.__setitem__, 'x', HyperLogLog((), 8))
+
+    def test3(self):
+        L = SketchDictSet({'a': range(100)}, 8)
+        self.assertEqual(pickle.loads(pickle.dumps(L)), L)
+
+def suite():
+    return unittest.TestSuite((
+            unittest.makeSuite(TestHyperLogLog),
+            unittest.makeSuite(TestSketchDictSet)
+                              ))
+
+if __name__ == "__main__":
+
+    # run tests
+    runner = unittest.TextTestRunner()
+    runner.run(suite())